@@ -1,9 +1,13 @@
-import google.generativeai as genai
 from config import settings
+from model_registry import get_model
 import asyncio
+import contextvars
 from functools import wraps
-from typing import List, Dict
+from typing import List, Dict, Optional
 import json
+from summary_cache import summary_cache, summary_key
+from metrics import GEMINI_LATENCY, track
+from tracing import span
 
 
 def async_wrap(func):
@@ -11,20 +15,81 @@ def async_wrap(func):
     @wraps(func)
     async def run(*args, **kwargs):
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+        # Carry contextvars (the current trace span) into the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, lambda: context.run(func, *args, **kwargs))
     return run
 
 
+def _parse_json_response(text: str):
+    """Parse model output as JSON, tolerating markdown code fences"""
+    result = text.strip()
+    if result.startswith("```json"):
+        result = result[7:]
+    if result.startswith("```"):
+        result = result[3:]
+    if result.endswith("```"):
+        result = result[:-3]
+    return json.loads(result.strip())
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for batch packing"""
+    return len(text) // 4 + 1
+
+
+def _pack_batches(texts: List[str], batch_size: Optional[int] = None,
+                  token_budget: Optional[int] = None) -> List[List[int]]:
+    """Group item indices into batches bounded by item count and estimated input tokens"""
+    batch_size = batch_size or settings.AI_BATCH_SIZE
+    token_budget = token_budget or settings.AI_BATCH_TOKEN_BUDGET
+    
+    batches, current, used = [], [], 0
+    for i, text in enumerate(texts):
+        cost = _estimate_tokens(text)
+        if current and (len(current) >= batch_size or used + cost > token_budget):
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
 class AIService:
-    def __init__(self):
-        # Configure Gemini AI
-        genai.configure(api_key=settings.GEMINI_API_KEY)
+    # Bump when the summary prompt changes so cached summaries are not reused
+    SUMMARY_PROMPT_VERSION = 1
+    
+    def __init__(self, model=None):
         # Use gemini-pro which is stable and widely available
-        self.model = genai.GenerativeModel('gemini-pro')
+        self.model_name = 'gemini-pro'
+        # The SDK is configured and the model built once per process
+        self.model = model or get_model(self.model_name)
+    
+    def _generate(self, prompt: str, operation: str):
+        """Blocking Gemini call, timed per operation for /metrics and traces"""
+        with span(f"gemini.{operation}", model=self.model_name), \
+                track(GEMINI_LATENCY, service="ai", operation=operation):
+            return self.model.generate_content(prompt)
     
     @async_wrap
     def generate_summary(self, email_body: str) -> str:
-        """Generate AI summary of email content"""
+        """Generate AI summary of email content
+        
+        Summaries are cached by a hash of the truncated body, model and
+        prompt version, so the same email is only sent to the model once.
+        """
+        return self._summarize_one(email_body)
+    
+    def _summarize_one(self, email_body: str) -> str:
+        """Blocking single-email summary, shared by the per-email and batched paths"""
+        email_body = email_body or ''
+        key = summary_key(email_body[:1000], self.model_name, self.SUMMARY_PROMPT_VERSION)
+        cached = summary_cache.get(key)
+        if cached is not None:
+            return cached
+        
         try:
             prompt = f"""
 Summarize the following email in 2-3 concise sentences. Focus on the main point and any action items.
@@ -34,15 +99,123 @@ Email content:
 
 Summary:"""
             
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            response = self._generate(prompt, "summary")
+            summary = response.text.strip()
+            summary_cache.set(key, summary)
+            return summary
         except Exception as e:
             # Return a clean fallback instead of showing the error
-            return email_body[:200] + "..." if len(email_body) > 200 else email_body
+            return self.fallback_summary(email_body)
+    
+    @staticmethod
+    def fallback_summary(email_body: str) -> str:
+        """Truncated body used when the model can't produce a summary"""
+        email_body = email_body or ''
+        return email_body[:200] + "..." if len(email_body) > 200 else email_body
+    
+    @async_wrap
+    def generate_summaries(self, email_bodies: List[str]) -> List[str]:
+        """Summarize several emails with as few model calls as possible
+        
+        Cached summaries are reused; the rest are packed into batched prompts
+        (at most AI_BATCH_SIZE emails and AI_BATCH_TOKEN_BUDGET input tokens
+        each) that ask for a JSON array back. Any email missing from or
+        unparseable in a batch response is summarized on its own.
+        """
+        email_bodies = [body or '' for body in email_bodies]
+        summaries: List[Optional[str]] = [None] * len(email_bodies)
+        keys = [summary_key(body[:1000], self.model_name, self.SUMMARY_PROMPT_VERSION) for body in email_bodies]
+        
+        pending = []
+        for i, key in enumerate(keys):
+            summaries[i] = summary_cache.get(key)
+            if summaries[i] is None:
+                pending.append(i)
+        
+        for chunk in _pack_batches([email_bodies[i][:1000] for i in pending]):
+            indices = [pending[j] for j in chunk]
+            items = [{"id": n, "email": email_bodies[i][:1000]} for n, i in enumerate(indices)]
+            prompt = f"""
+Summarize each of the following emails in 2-3 concise sentences. Focus on the main point and any action items.
+
+Emails (JSON array):
+{json.dumps(items, ensure_ascii=False)}
+
+Return ONLY a valid JSON array with one object per email, in this structure:
+[{{"id": 0, "summary": "..."}}, {{"id": 1, "summary": "..."}}]
+"""
+            for n, summary in self._generate_batch(prompt, "summary", len(indices)).items():
+                summaries[indices[n]] = summary
+                summary_cache.set(keys[indices[n]], summary)
+        
+        # Per-email fallback for anything the batched calls didn't cover
+        return [
+            summary if summary is not None else self._summarize_one(body)
+            for summary, body in zip(summaries, email_bodies)
+        ]
+    
+    def _generate_batch(self, prompt: str, field: str, count: int) -> Dict[int, str]:
+        """Run one batched prompt and return {item id: text} for well-formed items"""
+        try:
+            response = self._generate(prompt, f"batch_{field}")
+            items = _parse_json_response(response.text)
+        except Exception as e:
+            print(f"Batched generation error: {str(e)}")
+            return {}
+        
+        results = {}
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            item_id, text = item.get("id"), item.get(field)
+            if isinstance(item_id, int) and 0 <= item_id < count and isinstance(text, str) and text.strip():
+                results[item_id] = text.strip()
+        return results
     
     @async_wrap
     def generate_reply(self, sender: str, subject: str, body: str, summary: str) -> str:
         """Generate AI-powered email reply"""
+        return self._reply_one(sender, subject, body, summary)
+    
+    @async_wrap
+    def generate_replies(self, emails: List[Dict]) -> List[str]:
+        """Generate replies for several emails using batched prompts
+        
+        Packs emails like generate_summaries and falls back to a single-email
+        prompt for any reply that is missing from the batch response.
+        """
+        replies: List[Optional[str]] = [None] * len(emails)
+        texts = [
+            f"From: {e.get('sender') or ''}\nSubject: {e.get('subject') or ''}\n"
+            f"Summary: {e.get('summary') or ''}\n\n{(e.get('body') or '')[:800]}"
+            for e in emails
+        ]
+        
+        for chunk in _pack_batches(texts):
+            items = [{"id": n, "email": texts[i]} for n, i in enumerate(chunk)]
+            prompt = f"""
+Generate a professional and context-aware reply for each of the following emails.
+Write clear, professional, and helpful replies. Keep each concise (2-4 short paragraphs).
+Do not include greetings like "Dear" or sign-offs - just the body of each reply.
+
+Emails (JSON array):
+{json.dumps(items, ensure_ascii=False)}
+
+Return ONLY a valid JSON array with one object per email, in this structure:
+[{{"id": 0, "reply": "..."}}, {{"id": 1, "reply": "..."}}]
+"""
+            for n, reply in self._generate_batch(prompt, "reply", len(chunk)).items():
+                replies[chunk[n]] = reply
+        
+        return [
+            reply if reply is not None else self._reply_one(
+                e.get("sender") or "", e.get("subject") or "", e.get("body") or "", e.get("summary") or ""
+            )
+            for reply, e in zip(replies, emails)
+        ]
+    
+    def _reply_one(self, sender: str, subject: str, body: str, summary: str) -> str:
+        """Blocking single-email reply, shared by the per-email and batched paths"""
         try:
             prompt = f"""
 Generate a professional and context-aware email reply based on the following email.
@@ -52,14 +225,14 @@ Subject: {subject}
 Summary: {summary}
 
 Original email:
-{body[:800]}
+{(body or '')[:800]}
 
 Write a clear, professional, and helpful reply. Keep it concise (2-4 short paragraphs).
 Do not include greetings like "Dear" or sign-offs - just the body of the reply.
 
 Reply:"""
             
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, "reply")
             return response.text.strip()
         except Exception as e:
             return f"Unable to generate reply: {str(e)}"
@@ -73,9 +246,9 @@ Reply:"""
             for i, email in enumerate(emails):
                 email_summaries.append({
                     "id": i,
-                    "sender": email.get("sender", "Unknown"),
-                    "subject": email.get("subject", "No Subject"),
-                    "snippet": email.get("snippet", "")[:200]
+                    "sender": email.get("sender") or "Unknown",
+                    "subject": email.get("subject") or "No Subject",
+                    "snippet": (email.get("snippet") or "")[:200]
                 })
             
             prompt = f"""
@@ -108,7 +281,7 @@ Return ONLY a valid JSON object with this structure:
 }}
 """
             
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, "categorize")
             result = response.text.strip()
             
             # Remove markdown code blocks
@@ -146,10 +319,10 @@ Return ONLY a valid JSON object with this structure:
             email_summaries = []
             for email in emails:
                 email_summaries.append({
-                    "sender": email.get("sender", "Unknown"),
-                    "subject": email.get("subject", "No Subject"),
-                    "date": email.get("date", ""),
-                    "summary": email.get("summary", email.get("snippet", ""))[:200]
+                    "sender": email.get("sender") or "Unknown",
+                    "subject": email.get("subject") or "No Subject",
+                    "date": email.get("date") or "",
+                    "summary": (email.get("summary") or email.get("snippet") or "")[:200]
                 })
             
             prompt = f"""
@@ -168,7 +341,7 @@ Keep it concise but informative.
 
 Daily Digest:"""
             
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, "daily_digest")
             return response.text.strip()
         except Exception as e:
             return f"Unable to generate digest: {str(e)}"
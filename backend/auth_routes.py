@@ -1,42 +1,53 @@
-from fastapi import APIRouter, HTTPException, Request, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header
 from fastapi.responses import RedirectResponse, JSONResponse
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from config import settings
-from models import Token, User, AuthResponse
-from auth_utils import create_access_token, verify_token, serialize_credentials
+from models import Token, User, AuthResponse, TokenData
+from auth_utils import create_access_token, verify_token, forget_token, serialize_credentials
 from database import db
+from session_store import session_store
+from oauth_state import oauth_states
+from inbox_sync import inbox_sync
 from datetime import datetime
 import secrets
 from typing import Optional
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
-# Store CSRF tokens temporarily (in production, use Redis or similar)
-# Format: {state: timestamp}
-csrf_tokens = {}
-
-def cleanup_old_tokens():
-    """Remove CSRF tokens older than 10 minutes"""
-    from datetime import timedelta
-    cutoff = datetime.utcnow() - timedelta(minutes=10)
-    expired = [state for state, timestamp in csrf_tokens.items() if timestamp < cutoff]
-    for state in expired:
-        del csrf_tokens[state]
-
-# Dependency to get current user from JWT token
-async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
-    """Extract user data from JWT token"""
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
     if not authorization or not authorization.startswith("Bearer "):
+        return None
+    return authorization.split(" ")[1]
+
+# Dependency to verify the JWT in the Authorization header
+async def get_token_data(authorization: Optional[str] = Header(None)) -> TokenData:
+    """Verified token claims; 401 when the header is missing, the token is invalid or its session is gone"""
+    token = _bearer_token(authorization)
+    if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    token = authorization.split(" ")[1]
     token_data = verify_token(token)
-    
     if not token_data:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
+    # Only the token issued with the user's current session is accepted:
+    # logout and later logins revoke earlier tokens
+    if not token_data.sub or not _is_session_token(token_data.sub, token):
+        raise HTTPException(status_code=401, detail="Session expired or logged out")
+    
+    return token_data
+
+def _is_session_token(user_id: str, token: str) -> bool:
+    """True if `token` is the JWT stored in the user's live session"""
+    session = session_store.get(user_id)
+    issued = (session or {}).get("access_token")
+    return bool(issued) and secrets.compare_digest(issued.encode(), token.encode())
+
+# Dependency to get current user from JWT token
+async def get_current_user(token_data: TokenData = Depends(get_token_data)) -> dict:
+    """Extract user data from JWT token"""
     return {
         "user_id": token_data.sub,
         "email": token_data.email,
@@ -70,9 +81,9 @@ async def google_login():
         print(f"DEBUG: GOOGLE_REDIRECT_URI = {settings.GOOGLE_REDIRECT_URI}")
         flow = create_oauth_flow()
         
-        # Generate CSRF token
+        # Generate CSRF token (valid for one callback, OAUTH_STATE_TTL seconds)
         state = secrets.token_urlsafe(32)
-        csrf_tokens[state] = datetime.utcnow()
+        oauth_states.issue(state)
         
         authorization_url, _ = flow.authorization_url(
             access_type='offline',
@@ -115,28 +126,13 @@ async def google_callback(code: str = None, state: str = None, error: str = None
                 url=f"{settings.FRONTEND_URL}/?error=missing_code&message=No authorization code received"
             )
         
-        # Clean up old tokens first
-        cleanup_old_tokens()
-        
-        # Verify CSRF token (check if it exists and is not too old)
-        if state not in csrf_tokens:
-            print(f"DEBUG: State '{state}' not found in csrf_tokens. Available tokens: {list(csrf_tokens.keys())}")
+        # Verify CSRF token: issued by us, not expired, not used before
+        if not state or not oauth_states.consume(state):
+            print(f"DEBUG: State '{state}' is unknown, expired or already used")
             return RedirectResponse(
                 url=f"{settings.FRONTEND_URL}/?error=invalid_state&message=Session expired. Please try logging in again."
             )
         
-        # Check token age (10 minutes max)
-        from datetime import timedelta
-        token_age = datetime.utcnow() - csrf_tokens[state]
-        if token_age > timedelta(minutes=10):
-            del csrf_tokens[state]
-            return RedirectResponse(
-                url=f"{settings.FRONTEND_URL}/?error=invalid_state&message=Session expired. Please try logging in again."
-            )
-        
-        # Remove used CSRF token
-        del csrf_tokens[state]
-        
         # Exchange code for tokens
         flow = create_oauth_flow()
         flow.fetch_token(code=code)
@@ -174,7 +170,7 @@ async def google_callback(code: str = None, state: str = None, error: str = None
         )
         
         # Save session
-        db.save_session(user_id, {
+        session_store.save(user_id, {
             "access_token": access_token,
             "created_at": datetime.utcnow().isoformat()
         })
@@ -197,24 +193,12 @@ async def google_callback(code: str = None, state: str = None, error: str = None
         )
 
 @router.get("/me")
-async def get_user_profile(request: Request):
+async def get_user_profile(token_data: TokenData = Depends(get_token_data)):
     """
     Get currently authenticated user
     Requires valid JWT token in Authorization header
     """
     try:
-        # Extract token from Authorization header
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        
-        token = auth_header.split(" ")[1]
-        
-        # Verify token
-        token_data = verify_token(token)
-        if not token_data:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-        
         # Get user from database
         user_data = db.get_user(token_data.sub)
         if not user_data:
@@ -235,21 +219,22 @@ async def get_user_profile(request: Request):
         raise HTTPException(status_code=500, detail=f"Failed to get user: {str(e)}")
 
 @router.post("/logout")
-async def logout(request: Request):
+async def logout(authorization: Optional[str] = Header(None)):
     """
     Logout current user
     Invalidates the session
     """
     try:
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
+        token = _bearer_token(authorization)
+        if not token:
             return AuthResponse(success=True, message="Already logged out")
         
-        token = auth_header.split(" ")[1]
         token_data = verify_token(token)
         
-        if token_data and token_data.sub:
-            db.delete_session(token_data.sub)
+        if token_data and token_data.sub and _is_session_token(token_data.sub, token):
+            session_store.delete(token_data.sub)
+            inbox_sync.invalidate(token_data.sub)
+        forget_token(token)
         
         return AuthResponse(success=True, message="Logged out successfully")
     
@@ -257,21 +242,11 @@ async def logout(request: Request):
         raise HTTPException(status_code=500, detail=f"Logout failed: {str(e)}")
 
 @router.get("/check-permissions")
-async def check_permissions(request: Request):
+async def check_permissions(token_data: TokenData = Depends(get_token_data)):
     """
     Check if user has granted all required Gmail permissions
     """
     try:
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        
-        token = auth_header.split(" ")[1]
-        token_data = verify_token(token)
-        
-        if not token_data:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
         # Get user's Google credentials
         google_creds_json = db.get_google_credentials(token_data.sub)
         if not google_creds_json:
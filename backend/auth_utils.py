@@ -1,13 +1,18 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from cache_utils import TTLCache
 from config import settings
 from models import TokenData
 import json
+import time
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Verified token -> TokenData; each entry expires with its token's exp claim
+_verified_tokens = TTLCache(maxsize=settings.JWT_CACHE_SIZE)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -21,7 +26,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str) -> Optional[TokenData]:
-    """Verify and decode JWT token"""
+    """Verify and decode JWT token
+
+    Tokens that verified before are served from an LRU until their exp,
+    so the HMAC check and claim parsing run once per token.
+    """
+    token_data = _verified_tokens.get(token)
+    if token_data is not None:
+        return token_data
+    
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("email")
@@ -31,10 +44,22 @@ def verify_token(token: str) -> Optional[TokenData]:
         if email is None:
             return None
         
-        return TokenData(email=email, sub=sub, access_token=access_token)
+        token_data = TokenData(email=email, sub=sub, access_token=access_token)
+        expires_in = payload["exp"] - time.time() if "exp" in payload else None
+        if expires_in is None or expires_in > 0:
+            _verified_tokens.set(token, token_data, ttl=expires_in)
+        return token_data
     except JWTError:
         return None
 
+def forget_token(token: str):
+    """Drop a token from the verified-token cache (e.g. on logout)"""
+    _verified_tokens.pop(token)
+
+def token_cache_stats() -> Dict:
+    """Hit rate and size of the verified-token cache"""
+    return _verified_tokens.stats()
+
 def serialize_credentials(credentials):
     """Serialize Google credentials to JSON string"""
     return json.dumps({
@@ -0,0 +1,80 @@
+"""
+Benchmark: auth-path latency of the JSON and SQLite user stores
+
+Seeds each store with N users, then times the calls the auth routes make:
+get_user (/auth/me), get_user_by_email and create_or_update_user (login). The SQLite store is seeded by its one-time import of
+the JSON file; "json-wb" is the JSON store with coalesced write-behind.
+
+    cd backend
+    python benchmarks/bench_database.py --users 100 1000 10000 30000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database, SQLiteDatabase
+
+
+def seed_json(path: str, count: int):
+    users = {
+        f"user{i}": {
+            "id": f"user{i}", "email": f"user{i}@example.com", "name": f"User {i}", "picture": None,
+            "google_credentials": json.dumps({"token": "x" * 200}),
+            "created_at": "2025-01-01T00:00:00", "last_login": "2025-01-01T00:00:00"
+        }
+        for i in range(count)
+    }
+    with open(path, "w") as f:
+        json.dump({"users": users}, f, indent=2)
+
+
+def median_us(fn, samples: int) -> float:
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000, 10000, 30000])
+    parser.add_argument("--samples", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'users':>7} {'store':>7} {'get_user us':>12} {'by_email us':>12} {'login us':>10}")
+    for count in args.users:
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, "users.json")
+            seed_json(json_path, count)
+            stores = {
+                "json": Database(json_path),
+                "sqlite": SQLiteDatabase(os.path.join(tmp, "users.db"), json_file=json_path),
+                "json-wb": Database(json_path, write_delay=1.0)
+            }
+            for name, store in stores.items():
+                def pick():
+                    return f"user{rng.randrange(count)}"
+
+                def login():
+                    user_id = pick()
+                    store.create_or_update_user(user_id, f"{user_id}@example.com", "Name", None, "creds")
+
+                get_user = median_us(lambda: store.get_user(pick()), args.samples)
+                by_email = median_us(lambda: store.get_user_by_email(f"{pick()}@example.com"), args.samples)
+                login_us = median_us(login, args.samples)
+                print(f"{count:>7} {name:>7} {get_user:>12.0f} {by_email:>12.0f} {login_us:>10.0f}")
+                store.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: categorization engines on batches of emails
+
+Times the keyword engine (one matcher scan per email) and the vectorized
+classifier (one featurize + matrix product per batch) over synthetic
+emails, and reports how often the two engines agree.
+
+    cd backend
+    python benchmarks/bench_email_classifier.py --sizes 100 1000 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from email_classifier import SEED_EMAILS, email_classifier
+from email_routes import _categorize_emails_by_keywords, _categorize_emails_by_classifier
+
+
+def make_emails(count: int, seed: int = 0) -> list:
+    """Shuffle words from the seed emails into new subjects and snippets"""
+    rng = random.Random(seed)
+    emails = []
+    for index in range(count):
+        subject, sender, snippet, _ = rng.choice(SEED_EMAILS)
+        words = snippet.split() + rng.choice(SEED_EMAILS)[2].split()
+        rng.shuffle(words)
+        emails.append({
+            "subject": subject,
+            "sender": sender.replace("@", f"{index}@"),
+            "snippet": " ".join(words[:20])
+        })
+    return emails
+
+
+def best_of(repeats: int, fn, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def labels(categorized: dict, emails: list) -> list:
+    owner = {id(email): name for name, bucket in categorized.items() for email in bucket["emails"]}
+    return [owner[id(email)] for email in emails]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    email_classifier.warm_up()
+    print(f"Model ready in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(f"{'emails':>8} {'keywords ms':>12} {'vector ms':>10} {'us/email':>9} {'agree':>6}")
+    for size in args.sizes:
+        emails = make_emails(size)
+        keyword_s, by_keywords = best_of(args.repeats, _categorize_emails_by_keywords, emails)
+        vector_s, by_vector = best_of(args.repeats, _categorize_emails_by_classifier, emails)
+        agree = sum(a == b for a, b in zip(labels(by_keywords, emails), labels(by_vector, emails))) / size
+        print(f"{size:>8} {keyword_s * 1000:>12.1f} {vector_s * 1000:>10.1f} "
+              f"{vector_s / size * 1e6:>9.1f} {agree:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
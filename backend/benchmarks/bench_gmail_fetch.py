@@ -0,0 +1,50 @@
+"""
+Benchmark: per-message vs batched message fetches in GmailService.get_recent_emails
+
+Runs against the local fake Gmail server with a fixed per-request latency
+and reports wall time and round trips as the page size grows.
+
+    cd backend
+    python benchmarks/bench_gmail_fetch.py --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.fake_gmail_server import FakeGmailServer
+from config import settings
+from gmail_service import GmailService
+
+
+async def run_once(server: FakeGmailServer, count: int, batch: bool):
+    service = GmailService("fake-token")
+    start_requests = server.state.request_count
+    start = time.perf_counter()
+    emails = await service.get_recent_emails(max_results=count, batch=batch)
+    elapsed = time.perf_counter() - start
+    assert len(emails) == count
+    return elapsed, server.state.request_count - start_requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.02, help="per-request server latency (s)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 20, 50, 100])
+    args = parser.parse_args()
+    
+    with FakeGmailServer(message_count=max(args.sizes), latency=args.latency) as server:
+        settings.GMAIL_API_ENDPOINT = server.url
+        print(f"{'N':>5} {'per-message':>12} {'trips':>6} {'batched':>10} {'trips':>6} {'speedup':>8}")
+        for count in args.sizes:
+            seq_time, seq_trips = asyncio.run(run_once(server, count, batch=False))
+            bat_time, bat_trips = asyncio.run(run_once(server, count, batch=True))
+            print(f"{count:>5} {seq_time * 1000:>10.1f}ms {seq_trips:>6} "
+                  f"{bat_time * 1000:>8.1f}ms {bat_trips:>6} {seq_time / bat_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: local intent classifier accuracy and latency
+
+Runs the tiered local parser over a held-out labeled command corpus (none of
+these phrasings are in the training set) and reports how many commands it
+answers locally, how accurate those answers are, and the latency of the
+local path. End-to-end p50 is estimated with a simulated LLM latency for
+the commands that still go to Gemini.
+
+    cd backend
+    python benchmarks/bench_intent_classifier.py --llm-latency 1.5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from intent_classifier import intent_classifier
+
+HELD_OUT = [
+    ("Show me my inbox", "read_emails"),
+    ("read the latest 3 emails", "read_emails"),
+    ("Fetch emails from Dave", "read_emails"),
+    ("display emails about the quarterly report", "read_emails"),
+    ("Can you check my email?", "read_emails"),
+    ("list messages from support@acme.com", "read_emails"),
+    ("any new emails today", "read_emails"),
+    ("get my last 20 messages", "read_emails"),
+    ("what's new in my inbox", "read_emails"),
+    ("open the recent mails", "read_emails"),
+    ("Draft replies to my last emails", "generate_replies"),
+    ("generate a response for each email", "generate_replies"),
+    ("write responses to these", "generate_replies"),
+    ("please suggest replies", "generate_replies"),
+    ("help me answer these emails", "generate_replies"),
+    ("Reply to Priya saying I'll join the call", "send_reply"),
+    ("send reply to email 3", "send_reply"),
+    ("respond to mark that the contract looks good", "send_reply"),
+    ("send the reply", "send_reply"),
+    ("write back to Tom with thanks for the update", "send_reply"),
+    ("Delete email 4", "delete_email"),
+    ("remove the email from Netflix", "delete_email"),
+    ("trash everything about the webinar", "delete_email"),
+    ("please delete the newsletter from medium", "delete_email"),
+    ("get rid of email 2", "delete_email"),
+    ("Categorise my emails", "categorize_inbox"),
+    ("sort my emails", "categorize_inbox"),
+    ("group my inbox by category", "categorize_inbox"),
+    ("organize my inbox please", "categorize_inbox"),
+    ("classify my inbox", "categorize_inbox"),
+    ("Give me my daily digest", "daily_digest"),
+    ("digest please", "daily_digest"),
+    ("summarize today's emails", "daily_digest"),
+    ("catch me up on my inbox", "daily_digest"),
+    ("brief me on today's mail", "daily_digest"),
+    ("what's the capital of France", "unknown"),
+    ("hi there", "unknown"),
+    ("tell me something funny", "unknown"),
+]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="simulated Gemini parse latency (s)")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    intent_classifier.warm_up()
+    print(f"training: {(time.perf_counter() - start) * 1000:.1f}ms (once per process)")
+
+    answered, correct, latencies, end_to_end = 0, 0, [], []
+    for command, label in HELD_OUT:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            parsed = intent_classifier.classify(command)
+        latency = (time.perf_counter() - start) / args.repeat
+        latencies.append(latency)
+
+        if parsed is None:
+            end_to_end.append(latency + args.llm_latency)
+            # Unknown commands are meant to fall through to the LLM
+            correct += label == "unknown"
+        else:
+            answered += 1
+            end_to_end.append(latency)
+            correct += parsed["action"] == label
+            if parsed["action"] != label:
+                print(f"  miss: {command!r} -> {parsed['action']} (expected {label})")
+
+    total = len(HELD_OUT)
+    print(f"commands:            {total}")
+    print(f"answered locally:    {answered} ({answered / total:.0%})")
+    print(f"routing accuracy:    {correct / total:.0%}")
+    print(f"local latency p50:   {percentile(latencies, 50) * 1e6:.1f}us  p99: {percentile(latencies, 99) * 1e6:.1f}us")
+    print(f"end-to-end p50:      {statistics.median(end_to_end) * 1000:.2f}ms "
+          f"(all-LLM baseline: {args.llm_latency * 1000:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: caller-side cost of a log call, direct vs queued handlers
+
+Times logger.info on the request thread with the original synchronous
+FileHandler + StreamHandler setup and with the queue handler that hands
+records to the batching listener thread.
+
+    cd backend
+    python benchmarks/bench_logging.py --records 20000
+"""
+import argparse
+import io
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from logger_service import (
+    LOG_FORMAT, BatchFileHandler, BatchStreamHandler, BatchingQueueListener, DroppingQueueHandler
+)
+
+
+def time_calls(logger: logging.Logger, records: int) -> float:
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info("Gmail API - %s: Success for %s", "list_messages", f"user{i}@example.com")
+    return (time.perf_counter() - start) / records * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    with tempfile.TemporaryDirectory() as tmp:
+        direct = logging.getLogger("bench.direct")
+        direct.propagate = False
+        for handler in (logging.FileHandler(os.path.join(tmp, "direct.log")), logging.StreamHandler(io.StringIO())):
+            handler.setFormatter(formatter)
+            direct.addHandler(handler)
+
+        handlers = [BatchFileHandler(os.path.join(tmp, "queued.log")), BatchStreamHandler(io.StringIO())]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        log_queue = queue.Queue(maxsize=args.queue_size)
+        queue_handler = DroppingQueueHandler(log_queue)
+        queued = logging.getLogger("bench.queued")
+        queued.propagate = False
+        queued.addHandler(queue_handler)
+        listener = BatchingQueueListener(log_queue, handlers, queue_handler)
+        listener.start()
+
+        direct_us = time_calls(direct, args.records)
+        queued_us = time_calls(queued, args.records)
+        start = time.perf_counter()
+        listener.stop()
+        drain_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{'handler':>8} {'us/call':>8}")
+        print(f"{'direct':>8} {direct_us:>8.2f}")
+        print(f"{'queued':>8} {queued_us:>8.2f}")
+        print(f"queued: {queue_handler.dropped} dropped, {drain_ms:.0f} ms to drain on stop")
+
+
+if __name__ == "__main__":
+    main()
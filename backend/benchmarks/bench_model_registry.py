@@ -0,0 +1,58 @@
+"""
+Benchmark: per-request Gemini client construction vs the shared model registry
+
+Measures what every route used to pay (genai.configure + GenerativeModel
+inside AIService()/NLPService(), plus rebuilding the SDK client that
+configure() throws away) against the registry lookup routes now do through
+FastAPI dependencies. No network calls are made, so the TLS handshake a
+fresh client costs on its first real call is not included.
+
+    cd backend
+    python benchmarks/bench_model_registry.py
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+import model_registry
+from config import settings
+
+
+def per_request_construction():
+    genai.configure(api_key=settings.GEMINI_API_KEY)
+    genai.GenerativeModel('gemini-pro')
+    genai_client.get_default_generative_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    # A placeholder key lets the SDK build its client without network access
+    settings.GEMINI_API_KEY = settings.GEMINI_API_KEY or "benchmark-placeholder-key"
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        per_request_construction()
+    old = (time.perf_counter() - start) / args.requests
+
+    model_registry.warm_up()
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        model_registry.get_ai_service()
+        model_registry.get_nlp_service()
+    new = (time.perf_counter() - start) / args.requests
+
+    print(f"per-request construction: {old * 1e6:9.1f}us")
+    print(f"registry lookup:          {new * 1e6:9.1f}us")
+    print(f"one-time costs (ms):      {model_registry.registry_stats()['construction_ms']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark: session save/get latency as the number of sessions grows
+
+Fills each store with N live sessions, then times save (which also sweeps
+expired entries) and get for random users. Compare with the JSON store,
+whose save_session rewrites the whole file.
+
+    cd backend
+    python benchmarks/bench_session_store.py --sessions 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+
+def median_us(fn, samples: int) -> float:
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--samples", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    session = {"access_token": "x" * 200, "created_at": "2025-01-01T00:00:00"}
+    print(f"{'sessions':>9} {'store':>7} {'save us':>8} {'get us':>7}")
+    for count in args.sessions:
+        with tempfile.TemporaryDirectory() as tmp:
+            stores = {
+                "memory": MemorySessionStore(ttl=86400),
+                "sqlite": SQLiteSessionStore(os.path.join(tmp, "sessions.db"), ttl=86400)
+            }
+            for name, store in stores.items():
+                for i in range(count):
+                    store.save(f"user{i}", session, ttl=rng.uniform(60, 86400))
+                save = median_us(lambda: store.save(f"user{rng.randrange(count)}", session), args.samples)
+                get = median_us(lambda: store.get(f"user{rng.randrange(count)}"), args.samples)
+                print(f"{count:>9} {name:>7} {save:>8.1f} {get:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
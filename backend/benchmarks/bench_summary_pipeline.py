@@ -0,0 +1,64 @@
+"""
+Benchmark: serial vs pipelined email summarization
+
+Uses a stub AI service whose generate_summary sleeps for a random model
+latency, and compares the old one-at-a-time loop with summarize_emails.
+
+    cd backend
+    python benchmarks/bench_summary_pipeline.py --emails 20 --latency 0.2 0.8
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from summary_pipeline import summarize_emails
+
+
+class StubAIService:
+    def __init__(self, latencies):
+        self.latencies = latencies
+
+    async def generate_summary(self, email_body: str) -> str:
+        await asyncio.sleep(self.latencies[email_body])
+        return f"summary of {email_body}"
+
+
+async def serial(ai_service, emails):
+    for email in emails:
+        email["summary"] = await ai_service.generate_summary(email["body"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--emails", type=int, default=20)
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.2, 0.8], metavar=("MIN", "MAX"))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 20])
+    args = parser.parse_args()
+
+    random.seed(0)
+    latencies = {f"email {i}": random.uniform(*args.latency) for i in range(args.emails)}
+    ai_service = StubAIService(latencies)
+
+    def fresh():
+        return [{"body": body} for body in latencies]
+
+    start = time.perf_counter()
+    asyncio.run(serial(ai_service, fresh()))
+    serial_time = time.perf_counter() - start
+
+    print(f"sum(latency) = {sum(latencies.values()):.2f}s  max(latency) = {max(latencies.values()):.2f}s")
+    print(f"{'serial loop':>18}: {serial_time:.2f}s")
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        asyncio.run(summarize_emails(ai_service, fresh(), concurrency=concurrency, timeout=60))
+        elapsed = time.perf_counter() - start
+        print(f"{f'pipeline (c={concurrency})':>18}: {elapsed:.2f}s  ({serial_time / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
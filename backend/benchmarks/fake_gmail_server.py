@@ -0,0 +1,226 @@
+"""
+Local Fake Gmail Server
+Serves the subset of the Gmail REST API used by GmailService, with a
+configurable per-request latency, so fetch strategies can be compared
+without touching the real API.
+"""
+import base64
+import json
+import re
+import threading
+import time
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+
+def make_message(index: int, history_id: int = 1) -> Dict:
+    """Build a synthetic Gmail message resource (higher index = older message)"""
+    message_id = f"msg{index:06d}"
+    body = f"Hello,\n\nThis is synthetic email number {index} about the project deadline.\n"
+    return {
+        "id": message_id,
+        "threadId": f"thread{index:06d}",
+        "labelIds": ["INBOX"],
+        "historyId": str(history_id),
+        "internalDate": str(1700000000000 - index * 1000),
+        "snippet": f"This is synthetic email number {index}",
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "From", "value": f"sender{index % 7}@example.com"},
+                {"name": "Subject", "value": f"Synthetic email {index}"},
+                {"name": "Date", "value": "Mon, 1 Jan 2024 12:00:00 +0000"},
+                {"name": "Message-ID", "value": f"<{message_id}@example.com>"}
+            ],
+            "body": {"data": base64.urlsafe_b64encode(body.encode()).decode()}
+        }
+    }
+
+
+class FakeGmailState:
+    """Mailbox contents and request counters shared by all handler threads"""
+    
+    def __init__(self, message_count: int = 100, latency: float = 0.0):
+        self.latency = latency
+        self.history_id = 1
+        self.history: List[Dict] = []
+        self.messages: List[Dict] = [make_message(i) for i in range(message_count)]
+        self.request_count = 0
+        self.batch_count = 0
+        self.lock = threading.Lock()
+    
+    def find(self, message_id: str) -> Optional[Dict]:
+        return next((m for m in self.messages if m["id"] == message_id), None)
+    
+    def _record(self, **change) -> int:
+        self.history_id += 1
+        self.history.append({"id": str(self.history_id), **change})
+        return self.history_id
+    
+    def add_message(self, index: int) -> Dict:
+        """Deliver a new message to the top of the inbox"""
+        message = make_message(index)
+        message["internalDate"] = str(1700000000000 + index * 1000)
+        ref = {"id": message["id"], "threadId": message["threadId"], "labelIds": ["INBOX"]}
+        message["historyId"] = str(self._record(messagesAdded=[{"message": ref}]))
+        self.messages.insert(0, message)
+        return message
+    
+    def trash_message(self, message_id: str) -> Optional[Dict]:
+        """Move a message from INBOX to TRASH, recording the label changes"""
+        message = self.find(message_id)
+        if message is None:
+            return None
+        message["labelIds"] = ["TRASH"]
+        ref = {"id": message_id, "threadId": message["threadId"], "labelIds": ["TRASH"]}
+        self._record(
+            labelsRemoved=[{"message": ref, "labelIds": ["INBOX"]}],
+            labelsAdded=[{"message": ref, "labelIds": ["TRASH"]}]
+        )
+        message["historyId"] = str(self.history_id)
+        return message
+    
+    def inbox(self) -> List[Dict]:
+        return [m for m in self.messages if "INBOX" in m["labelIds"]]
+
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    @property
+    def state(self) -> FakeGmailState:
+        return self.server.state
+    
+    def _count_round_trip(self):
+        with self.state.lock:
+            self.state.request_count += 1
+        if self.state.latency:
+            time.sleep(self.state.latency)
+    
+    def _send(self, status: int, payload, content_type: str = "application/json"):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+    
+    def dispatch(self, method: str, path: str, body: bytes):
+        """Route a single (possibly batched) API call; returns (status, payload)"""
+        parsed = urlparse(path)
+        query = parse_qs(parsed.query)
+        route = parsed.path
+        
+        if method == "GET" and route == "/gmail/v1/users/me/messages":
+            max_results = int(query.get("maxResults", ["100"])[0])
+            offset = int(query.get("pageToken", ["0"])[0])
+            inbox = self.state.inbox()
+            listed = [{"id": m["id"], "threadId": m["threadId"]} for m in inbox[offset:offset + max_results]]
+            response = {"messages": listed, "resultSizeEstimate": len(listed)}
+            if offset + max_results < len(inbox):
+                response["nextPageToken"] = str(offset + max_results)
+            return 200, response
+        
+        if method == "GET" and route == "/gmail/v1/users/me/profile":
+            return 200, {"emailAddress": "me@example.com", "messagesTotal": len(self.state.messages),
+                         "historyId": str(self.state.history_id)}
+        
+        if method == "GET" and route == "/gmail/v1/users/me/history":
+            start = int(query["startHistoryId"][0])
+            if start < 1:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            records = [h for h in self.state.history if int(h["id"]) > start]
+            return 200, {"history": records, "historyId": str(self.state.history_id)}
+        
+        if method == "POST" and route == "/gmail/v1/users/me/messages/send":
+            return 200, {"id": f"sent{self.state.request_count:06d}", "threadId": "thread-sent"}
+        
+        match = re.fullmatch(r"/gmail/v1/users/me/messages/([^/]+)(/trash)?", route)
+        if match:
+            message = self.state.find(match.group(1))
+            if message is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            if match.group(2) and method == "POST":
+                with self.state.lock:
+                    self.state.trash_message(message["id"])
+                return 200, {"id": message["id"], "labelIds": message["labelIds"]}
+            if query.get("format") == ["metadata"]:
+                wanted = set(query.get("metadataHeaders", []))
+                headers = [h for h in message["payload"]["headers"] if not wanted or h["name"] in wanted]
+                return 200, {**message, "payload": {"headers": headers}}
+            return 200, message
+        
+        return 404, {"error": {"code": 404, "message": f"Unknown route {route}"}}
+    
+    def _handle_batch(self, body: bytes):
+        with self.state.lock:
+            self.state.batch_count += 1
+        content_type = self.headers["Content-Type"]
+        mime = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n" + body.decode())
+        
+        boundary = "batch_fake_gmail_boundary"
+        out = []
+        for part in mime.get_payload():
+            request_text = part.get_payload()
+            request_line, _, rest = request_text.partition("\n")
+            method, path, _ = request_line.strip().split(" ")
+            inner_body = rest.split("\n\n", 1)[1].encode() if "\n\n" in rest else b""
+            status, payload = self.dispatch(method, path, inner_body)
+            content_id = part["Content-ID"].strip("<>")
+            out.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\n"
+                f"Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        self._send(200, "".join(out).encode(), f"multipart/mixed; boundary={boundary}")
+    
+    def do_GET(self):
+        self._count_round_trip()
+        status, payload = self.dispatch("GET", self.path, b"")
+        self._send(status, payload)
+    
+    def do_POST(self):
+        body = self._read_body()
+        self._count_round_trip()
+        if urlparse(self.path).path == "/batch/gmail/v1":
+            self._handle_batch(body)
+            return
+        status, payload = self.dispatch("POST", self.path, body)
+        self._send(status, payload)
+
+
+class FakeGmailServer:
+    """Run the fake server on a background thread: `with FakeGmailServer() as server: ...`"""
+    
+    def __init__(self, message_count: int = 100, latency: float = 0.0):
+        self.state = FakeGmailState(message_count, latency)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeGmailHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/"
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
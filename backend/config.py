@@ -14,13 +14,78 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "dev-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440
+    JWT_CACHE_SIZE: int = 4096  # verified tokens kept in memory
     
     # Environment
     ENVIRONMENT: str = "development"
     
+    # User/session store: "json" (users.json) or "sqlite" (indexed, WAL; imports users.json once)
+    DATABASE_BACKEND: str = "json"
+    SQLITE_DB_PATH: str = "users.db"
+    DATABASE_WRITE_DELAY: float = 0.0  # seconds to coalesce JSON writes; 0 writes through
+    
+    # Login sessions, expired after ACCESS_TOKEN_EXPIRE_MINUTES: "sqlite", "memory" or "redis"
+    SESSION_BACKEND: str = "sqlite"
+    SESSION_DB_PATH: str = "sessions.db"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    
+    # OAuth login CSRF states: "sqlite" (in SESSION_DB_PATH), "memory" or "redis"
+    OAUTH_STATE_BACKEND: str = "sqlite"
+    OAUTH_STATE_TTL: int = 600  # seconds to complete the Google consent screen
+    OAUTH_STATE_CAPACITY: int = 10000  # pending logins kept before the oldest are dropped
+    
+    # Gmail API (override to point at a local fake server in benchmarks/tests)
+    GMAIL_API_ENDPOINT: str = ""
+    GMAIL_MAX_CONNECTIONS: int = 20  # keep-alive pool size per worker
+    GMAIL_MAX_CONCURRENCY: int = 10  # in-flight Gmail requests per worker
+    GMAIL_TIMEOUT: float = 30.0  # seconds
+    
     # Gemini AI
     GEMINI_API_KEY: str = ""
     
+    # Batched prompts: emails per model call and estimated input tokens per call
+    AI_BATCH_SIZE: int = 8
+    AI_BATCH_TOKEN_BUDGET: int = 6000
+    
+    # Summarization pipeline
+    SUMMARY_CONCURRENCY: int = 8  # summaries in flight per request
+    SUMMARY_TIMEOUT: float = 20.0  # seconds per summary before falling back
+    SUMMARY_CACHE_SIZE: int = 2048  # in-memory entries
+    SUMMARY_CACHE_DB: str = ""  # SQLite file for the on-disk tier; empty disables it
+    SUMMARY_CACHE_MAX_BYTES: int = 50 * 1024 * 1024
+    
+    # Parsed natural-language commands shared across requests
+    PARSE_CACHE_SIZE: int = 1024
+    PARSE_CACHE_TTL: float = 3600.0  # seconds
+    
+    # Vectorized email classifier (.npz from `python email_classifier.py`); empty trains on seed emails
+    EMAIL_CLASSIFIER_MODEL: str = ""
+    
+    # Logging pipeline: records queue up and a background thread writes them in batches
+    LOG_QUEUE_SIZE: int = 10000  # records buffered before dropping
+    LOG_BATCH_SIZE: int = 256  # records written per flush
+    LOG_BLOCK_TIMEOUT: float = 0.05  # seconds WARNING+ records wait for queue space
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024  # app.log rotates at this size
+    LOG_BACKUP_COUNT: int = 5
+    
+    # Structured EventLogger events (NDJSON segments, gzipped on rotation); "" disables
+    EVENT_LOG_DIR: str = "logs/events"
+    EVENT_LOG_MAX_BYTES: int = 50 * 1024 * 1024
+    EVENT_LOG_MAX_AGE: float = 86400  # seconds before the active segment rotates
+    EVENT_LOG_MAX_SEGMENTS: int = 30  # rotated segments kept
+    
+    # Request tracing: recent traces kept for /debug/traces; NDJSON export dir ("" disables)
+    TRACE_BUFFER_SIZE: int = 200
+    TRACE_LOG_DIR: str = "logs/traces"
+    TRACE_QUEUE_SIZE: int = 1000  # finished traces buffered for the export thread before dropping
+    
+    # Statistical profiler: share of requests sampled (0 disables; X-Profile: 1 with the admin token always profiles)
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL: float = 0.005  # seconds between stack samples
+    
+    # Shared secret for /debug endpoints (X-Admin-Token header); empty disables them
+    ADMIN_TOKEN: str = ""
+    
     # Google OAuth Scopes
     GOOGLE_SCOPES: list = [
         "openid",
@@ -1,88 +1,205 @@
 import json
 import os
+import re
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
 from typing import Optional, Dict
 from datetime import datetime
 from models import User
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads within this process are serialized
+    fcntl = None
+
+_DELETED = object()
+_VERSION_HEAD = re.compile(rb'"version":\s*(\d+)')
+
 
 class Database:
-    def __init__(self, db_file: str = "users.json"):
+    """JSON-file store served from an in-memory copy
+
+    The parsed file is kept in memory with an email -> user id index, so
+    reads cost a stat() (to notice writes from other processes) instead of
+    a json.load. Writes go through to the file immediately, or, with
+    write_delay > 0, are coalesced and flushed by a timer and on shutdown.
+
+    Flushes are safe across worker processes: they hold an advisory lock on
+    `<db_file>.lock`, compare the file's version counter with the version
+    this copy was loaded from (re-reading and re-applying pending changes
+    when another process got there first), and replace the file atomically.
+    """
+
+    def __init__(self, db_file: str = "users.json", write_delay: float = 0.0):
         self.db_file = db_file
+        self.write_delay = write_delay
+        self._lock = threading.RLock()
+        self._data: Optional[dict] = None
+        self._email_index: Dict[str, str] = {}
+        self._signature = None
+        self._version = 0
+        self._pending: Dict[tuple, object] = {}  # (section, key) -> value or _DELETED, not yet on disk
+        self._timer: Optional[threading.Timer] = None
         self._ensure_db_exists()
     
     def _ensure_db_exists(self):
         """Ensure database file exists"""
-        if not os.path.exists(self.db_file):
-            with open(self.db_file, 'w') as f:
-                json.dump({"users": {}, "sessions": {}}, f)
+        with self._file_lock():
+            if not os.path.exists(self.db_file):
+                self._write_db({"users": {}})
+    
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock across threads and, where fcntl exists, processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.db_file}.lock", "a") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+    
+    def _file_signature(self, stat=None):
+        stat = stat or os.stat(self.db_file)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _disk_version(self) -> int:
+        """Version counter of the file on disk, read from its first bytes"""
+        with open(self.db_file, 'rb') as f:
+            match = _VERSION_HEAD.search(f.read(64))
+        return int(match.group(1)) if match else 0
     
     def _read_db(self) -> dict:
-        """Read database"""
-        with open(self.db_file, 'r') as f:
-            return json.load(f)
+        """Return the in-memory copy, reloading it if the file changed on disk
+
+        Changes not yet flushed are re-applied on top of a reloaded file.
+        """
+        if self._data is None or self._file_signature() != self._signature:
+            with open(self.db_file, 'r') as f:
+                signature = self._file_signature(os.fstat(f.fileno()))
+                data = json.load(f)
+            for (section, key), value in self._pending.items():
+                if value is _DELETED:
+                    data[section].pop(key, None)
+                else:
+                    data[section][key] = value
+            self._data = data
+            self._signature = signature
+            self._version = data.get("version", 0)
+            self._email_index = {}
+            for user_id, user_data in data["users"].items():
+                self._email_index.setdefault(user_data.get("email"), user_id)
+        return self._data
     
     def _write_db(self, data: dict):
-        """Write to database"""
-        with open(self.db_file, 'w') as f:
-            json.dump(data, f, indent=2, default=str)
+        """Write to database
+
+        The next version is written to a temp file that replaces users.json
+        in one step, so readers never see a partial file. Callers hold
+        _file_lock().
+        """
+        self._version += 1
+        data["version"] = self._version
+        ordered = {"version": self._version, **{k: v for k, v in data.items() if k != "version"}}
+        directory = os.path.dirname(os.path.abspath(self.db_file))
+        fd, tmp_path = tempfile.mkstemp(prefix=".users-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(ordered, f, indent=2, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.db_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._signature = self._file_signature()
+    
+    def _mark_dirty(self, section: str, key: str):
+        """Record a change and write it now or schedule a coalesced flush"""
+        self._pending[(section, key)] = self._data[section].get(key, _DELETED)
+        if self.write_delay <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.write_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def flush(self):
+        """Write pending changes to the file"""
+        with self._file_lock():
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            if self._data is None or self._disk_version() != self._version:
+                # Another process wrote since we loaded: merge onto its version
+                self._data = None
+            self._write_db(self._read_db())
+            self._pending.clear()
     
     def get_user(self, user_id: str) -> Optional[Dict]:
         """Get user by ID"""
-        db = self._read_db()
-        return db["users"].get(user_id)
+        with self._lock:
+            user = self._read_db()["users"].get(user_id)
+            return dict(user) if user is not None else None
     
     def get_user_by_email(self, email: str) -> Optional[Dict]:
         """Get user by email"""
-        db = self._read_db()
-        for user_id, user_data in db["users"].items():
-            if user_data.get("email") == email:
-                return user_data
-        return None
+        with self._lock:
+            db = self._read_db()
+            user_id = self._email_index.get(email)
+            return dict(db["users"][user_id]) if user_id is not None else None
     
     def create_or_update_user(self, user_id: str, email: str, name: str, picture: str = None, google_credentials: str = None) -> Dict:
         """Create or update user"""
-        db = self._read_db()
-        
-        now = datetime.utcnow().isoformat()
-        
-        if user_id in db["users"]:
-            # Update existing user
-            db["users"][user_id]["name"] = name
-            db["users"][user_id]["picture"] = picture
-            db["users"][user_id]["last_login"] = now
-            if google_credentials:
-                db["users"][user_id]["google_credentials"] = google_credentials
-        else:
-            # Create new user
-            db["users"][user_id] = {
-                "id": user_id,
-                "email": email,
-                "name": name,
-                "picture": picture,
-                "google_credentials": google_credentials,
-                "created_at": now,
-                "last_login": now
-            }
-        
-        self._write_db(db)
-        return db["users"][user_id]
-    
-    def save_session(self, user_id: str, session_data: dict):
-        """Save user session"""
-        db = self._read_db()
-        db["sessions"][user_id] = session_data
-        self._write_db(db)
-    
-    def get_session(self, user_id: str) -> Optional[Dict]:
-        """Get user session"""
-        db = self._read_db()
-        return db["sessions"].get(user_id)
-    
-    def delete_session(self, user_id: str):
-        """Delete user session"""
-        db = self._read_db()
-        if user_id in db["sessions"]:
-            del db["sessions"][user_id]
-            self._write_db(db)
+        with self._lock:
+            db = self._read_db()
+            
+            now = datetime.utcnow().isoformat()
+            
+            if user_id in db["users"]:
+                # Update existing user
+                db["users"][user_id]["name"] = name
+                db["users"][user_id]["picture"] = picture
+                db["users"][user_id]["last_login"] = now
+                if google_credentials:
+                    db["users"][user_id]["google_credentials"] = google_credentials
+            else:
+                # Create new user
+                db["users"][user_id] = {
+                    "id": user_id,
+                    "email": email,
+                    "name": name,
+                    "picture": picture,
+                    "google_credentials": google_credentials,
+                    "created_at": now,
+                    "last_login": now
+                }
+                self._email_index.setdefault(email, user_id)
+            
+            self._mark_dirty("users", user_id)
+            return dict(db["users"][user_id])
+    
+    def pop_legacy_sessions(self) -> Dict[str, dict]:
+        """Remove and return the "sessions" section older versions kept in the file
+
+        Sessions now live in session_store; this is the one-time hand-over.
+        """
+        with self._file_lock():
+            self._data = None
+            data = self._read_db()
+            sessions = data.pop("sessions", None)
+            if sessions is not None:
+                self._write_db(data)
+            return sessions or {}
     
     def get_google_credentials(self, user_id: str) -> Optional[str]:
         """Get user's Google credentials"""
@@ -91,5 +208,125 @@ class Database:
             return user.get("google_credentials")
         return None
 
+class SQLiteDatabase:
+    """SQLite-backed store with the same interface as Database
+
+    Users are looked up by primary key or the email index instead of
+    parsing the whole JSON file, and each write touches one row. WAL mode
+    lets other worker processes keep reading while a login is written.
+    Existing users are imported from the JSON file once.
+    """
+
+    USER_COLUMNS = ("id", "email", "name", "picture", "google_credentials", "created_at", "last_login")
+
+    def __init__(self, db_path: str = "users.db", json_file: Optional[str] = "users.json"):
+        self.db_path = db_path
+        self.json_file = json_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=64)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._create_schema()
+        if json_file:
+            self._migrate_from_json(json_file)
+    
+    def _create_schema(self):
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "id TEXT PRIMARY KEY, email TEXT, name TEXT, picture TEXT, "
+                "google_credentials TEXT, created_at TEXT, last_login TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS users_email ON users (email)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    
+    def _migrate_from_json(self, json_file: str):
+        """Import users.json the first time this database is opened"""
+        with self._lock, self._conn:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+            if done is not None or not os.path.exists(json_file):
+                return
+            with open(json_file, 'r') as f:
+                data = json.load(f)
+            users = data.get("users", {})
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO users (id, email, name, picture, google_credentials, created_at, last_login) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [tuple(user.get(column) for column in self.USER_COLUMNS) for user in users.values()]
+            )
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                (datetime.utcnow().isoformat(),)
+            )
+            print(f"Migrated {len(users)} users from {json_file} to {self.db_path}")
+    
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        """Get user by ID"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        return dict(row) if row is not None else None
+    
+    def get_user_by_email(self, email: str) -> Optional[Dict]:
+        """Get user by email"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM users WHERE email = ? LIMIT 1", (email,)).fetchone()
+        return dict(row) if row is not None else None
+    
+    def create_or_update_user(self, user_id: str, email: str, name: str, picture: str = None, google_credentials: str = None) -> Dict:
+        """Create or update user"""
+        now = datetime.utcnow().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO users (id, email, name, picture, google_credentials, created_at, last_login) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET name = excluded.name, picture = excluded.picture, "
+                "last_login = excluded.last_login, "
+                "google_credentials = COALESCE(excluded.google_credentials, users.google_credentials)",
+                (user_id, email, name, picture, google_credentials or None, now, now)
+            )
+            row = self._conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        return dict(row)
+    
+    def pop_legacy_sessions(self) -> Dict[str, dict]:
+        """Remove and return sessions older versions kept here or in users.json
+
+        Drops the old sessions table; sessions now live in session_store.
+        """
+        sessions = {}
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sessions'"
+            ).fetchone()
+            if exists is not None:
+                for user_id, data in self._conn.execute("SELECT user_id, data FROM sessions"):
+                    sessions[user_id] = json.loads(data)
+                self._conn.execute("DROP TABLE sessions")
+        if self.json_file and os.path.exists(self.json_file):
+            sessions.update(Database(self.json_file).pop_legacy_sessions())
+        return sessions
+    
+    def get_google_credentials(self, user_id: str) -> Optional[str]:
+        """Get user's Google credentials"""
+        with self._lock:
+            row = self._conn.execute("SELECT google_credentials FROM users WHERE id = ?", (user_id,)).fetchone()
+        return row[0] if row is not None else None
+    
+    def flush(self):
+        """Writes are committed as they happen; nothing to flush"""
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_database():
+    """Build the store selected by DATABASE_BACKEND ("json" or "sqlite")"""
+    if settings.DATABASE_BACKEND == "sqlite":
+        return SQLiteDatabase(settings.SQLITE_DB_PATH, json_file="users.json")
+    return Database(write_delay=settings.DATABASE_WRITE_DELAY)
+
+
 # Singleton instance
-db = Database()
+db = create_database()
@@ -0,0 +1,70 @@
+from fastapi import APIRouter, HTTPException, Header, Depends
+from fastapi.responses import PlainTextResponse
+from config import settings
+from tracing import tracer, waterfall
+from profiling import request_profiler
+from typing import Optional
+import secrets
+
+# Dependency guarding the debug endpoints with the shared ADMIN_TOKEN
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """404 while ADMIN_TOKEN is unset, 403 on a wrong token"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # Compare bytes: compare_digest rejects non-ASCII str, and header values arrive latin-1 decoded
+    if not x_admin_token or not secrets.compare_digest(
+        x_admin_token.encode("latin-1"), settings.ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/traces/slowest")
+async def slowest_traces(
+    limit: int = 10,
+    route: Optional[str] = None,
+    format: str = "json"
+):
+    """Slowest recent request traces, each with a text waterfall of its spans
+
+    `route` filters by root span name, e.g. "GET /emails/daily-digest";
+    `format=text` returns only the waterfalls as plain text.
+    """
+    traces = [trace.to_dict() for trace in tracer.slowest(limit=max(1, min(limit, 100)), name=route)]
+    for trace in traces:
+        trace["waterfall"] = waterfall(trace)
+
+    if format == "text":
+        blocks = [
+            f"{trace['name']}  {trace['duration_ms']:.1f} ms  trace {trace['trace_id']}\n" + "\n".join(trace["waterfall"])
+            for trace in traces
+        ]
+        return PlainTextResponse("\n\n".join(blocks) + "\n")
+    return {"traces": traces, "buffered": len(tracer.recent)}
+
+
+@router.get("/profiles")
+async def profile_summary():
+    """Requests profiled, samples and distinct stacks per route"""
+    return {
+        "sample_rate": settings.PROFILE_SAMPLE_RATE,
+        "interval": request_profiler.interval,
+        "routes": request_profiler.summary()
+    }
+
+
+@router.get("/profiles/collapsed")
+async def download_profile(route: Optional[str] = None):
+    """Collapsed stacks for flamegraph.pl or speedscope; all routes when `route` is omitted"""
+    return PlainTextResponse(
+        request_profiler.collapsed(route),
+        headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'}
+    )
+
+
+@router.delete("/profiles")
+async def reset_profiles():
+    """Discard collected profiles"""
+    request_profiler.reset()
+    return {"message": "Profiles cleared"}
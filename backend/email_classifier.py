@@ -0,0 +1,307 @@
+"""
+Vectorized Email Classifier
+Hashed TF-IDF features and a linear model in NumPy, so a whole batch of
+emails is featurized together and every category is scored with one
+sparse-dense matrix product instead of a per-email loop or an LLM call
+"""
+import argparse
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+
+CATEGORIES = ["Work", "Personal", "Promotions", "Urgent"]
+
+# Labeled (subject, sender, snippet, category) examples used when no trained
+# model file is configured
+SEED_EMAILS = [
+    ("Project kickoff meeting", "pm@company.com", "Agenda for tomorrow's kickoff with the client team", "Work"),
+    ("Q3 report draft", "finance@company.com", "Please review the attached quarterly report before Friday", "Work"),
+    ("Contract proposal", "legal@partner.com", "Updated terms for the service contract are attached", "Work"),
+    ("Standup notes", "team@company.com", "Notes from today's standup and sprint planning", "Work"),
+    ("Client feedback on the design", "client@acme.com", "The business team shared feedback on the mockups", "Work"),
+    ("Code review requested", "github@company.com", "A pull request is waiting for your review", "Work"),
+    ("Invoice for consulting services", "billing@vendor.com", "Invoice for last month's consulting hours", "Work"),
+    ("Interview schedule", "hr@company.com", "Candidate interviews are scheduled for Tuesday", "Work"),
+    ("Roadmap sync", "lead@company.com", "Let's align on the roadmap and milestones for the quarter", "Work"),
+    ("Budget approval", "cfo@company.com", "The department budget for next year needs sign off", "Work"),
+    ("Dinner this weekend?", "friend@gmail.com", "Want to grab dinner on Saturday with everyone", "Personal"),
+    ("Photos from the trip", "mom@family.com", "Here are the photos from our family trip", "Personal"),
+    ("Happy birthday!", "sister@gmail.com", "Hope you have a wonderful birthday, love you", "Personal"),
+    ("Catching up", "oldfriend@yahoo.com", "It's been ages, how have you been lately", "Personal"),
+    ("Game night", "neighbor@gmail.com", "We're hosting game night on Friday, bring snacks", "Personal"),
+    ("Wedding RSVP", "cousin@gmail.com", "Let us know if you can make it to the wedding", "Personal"),
+    ("Your dentist appointment", "clinic@smiles.com", "Reminder of your appointment next week", "Personal"),
+    ("Weekend hike", "buddy@outlook.com", "Trail looks great this weekend, are you in", "Personal"),
+    ("Recipe you asked for", "grandma@family.com", "Here is the lasagna recipe from the holidays", "Personal"),
+    ("Thanks for the gift", "aunt@gmail.com", "The kids loved the presents, thank you so much", "Personal"),
+    ("50% OFF everything", "deals@store.com", "Limited time sale, shop now and save big", "Promotions"),
+    ("Your weekly newsletter", "news@medium.com", "Top stories picked for you this week, unsubscribe anytime", "Promotions"),
+    ("Exclusive offer inside", "marketing@brand.com", "Members get an extra discount on new arrivals", "Promotions"),
+    ("Flash deal ends tonight", "promo@shop.com", "Don't miss our biggest deal of the season", "Promotions"),
+    ("New arrivals just for you", "hello@fashion.com", "Browse the new collection with free shipping", "Promotions"),
+    ("Upgrade to premium", "offers@app.com", "Get premium features for half price this month", "Promotions"),
+    ("Black Friday preview", "sales@electronics.com", "Early access to Black Friday discounts", "Promotions"),
+    ("Webinar invitation", "events@saas.com", "Register for our free marketing webinar", "Promotions"),
+    ("Coupon code inside", "rewards@grocery.com", "Use this coupon for 20% off your next order", "Promotions"),
+    ("Subscribe and save", "subscriptions@box.com", "Subscribe today and save on every delivery", "Promotions"),
+    ("URGENT: server down", "ops@company.com", "Production is down, immediate action required", "Urgent"),
+    ("Action required: verify your account", "security@bank.com", "Suspicious sign in detected, verify immediately", "Urgent"),
+    ("Deadline today", "manager@company.com", "The proposal must be submitted by 5pm today asap", "Urgent"),
+    ("Critical security patch", "it@company.com", "Install the critical update immediately", "Urgent"),
+    ("Payment overdue", "billing@utility.com", "Your payment is overdue, pay now to avoid suspension", "Urgent"),
+    ("Important: flight cancelled", "alerts@airline.com", "Your flight was cancelled, rebook as soon as possible", "Urgent"),
+    ("Need your sign off asap", "director@company.com", "Blocking the release, please approve right away", "Urgent"),
+    ("Password expires today", "it@company.com", "Reset your password now to keep access", "Urgent"),
+    ("Incident escalation", "oncall@company.com", "Customer outage escalated, respond immediately", "Urgent"),
+    ("Final notice", "collections@service.com", "This is the final notice before your account is closed", "Urgent")
+]
+
+_DOC_BREAK = "\x01"
+
+# Bytes that belong to a token: ASCII letters and digits (text is lowercased
+# first) and any non-ASCII byte, so UTF-8 words stay whole
+_WORD_BYTES = np.zeros(256, dtype=bool)
+_WORD_BYTES[ord("a"):ord("z") + 1] = True
+_WORD_BYTES[ord("0"):ord("9") + 1] = True
+_WORD_BYTES[128:] = True
+
+# Polynomial rolling hash mod 2**64 (uint64 arithmetic wraps)
+_HASH_BASE = 1099511628211
+_HASH_BASE_INVERSE = pow(_HASH_BASE, -1, 2 ** 64)
+_powers = np.ones(1, dtype=np.uint64)
+_inverse_powers = np.ones(1, dtype=np.uint64)
+
+
+def _hash_powers(length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """base**k and base**-k for k < length, grown and cached as needed"""
+    global _powers, _inverse_powers
+    if len(_powers) < length:
+        size = max(length, 2 * len(_powers))
+        _powers, _inverse_powers = np.ones(size, dtype=np.uint64), np.ones(size, dtype=np.uint64)
+        np.cumprod(np.full(size - 1, _HASH_BASE, dtype=np.uint64), out=_powers[1:])
+        np.cumprod(np.full(size - 1, _HASH_BASE_INVERSE, dtype=np.uint64), out=_inverse_powers[1:])
+    return _powers, _inverse_powers
+
+
+def email_text(email: Dict) -> str:
+    """Text the classifier sees for one email"""
+    return f"{email.get('subject', '')} {email.get('sender', '')} {email.get('snippet', '')}"
+
+
+def hash_tokens(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Tokenize and hash a batch of texts without a per-token Python loop
+
+    The batch is joined into one byte array; token boundaries, 64-bit token
+    hashes and the owning text of each token are all computed with array
+    operations. Returns (hashes, text index per token).
+    """
+    joined = _DOC_BREAK.join(text.replace(_DOC_BREAK, " ") for text in texts).lower()
+    data = np.frombuffer(joined.encode("utf-8"), dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+
+    in_word = np.concatenate(([False], _WORD_BYTES[data], [False]))
+    edges = np.flatnonzero(in_word[1:] != in_word[:-1])
+    starts, ends = edges[::2], edges[1::2]
+
+    powers, inverse_powers = _hash_powers(len(data))
+    prefix = np.zeros(len(data) + 1, dtype=np.uint64)
+    np.cumsum(data.astype(np.uint64) * powers[:len(data)], out=prefix[1:])
+    hashes = (prefix[ends] - prefix[starts]) * inverse_powers[starts]
+
+    docs = np.searchsorted(np.flatnonzero(data == ord(_DOC_BREAK)), starts)
+    return hashes, docs
+
+
+class TfidfLinearModel:
+    """Multinomial logistic regression over sublinear TF-IDF of hashed tokens
+
+    Feature matrices are kept as COO arrays (rows, cols, values) so scoring
+    a batch is one gather and one segment sum per category.
+    """
+
+    def __init__(self, labels: Sequence[str] = CATEGORIES):
+        self.labels = list(labels)
+        self.vocabulary = np.zeros(0, dtype=np.uint64)  # sorted token hashes
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.weights = np.zeros((0, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+    def _features(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        hashes, docs = hash_tokens(texts)
+        size = len(self.vocabulary)
+        ids = np.searchsorted(self.vocabulary, hashes)
+        known = ids < size
+        known[known] = self.vocabulary[ids[known]] == hashes[known]
+        keys, counts = np.unique(docs[known] * max(size, 1) + ids[known], return_counts=True)
+        rows, cols = np.divmod(keys, max(size, 1))
+        values = ((1.0 + np.log(counts)) * self.idf[cols]).astype(np.float32)
+        norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(texts)))
+        values /= np.where(norms > 0, norms, 1.0)[rows]
+        return rows, cols, values
+
+    def _scores(self, features, count: int) -> np.ndarray:
+        rows, cols, values = features
+        contributions = self.weights[cols] * values[:, None]
+        scores = np.empty((count, len(self.labels)), dtype=np.float32)
+        for label in range(len(self.labels)):
+            scores[:, label] = np.bincount(rows, weights=contributions[:, label], minlength=count)
+        return scores + self.bias
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], epochs: int = 300, lr: float = 4.0,
+            l2: float = 1e-4) -> "TfidfLinearModel":
+        hashes, docs = hash_tokens(texts)
+        self.vocabulary, ids = np.unique(hashes, return_inverse=True)
+        pairs = np.unique(docs * len(self.vocabulary) + ids)
+        document_frequency = np.bincount(pairs % len(self.vocabulary), minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1.0).astype(np.float32)
+
+        rows, cols, values = features = self._features(texts)
+        targets = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        targets[np.arange(len(texts)), [self.labels.index(label) for label in labels]] = 1.0
+        self.weights = np.zeros((len(self.vocabulary), len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+        for _ in range(epochs):
+            grad = (self._softmax(self._scores(features, len(texts))) - targets) / len(texts)
+            weighted = grad[rows] * values[:, None]
+            weight_grad = np.stack([
+                np.bincount(cols, weights=weighted[:, label], minlength=len(self.vocabulary))
+                for label in range(len(self.labels))
+            ], axis=1)
+            self.weights -= lr * (weight_grad + l2 * self.weights).astype(np.float32)
+            self.bias -= lr * grad.sum(axis=0)
+        return self
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), len(labels)) class probabilities"""
+        if not texts:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        return self._softmax(self._scores(self._features(texts), len(texts)))
+
+    def predict(self, texts: Sequence[str]) -> List[str]:
+        return [self.labels[index] for index in self.predict_proba(texts).argmax(axis=1)]
+
+    def save(self, path: str):
+        """Write the model to a .npz file"""
+        np.savez_compressed(
+            path,
+            labels=np.array(self.labels),
+            vocabulary=self.vocabulary,
+            idf=self.idf,
+            weights=self.weights,
+            bias=self.bias
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "TfidfLinearModel":
+        with np.load(path, allow_pickle=False) as data:
+            model = cls([str(label) for label in data["labels"]])
+            model.vocabulary = data["vocabulary"].astype(np.uint64)
+            model.idf = data["idf"].astype(np.float32)
+            model.weights = data["weights"].astype(np.float32)
+            model.bias = data["bias"].astype(np.float32)
+        return model
+
+
+class EmailClassifier:
+    """Categorize batches of emails with a trained TfidfLinearModel
+
+    The model is loaded from settings.EMAIL_CLASSIFIER_MODEL when set, and
+    otherwise trained on SEED_EMAILS at first use.
+    """
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.model_path = model_path
+        self._model: Optional[TfidfLinearModel] = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> TfidfLinearModel:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    path = self.model_path if self.model_path is not None else settings.EMAIL_CLASSIFIER_MODEL
+                    if path and os.path.exists(path):
+                        self._model = TfidfLinearModel.load(path)
+                    else:
+                        if path:
+                            print(f"Email classifier model {path} not found, training on seed emails")
+                        self._model = train_from_examples(SEED_EMAILS)
+        return self._model
+
+    def warm_up(self):
+        """Load or train the model ahead of the first request"""
+        self.model
+
+    def categorize(self, emails: List[Dict]) -> List[str]:
+        """One category per email, in input order"""
+        return self.model.predict([email_text(email) for email in emails])
+
+
+def train_from_examples(examples: Sequence[Tuple[str, str, str, str]]) -> TfidfLinearModel:
+    """Train on (subject, sender, snippet, category) tuples"""
+    texts = [email_text({"subject": s, "sender": f, "snippet": b}) for s, f, b, _ in examples]
+    return TfidfLinearModel().fit(texts, [category for *_, category in examples])
+
+
+def _load_jsonl(path: str) -> List[Tuple[str, str, str, str]]:
+    examples = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                examples.append((row.get("subject", ""), row.get("sender", ""), row.get("snippet", ""), row["category"]))
+    return examples
+
+
+def main():
+    """Train a model offline from labeled JSONL
+
+        python email_classifier.py labeled.jsonl -o email_classifier.npz
+
+    Each line holds subject, sender, snippet and category. Point
+    EMAIL_CLASSIFIER_MODEL at the output file to serve it.
+    """
+    parser = argparse.ArgumentParser(description="Train the vectorized email classifier")
+    parser.add_argument("data", help="JSONL file with subject, sender, snippet and category per line")
+    parser.add_argument("-o", "--output", default="email_classifier.npz")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of examples kept for evaluation")
+    args = parser.parse_args()
+
+    examples = _load_jsonl(args.data)
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(examples))
+    split = int(len(examples) * (1 - args.holdout))
+    train = [examples[i] for i in order[:split]]
+    test = [examples[i] for i in order[split:]]
+
+    model = train_from_examples(train)
+    if test:
+        texts = [email_text({"subject": s, "sender": f, "snippet": b}) for s, f, b, _ in test]
+        predicted = model.predict(texts)
+        accuracy = sum(p == example[3] for p, example in zip(predicted, test)) / len(test)
+        print(f"Held-out accuracy: {accuracy:.1%} on {len(test)} emails")
+
+    model = train_from_examples(examples)
+    model.save(args.output)
+    print(f"Saved model with {len(model.vocabulary)} terms to {args.output}")
+
+
+# Singleton instance
+email_classifier = EmailClassifier()
+
+
+if __name__ == "__main__":
+    main()
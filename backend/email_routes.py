@@ -1,12 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 from auth_routes import get_current_user
 from gmail_service import GmailService
+from inbox_sync import inbox_sync
 from ai_service import AIService
 from nlp_service import NLPService
+from model_registry import get_ai_service, get_nlp_service
+from summary_pipeline import summarize_emails
+from keyword_matcher import KeywordMatcher
+from email_classifier import email_classifier
 from logger_service import EventLogger, StatusTracker
 from retry_service import with_retry
+from tracing import span
+from config import settings
 
 router = APIRouter(prefix="/emails", tags=["emails"])
 
@@ -26,10 +33,23 @@ class DeleteEmailRequest(BaseModel):
 class NLCommandRequest(BaseModel):
     command: str
 
+# Keyword categories in priority order; each email is scanned once
+CATEGORY_MATCHER = KeywordMatcher({
+    "Urgent": ['urgent', 'asap', 'important', 'critical', 'deadline', 'immediately', 'action required'],
+    "Promotions": ['sale', 'offer', 'discount', 'deal', 'promo', 'subscribe', 'unsubscribe', 'newsletter', 'marketing'],
+    "Work": ['meeting', 'project', 'deadline', 'team', 'client', 'report', 'proposal', 'contract', 'business']
+})
+DIGEST_MATCHER = KeywordMatcher({
+    "urgent": ['urgent', 'asap', 'important', 'critical', 'deadline', 'immediately'],
+    "action": ['reply', 'respond', 'approve', 'review', 'action required', 'please', 'need']
+})
+
 class ReadEmailsRequest(BaseModel):
     count: Optional[int] = 5
     subject_filter: Optional[str] = None
     sender_filter: Optional[str] = None
+    include_summaries: Optional[bool] = True  # False skips bodies and AI summaries
+    engine: Optional[Literal["keywords", "vector", "ai"]] = "keywords"  # categorization engine
 
 
 @router.get("/read")
@@ -42,12 +62,10 @@ async def read_emails(current_user: dict = Depends(get_current_user)):
         gmail_service = GmailService(current_user["access_token"])
         print("DEBUG: GmailService initialized")
         
-        ai_service = AIService()
-        print("DEBUG: AIService initialized")
-        
-        # Get last 5 emails
+        # Get last 5 emails from the incrementally synced local store
         print("DEBUG: Fetching emails...")
-        emails = await gmail_service.get_recent_emails(max_results=5)
+        with span("inbox_sync.get_recent_emails", count=5):
+            emails = await inbox_sync.get_recent_emails(current_user["user_id"], gmail_service, count=5)
         print(f"DEBUG: Fetched {len(emails)} emails")
         
         # No summarization - return emails as-is with full body content
@@ -63,21 +81,13 @@ async def read_emails(current_user: dict = Depends(get_current_user)):
 @router.post("/generate-replies")
 async def generate_replies(
     request: GenerateRepliesRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Generate AI-powered replies for emails"""
     try:
-        ai_service = AIService()
-        replies = []
-        
-        for email in request.emails:
-            reply = await ai_service.generate_reply(
-                sender=email["sender"],
-                subject=email["subject"],
-                body=email.get("body", ""),
-                summary=email.get("summary", "")
-            )
-            replies.append(reply)
+        # Batched prompts, falling back to one call per email where needed
+        replies = await ai_service.generate_replies(request.emails)
         
         return {"replies": replies}
     except Exception as e:
@@ -135,12 +145,12 @@ async def delete_email(
 @router.post("/parse-command")
 async def parse_natural_language_command(
     request: NLCommandRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    nlp_service: NLPService = Depends(get_nlp_service)
 ):
     """Parse natural language command and return structured action"""
     try:
         EventLogger.log_command(request.command, current_user["email"], success=True)
-        nlp_service = NLPService()
         parsed = await nlp_service.parse_command(request.command)
         return {"parsed": parsed, "original": request.command}
     except Exception as e:
@@ -152,30 +162,41 @@ async def parse_natural_language_command(
 @with_retry(max_retries=2)
 async def categorize_inbox(
     request: ReadEmailsRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """Fetch emails and categorize them into Work, Personal, Promotions, Urgent"""
     try:
         EventLogger.log_gmail_call("categorize", current_user["email"], success=False)
         
         gmail_service = GmailService(current_user["access_token"])
-        ai_service = AIService()
         
         # Fetch more emails for categorization
         count = request.count or 20
-        emails = await gmail_service.get_recent_emails(max_results=count)
+        with span("inbox_sync.get_recent_emails", count=count):
+            emails = await inbox_sync.get_recent_emails(
+                current_user["user_id"], gmail_service, count=count,
+                with_bodies=request.include_summaries
+            )
         
-        # Generate summaries for each (this works!)
-        for email in emails:
-            email["summary"] = await ai_service.generate_summary(email["body"])
+        # Generate summaries concurrently, several emails per model call
+        if request.include_summaries:
+            with span("summarize_emails", emails=len(emails)):
+                await summarize_emails(ai_service, emails, batch_size=settings.AI_BATCH_SIZE)
         
         EventLogger.log_gmail_call("categorize", current_user["email"], success=True, 
                                    details={"count": len(emails)})
         
-        # Use keyword-based categorization instead of AI
+        # Keywords by default; "vector" uses the local classifier, "ai" asks Gemini
         EventLogger.log_ai_call("categorize_emails", success=False)
-        categorized = _categorize_emails_by_keywords(emails)
-        EventLogger.log_ai_call("categorize_emails", success=True)
+        with span("categorize", engine=request.engine):
+            if request.engine == "vector":
+                categorized = _categorize_emails_by_classifier(emails)
+            elif request.engine == "ai":
+                categorized = await _categorize_emails_by_ai(ai_service, emails)
+            else:
+                categorized = _categorize_emails_by_keywords(emails)
+        EventLogger.log_ai_call("categorize_emails", success=True, details={"engine": request.engine})
         
         # Organize results
         result = {
@@ -189,72 +210,83 @@ async def categorize_inbox(
         raise HTTPException(status_code=500, detail=f"Failed to categorize inbox: {str(e)}")
 
 
-def _categorize_emails_by_keywords(emails: List[dict]) -> dict:
-    """Categorize emails using keyword matching"""
-    
-    # Define keyword patterns
-    work_keywords = ['meeting', 'project', 'deadline', 'team', 'client', 'report', 'proposal', 'contract', 'business']
-    promo_keywords = ['sale', 'offer', 'discount', 'deal', 'promo', 'subscribe', 'unsubscribe', 'newsletter', 'marketing']
-    urgent_keywords = ['urgent', 'asap', 'important', 'critical', 'deadline', 'immediately', 'action required']
-    
-    categories = {
+def _empty_categories() -> dict:
+    return {
         "Work": {"count": 0, "summary": "Professional emails, meetings, and projects", "emails": []},
         "Personal": {"count": 0, "summary": "Personal communications and non-work messages", "emails": []},
         "Promotions": {"count": 0, "summary": "Marketing emails, newsletters, and special offers", "emails": []},
         "Urgent": {"count": 0, "summary": "Time-sensitive emails requiring immediate attention", "emails": []}
     }
+
+
+def _categorize_emails_by_keywords(emails: List[dict]) -> dict:
+    """Categorize emails using keyword matching"""
+    
+    categories = _empty_categories()
     
     for email in emails:
-        email_text = f"{email.get('subject', '')} {email.get('sender', '')} {email.get('snippet', '')}".lower()
-        categorized = False
-        
-        # Check urgent first
-        if any(keyword in email_text for keyword in urgent_keywords):
-            categories["Urgent"]["emails"].append(email)
-            categories["Urgent"]["count"] += 1
-            categorized = True
-        
-        # Check promotions
-        if not categorized and any(keyword in email_text for keyword in promo_keywords):
-            categories["Promotions"]["emails"].append(email)
-            categories["Promotions"]["count"] += 1
-            categorized = True
+        email_text = f"{email.get('subject', '')} {email.get('sender', '')} {email.get('snippet', '')}"
         
-        # Check work
-        if not categorized and any(keyword in email_text for keyword in work_keywords):
-            categories["Work"]["emails"].append(email)
-            categories["Work"]["count"] += 1
-            categorized = True
-        
-        # Default to personal
-        if not categorized:
-            categories["Personal"]["emails"].append(email)
-            categories["Personal"]["count"] += 1
+        # Urgent, then Promotions, then Work; default to personal
+        category = CATEGORY_MATCHER.first(email_text, default="Personal")
+        categories[category]["emails"].append(email)
+        categories[category]["count"] += 1
     
     return categories
 
 
+def _categorize_emails_by_classifier(emails: List[dict]) -> dict:
+    """Categorize all emails at once with the vectorized local classifier"""
+    categories = _empty_categories()
+    for email, category in zip(emails, email_classifier.categorize(emails)):
+        bucket = categories.get(category, categories["Personal"])  # labels outside the four fold into Personal
+        bucket["emails"].append(email)
+        bucket["count"] += 1
+    return categories
+
+
+async def _categorize_emails_by_ai(ai_service: AIService, emails: List[dict]) -> dict:
+    """Categorize emails with Gemini, keeping the keyword response shape"""
+    result = await ai_service.categorize_emails(emails)
+    categories = _empty_categories()
+    for category, indices in result.get("categories", {}).items():
+        if category not in categories:
+            continue
+        for index in indices:
+            if isinstance(index, int) and 0 <= index < len(emails):
+                categories[category]["emails"].append(emails[index])
+                categories[category]["count"] += 1
+        summary = result.get("summary", {}).get(category)
+        if summary:
+            categories[category]["summary"] = summary
+    return categories
+
+
 @router.get("/daily-digest")
 @with_retry(max_retries=2)
-async def daily_digest(current_user: dict = Depends(get_current_user)):
+async def daily_digest(
+    current_user: dict = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
+):
     """Generate a comprehensive daily email digest"""
     try:
         EventLogger.log_command("daily_digest", current_user["email"], success=False)
         
         gmail_service = GmailService(current_user["access_token"])
-        ai_service = AIService()
         
         # Fetch today's emails
-        emails = await gmail_service.get_recent_emails(max_results=20)
+        with span("inbox_sync.get_recent_emails", count=20):
+            emails = await inbox_sync.get_recent_emails(current_user["user_id"], gmail_service, count=20)
         
-        # Generate summaries for each (this works!)
-        for email in emails:
-            email["summary"] = await ai_service.generate_summary(email["body"])
+        # Generate summaries concurrently, several emails per model call
+        with span("summarize_emails", emails=len(emails)):
+            await summarize_emails(ai_service, emails, batch_size=settings.AI_BATCH_SIZE)
         
         # Create digest manually from summaries instead of using AI
         EventLogger.log_ai_call("daily_digest", success=False)
         
-        digest = _create_digest_from_emails(emails)
+        with span("render_digest"):
+            digest = _create_digest_from_emails(emails)
         
         EventLogger.log_ai_call("daily_digest", success=True)
         EventLogger.log_command("daily_digest", current_user["email"], success=True)
@@ -272,40 +304,21 @@ async def daily_digest(current_user: dict = Depends(get_current_user)):
 def _create_digest_from_emails(emails: List[dict]) -> str:
     """Create a structured digest from emails without using AI generation"""
     
-    # Categorize emails by keywords
-    urgent_keywords = ['urgent', 'asap', 'important', 'critical', 'deadline', 'immediately']
-    action_keywords = ['reply', 'respond', 'approve', 'review', 'action required', 'please', 'need']
-    
     urgent_emails = []
     action_required = []
     informational = []
+    sections = {"urgent": urgent_emails, "action": action_required, None: informational}
     
     for idx, email in enumerate(emails, 1):
-        email_text = f"{email.get('subject', '')} {email.get('summary', '')}".lower()
+        email_text = f"{email.get('subject', '')} {email.get('summary', '')}"
         
-        # Check if urgent
-        if any(keyword in email_text for keyword in urgent_keywords):
-            urgent_emails.append({
-                'num': idx,
-                'sender': email.get('sender', 'Unknown'),
-                'subject': email.get('subject', 'No Subject'),
-                'summary': email.get('summary', 'No summary available')
-            })
-        # Check if action required
-        elif any(keyword in email_text for keyword in action_keywords):
-            action_required.append({
-                'num': idx,
-                'sender': email.get('sender', 'Unknown'),
-                'subject': email.get('subject', 'No Subject'),
-                'summary': email.get('summary', 'No summary available')
-            })
-        else:
-            informational.append({
-                'num': idx,
-                'sender': email.get('sender', 'Unknown'),
-                'subject': email.get('subject', 'No Subject'),
-                'summary': email.get('summary', 'No summary available')
-            })
+        # Urgent first, then action required, otherwise informational
+        sections[DIGEST_MATCHER.first(email_text)].append({
+            'num': idx,
+            'sender': email.get('sender', 'Unknown'),
+            'subject': email.get('subject', 'No Subject'),
+            'summary': email.get('summary', 'No summary available')
+        })
     
     # Build digest text
     digest = "## 📋 Daily Email Digest\n\n"
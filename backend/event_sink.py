@@ -0,0 +1,258 @@
+"""
+Event Sink
+Writes EventLogger events as newline-delimited JSON segments with size/age
+rotation and gzip of rotated segments, plus a query tool that streams over
+them
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:  # Falls back to the stdlib encoder
+    orjson = None
+
+ACTIVE_SUFFIX = ".ndjson"
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+
+def dumps(event: Dict) -> bytes:
+    """Compact one-line JSON, via orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(event, default=str)
+    return json.dumps(event, separators=(",", ":"), default=str).encode()
+
+
+class EventSink:
+    """Append-only NDJSON writer for one directory of event segments
+
+    Each process appends to its own `<basename>.<pid>.ndjson`, so workers
+    never write to or rotate a file another worker holds open. Once that
+    file reaches `max_bytes`, or `max_age` seconds after it was opened, it
+    is renamed to a timestamped segment and gzipped; the newest
+    `max_segments` segments in the directory are kept. Active files left
+    by workers that have exited are rotated when a sink is created. Writes
+    are buffered and flushed once per logging batch.
+    """
+
+    def __init__(self, directory: str, basename: str = "events", max_bytes: int = 50 * 1024 * 1024,
+                 max_age: float = 86400, max_segments: int = 30, compress: bool = True,
+                 clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.basename = basename
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_segments = max_segments
+        self.compress = compress
+        self.clock = clock
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+        self._rotate_orphans()
+
+    def _open(self):
+        self._pid = os.getpid()
+        self.path = os.path.join(self.directory, f"{self.basename}.{self._pid}{ACTIVE_SUFFIX}")
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        self._opened_at = self.clock()
+
+    def write(self, event: Dict):
+        if self._pid != os.getpid():
+            # Forked after the sink was created: the file belongs to the parent
+            self._open()
+        if self._size and (self._size >= self.max_bytes or self.clock() - self._opened_at >= self.max_age):
+            self.rotate()
+        line = dumps(event) + b"\n"
+        self._file.write(line)
+        self._size += len(line)
+
+    def flush(self):
+        self._file.flush()
+
+    def rotate(self) -> Optional[str]:
+        """Close this process's active file as a segment and start a new one"""
+        self._file.close()
+        segment = self._seal(self.path, self._pid)
+        self._open()
+        return segment
+
+    def _seal(self, path: str, pid: int) -> Optional[str]:
+        """Rename an active file to a segment, compress it and prune old segments"""
+        if not os.path.getsize(path):
+            return None
+        stamp = datetime.utcfromtimestamp(self.clock()).strftime("%Y%m%dT%H%M%S.%f")
+        segment = os.path.join(self.directory, f"{self.basename}-{stamp}.{pid}{ACTIVE_SUFFIX}")
+        os.replace(path, segment)
+        if self.compress:
+            with open(segment, "rb") as src, gzip.open(segment + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(segment)
+            segment += ".gz"
+        for old in list_segments(self.directory, self.basename)[:-self.max_segments or None]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass  # Pruned by another worker
+        return segment
+
+    def _rotate_orphans(self):
+        for path in list_active(self.directory, self.basename):
+            pid = int(path.rsplit(".", 2)[1])
+            if pid == self._pid or _process_alive(pid):
+                continue
+            claimed = f"{path}.{self._pid}.claim"
+            try:
+                os.replace(path, claimed)  # Only one new worker wins the rename
+            except FileNotFoundError:
+                continue
+            self._seal(claimed, pid)
+
+    def close(self):
+        self._file.close()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class EventSinkHandler(logging.Handler):
+    """Logging handler that writes the `event` dict attached to a record
+
+    EventLogger passes its event through `extra={"event": ...}`, so events
+    ride the same queue and listener thread as the text log. Records
+    without an event are ignored.
+    """
+
+    def __init__(self, sink: EventSink):
+        super().__init__()
+        self.sink = sink
+
+    def emit(self, record: logging.LogRecord):
+        event = getattr(record, "event", None)
+        if event is None:
+            return
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            event = {**event, "trace_id": trace_id}
+        try:
+            self.sink.write(event)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+        super().close()
+
+
+def list_segments(directory: str, basename: str = "events") -> List[str]:
+    """Rotated segments of every process, oldest first (names sort by rotation time)"""
+    if not os.path.isdir(directory):
+        return []
+    prefix = basename + "-"
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith(prefix) and name.endswith((SEGMENT_SUFFIX, ACTIVE_SUFFIX))
+    )
+
+
+def list_active(directory: str, basename: str = "events") -> List[str]:
+    """Files still being appended to, one per process (`<basename>.<pid>.ndjson`)"""
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile(re.escape(basename) + r"\.\d+" + re.escape(ACTIVE_SUFFIX) + "$")
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if pattern.match(name))
+
+
+def iter_events(directory: str, basename: str = "events", since: Optional[str] = None,
+                **filters) -> Iterator[Dict]:
+    """Stream events from every segment, then every process's active file
+
+    Segments are read in rotation order; events of different workers are
+    not merged by timestamp.
+
+    `filters` match top-level fields exactly (event="gmail_api_call",
+    user=...); `since` is an ISO timestamp compared against "timestamp".
+    """
+    for path in list_segments(directory, basename) + list_active(directory, basename):
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            f = opener(path, "rb")
+        except FileNotFoundError:
+            continue  # Rotated away while listing
+        with f:
+            for line in f:
+                try:
+                    event = orjson.loads(line) if orjson is not None else json.loads(line)
+                except ValueError:
+                    continue  # Torn last line of a segment that was being written
+                if since and event.get("timestamp", "") < since:
+                    continue
+                if all(event.get(field) == value for field, value in filters.items()):
+                    yield event
+
+
+def summarize(events: Iterator[Dict], group_by: str) -> Dict[str, Dict]:
+    """Count events and failures per value of `group_by`"""
+    groups = defaultdict(lambda: {"count": 0, "failures": 0})
+    for event in events:
+        group = groups[str(event.get(group_by))]
+        group["count"] += 1
+        if event.get("success") is False:
+            group["failures"] += 1
+    return dict(groups)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Query the event log: python event_sink.py --event gmail_api_call --group-by operation"""
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Stream and summarize structured events")
+    parser.add_argument("--dir", default=settings.EVENT_LOG_DIR)
+    parser.add_argument("--event", help="event type, e.g. gmail_api_call")
+    parser.add_argument("--user")
+    parser.add_argument("--operation")
+    parser.add_argument("--trace-id", help="events of one request (X-Trace-Id response header)")
+    parser.add_argument("--since", help="ISO timestamp, e.g. 2025-01-01T00:00:00")
+    parser.add_argument("--failed", action="store_true", help="only unsuccessful events")
+    parser.add_argument("--group-by", help="print counts per value of this field instead of events")
+    args = parser.parse_args(argv)
+
+    filters = {field: getattr(args, field) for field in ("event", "user", "operation", "trace_id") if getattr(args, field)}
+    if args.failed:
+        filters["success"] = False
+    events = iter_events(args.dir, since=args.since, **filters)
+
+    if args.group_by:
+        groups = summarize(events, args.group_by)
+        print(f"{args.group_by:<32} {'count':>8} {'failed':>8}")
+        for value, group in sorted(groups.items(), key=lambda item: -item[1]["count"]):
+            print(f"{value:<32} {group['count']:>8} {group['failures']:>8}")
+    else:
+        for event in events:
+            sys.stdout.write(dumps(event).decode() + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Async Gmail Transport
+Executes Gmail API requests on a shared, pooled httpx.AsyncClient
+"""
+import asyncio
+import json
+import uuid
+from email.parser import BytesParser
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+import httplib2
+from googleapiclient.errors import HttpError
+
+from config import settings
+from metrics import GMAIL_LATENCY, track
+from tracing import span
+
+
+class _Transport:
+    """Connection pool and concurrency limit shared by every request on one event loop"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.client = httpx.AsyncClient(
+            timeout=settings.GMAIL_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.GMAIL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GMAIL_MAX_CONNECTIONS,
+                keepalive_expiry=60
+            )
+        )
+        self.semaphore = asyncio.Semaphore(settings.GMAIL_MAX_CONCURRENCY)
+
+
+# One transport per event loop: httpx connections belong to the loop that opened them
+_transports: Dict[asyncio.AbstractEventLoop, _Transport] = {}
+
+
+async def _get_transport() -> _Transport:
+    """Return the running loop's transport, creating it on first use
+
+    Transports left behind by loops that have since closed (e.g. earlier
+    asyncio.run calls) are closed and dropped at that point.
+    """
+    loop = asyncio.get_running_loop()
+    transport = _transports.get(loop)
+    if transport is None:
+        for stale in [t for t in list(_transports.values()) if t.loop.is_closed()]:
+            _transports.pop(stale.loop, None)
+            await _close_transport(stale)
+        transport = _transports[loop] = _Transport(loop)
+    return transport
+
+
+async def _close_transport(transport: _Transport):
+    """aclose() a transport's pool, on its own loop when that loop is running elsewhere"""
+    try:
+        if transport.loop.is_running() and transport.loop is not asyncio.get_running_loop():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(transport.client.aclose(), transport.loop))
+        else:
+            await transport.client.aclose()
+    except RuntimeError:
+        pass  # Its loop is closed: the sockets are shut, only the loop callbacks fail
+
+
+async def close_http_client():
+    """Close every loop's connection pool (called on application shutdown)"""
+    while _transports:
+        _, transport = _transports.popitem()
+        await _close_transport(transport)
+
+
+def _raise_for_status(status: int, content: bytes, uri: str):
+    """Raise googleapiclient's HttpError so callers keep their existing error handling"""
+    if status >= 300:
+        raise HttpError(httplib2.Response({"status": status}), content, uri=uri)
+
+
+class AsyncGmailClient:
+    """Send discovery-built Gmail requests without blocking a thread
+
+    Requests are still described by googleapiclient (`service.users()...`),
+    which only builds the URI, method, headers and body; the network round
+    trip happens here on the shared httpx pool.
+    """
+
+    def __init__(self, access_token: str):
+        self.access_token = access_token
+
+    def _headers(self, request) -> Dict[str, str]:
+        headers = dict(request.headers)
+        headers["authorization"] = f"Bearer {self.access_token}"
+        return headers
+
+    async def execute(self, request) -> Dict:
+        """Execute a single googleapiclient HttpRequest and return the decoded JSON"""
+        transport = await _get_transport()
+        async with transport.semaphore:
+            method = getattr(request, "methodId", None) or "unknown"
+            with span(method), track(GMAIL_LATENCY, method=method):
+                response = await transport.client.request(
+                    request.method,
+                    request.uri,
+                    content=request.body,
+                    headers=self._headers(request)
+                )
+                _raise_for_status(response.status_code, response.content, request.uri)
+        return response.json() if response.content else {}
+
+    async def execute_batch(self, requests: List, batch_uri: str) -> List[Dict]:
+        """Execute requests as one multipart/mixed call to the Gmail batch endpoint
+
+        Results are returned in the order of `requests`; the first failed
+        sub-request raises HttpError.
+        """
+        if not requests:
+            return []
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for index, request in enumerate(requests):
+            parsed = urlparse(request.uri)
+            path = f"{parsed.path}?{parsed.query}" if parsed.query else parsed.path
+            inner = f"{request.method} {path} HTTP/1.1\r\n"
+            if request.body:
+                inner += f"Content-Type: application/json\r\n\r\n{request.body}"
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <item{index}>\r\n\r\n"
+                f"{inner}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+
+        transport = await _get_transport()
+        async with transport.semaphore:
+            with span("gmail.batch", requests=len(requests)), track(GMAIL_LATENCY, method="batch"):
+                response = await transport.client.post(
+                    batch_uri,
+                    content="".join(parts).encode("utf-8"),
+                    headers={
+                        "authorization": f"Bearer {self.access_token}",
+                        "content-type": f"multipart/mixed; boundary={boundary}"
+                    }
+                )
+                _raise_for_status(response.status_code, response.content, batch_uri)
+
+        return self._parse_batch_response(response, requests)
+
+    def _parse_batch_response(self, response: httpx.Response, requests: List) -> List[Dict]:
+        """Split a multipart/mixed batch response back into per-request results"""
+        header = f"Content-Type: {response.headers['content-type']}\r\n\r\n".encode()
+        mime = BytesParser().parsebytes(header + response.content)
+
+        results: List[Optional[Dict]] = [None] * len(requests)
+        for part in mime.get_payload():
+            content_id = part["Content-ID"].strip("<>")
+            index = int(content_id.rsplit("item", 1)[1])
+            payload = part.get_payload(decode=True) or b""
+            status_line, _, rest = payload.partition(b"\n")
+            status = int(status_line.split()[1])
+            body = rest.split(b"\r\n\r\n", 1)[-1] if b"\r\n\r\n" in rest else rest.split(b"\n\n", 1)[-1]
+            _raise_for_status(status, body, requests[index].uri)
+            results[index] = json.loads(body) if body.strip() else {}
+
+        return results
@@ -3,92 +3,281 @@ import email
 from email.mime.text import MIMEText
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 import asyncio
-from functools import wraps
 import re
+import threading
 from html import unescape
+import httplib2
+from gmail_client import AsyncGmailClient
+from cache_utils import TTLCache
+from config import settings
 
 
-def async_wrap(func):
-    """Wrapper to run synchronous Google API calls in async context"""
-    @wraps(func)
-    async def run(*args, **kwargs):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
-    return run
+# Discovery-based resources, built once per API endpoint. Building one parses
+# the Gmail discovery document, which is far too slow for the request path.
+_resources: Dict[str, object] = {}
+_resources_lock = threading.Lock()
+
+# Per-token client bindings. Google access tokens live for an hour, so entries
+# expire a little before that.
+_clients = TTLCache(maxsize=1024, ttl=55 * 60)
+
+
+def get_gmail_resource():
+    """Return the shared Gmail API resource, building it on first use"""
+    endpoint = settings.GMAIL_API_ENDPOINT
+    resource = _resources.get(endpoint)
+    if resource is None:
+        with _resources_lock:
+            resource = _resources.get(endpoint)
+            if resource is None:
+                client_options = {"api_endpoint": endpoint} if endpoint else None
+                # Credentials are attached per request by AsyncGmailClient, so
+                # the resource is built with a bare http object instead
+                resource = build('gmail', 'v1', http=httplib2.Http(), client_options=client_options)
+                _resources[endpoint] = resource
+    return resource
+
+
+def warm_up():
+    """Build the Gmail API resource ahead of the first request"""
+    get_gmail_resource()
+
+
+class HistoryExpiredError(Exception):
+    """The historyId checkpoint is too old for users.history.list"""
 
 
 class GmailService:
+    # Gmail rejects batches above 100 calls and rate-limits large ones,
+    # so keep each batch well below that
+    BATCH_SIZE = 50
+    
+    # Request parameters per fetch projection. "metadata" returns only the
+    # headers we display plus the snippet; "body" is used to lazily fill in
+    # bodies for messages first fetched as metadata.
+    PROJECTIONS = {
+        "full": {"format": "full"},
+        "metadata": {
+            "format": "metadata",
+            "metadataHeaders": ["Subject", "From", "Date"],
+            "fields": "id,threadId,labelIds,snippet,historyId,internalDate,payload/headers"
+        },
+        "body": {
+            "format": "full",
+            "fields": "id,payload(mimeType,body/data,parts)"
+        }
+    }
+    
     def __init__(self, access_token: str):
         self.access_token = access_token
         self.service = None
+        self.client = _clients.get_or_create(access_token, lambda: AsyncGmailClient(access_token))
     
     def _get_service(self):
-        """Initialize Gmail API service"""
+        """Return the process-wide Gmail API resource
+        
+        The resource is only used to build requests; they are sent by
+        AsyncGmailClient on the shared httpx pool.
+        """
         if not self.service:
-            from google.oauth2.credentials import Credentials
-            from config import settings
-            
-            # Create credentials with proper configuration
-            creds = Credentials(
-                token=self.access_token,
-                refresh_token=None,
-                token_uri="https://oauth2.googleapis.com/token",
-                client_id=settings.GOOGLE_CLIENT_ID,
-                client_secret=settings.GOOGLE_CLIENT_SECRET,
-                scopes=settings.GOOGLE_SCOPES
-            )
-            self.service = build('gmail', 'v1', credentials=creds)
+            self.service = get_gmail_resource()
         return self.service
     
-    @async_wrap
-    def get_recent_emails(self, max_results: int = 5) -> List[Dict]:
-        """Fetch recent emails from inbox"""
+    def _get_batch_uri(self) -> str:
+        """Gmail batch endpoint, honouring a custom API endpoint if configured"""
+        base = settings.GMAIL_API_ENDPOINT or "https://gmail.googleapis.com/"
+        return base.rstrip('/') + '/batch/gmail/v1'
+    
+    async def get_recent_emails(self, max_results: int = 5, batch: bool = True,
+                                projection: str = "full") -> List[Dict]:
+        """Fetch recent emails from inbox
+        
+        With batch=True the messages are fetched through the Gmail batch
+        endpoint, so a page of N messages costs one list call plus
+        ceil(N / BATCH_SIZE) batch calls. With batch=False they are fetched as
+        concurrent gets over the pooled keep-alive connections.
+        
+        projection="metadata" skips the MIME tree; the returned emails then
+        have body=None until passed through load_bodies().
+        """
         try:
-            service = self._get_service()
-            
-            # Get list of messages
-            results = service.users().messages().list(
-                userId='me',
-                labelIds=['INBOX'],
-                maxResults=max_results
-            ).execute()
-            
-            messages = results.get('messages', [])
-            emails = []
-            
-            for msg in messages:
-                # Get full message details
-                message = service.users().messages().get(
-                    userId='me',
-                    id=msg['id'],
-                    format='full'
-                ).execute()
-                
-                # Extract headers
-                headers = message['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-                sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-                date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
-                
-                # Extract body
-                body = self._get_email_body(message['payload'])
-                
-                emails.append({
-                    'id': message['id'],
-                    'thread_id': message['threadId'],
-                    'sender': sender,
-                    'subject': subject,
-                    'date': date,
-                    'body': body,
-                    'snippet': message.get('snippet', '')
-                })
-            
-            return emails
+            ids = await self.list_message_ids(max_results)
+            messages = await self.get_messages(ids, batch=batch, projection=projection)
+            return [self._parse_message(message) for message in messages]
         except HttpError as error:
             raise Exception(f"Gmail API error: {error}")
     
+    async def list_message_ids(self, max_results: int = 5, label: str = 'INBOX') -> List[str]:
+        """List the IDs of the newest messages carrying a label"""
+        service = self._get_service()
+        results = await self.client.execute(service.users().messages().list(
+            userId='me',
+            labelIds=[label],
+            maxResults=max_results
+        ))
+        return [msg['id'] for msg in results.get('messages', [])]
+    
+    async def get_history_id(self) -> str:
+        """The mailbox's current historyId (users.getProfile)"""
+        service = self._get_service()
+        profile = await self.client.execute(service.users().getProfile(userId='me'))
+        return profile['historyId']
+    
+    async def get_messages(self, ids: List[str], batch: bool = True,
+                           projection: str = "full") -> List[Dict]:
+        """Fetch Gmail message resources for a projection, in the order of ids"""
+        service = self._get_service()
+        params = self.PROJECTIONS[projection]
+        requests = [
+            service.users().messages().get(userId='me', id=message_id, **params)
+            for message_id in ids
+        ]
+        
+        if not batch:
+            return list(await asyncio.gather(
+                *(self.client.execute(request) for request in requests)
+            ))
+        
+        full_messages = []
+        for start in range(0, len(requests), self.BATCH_SIZE):
+            full_messages.extend(await self.client.execute_batch(
+                requests[start:start + self.BATCH_SIZE],
+                self._get_batch_uri()
+            ))
+        return full_messages
+    
+    async def iter_messages(self, label: str = 'INBOX', query: Optional[str] = None,
+                            page_size: int = 100, projection: str = "metadata",
+                            read_ahead: int = 100, limit: Optional[int] = None) -> AsyncIterator[Dict]:
+        """Stream parsed messages across every page of messages.list
+        
+        A background task follows nextPageToken and fetches each page in
+        batches, staying at most `read_ahead` messages ahead of the consumer,
+        so walking a large mailbox runs in constant memory. Breaking out of
+        the loop (or stopping after `limit` messages) cancels the fetcher.
+        
+            async for email in gmail_service.iter_messages(limit=5000):
+                ...
+        """
+        service = self._get_service()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=read_ahead)
+        done = object()
+        
+        async def produce():
+            try:
+                page_token = None
+                remaining = limit
+                while remaining is None or remaining > 0:
+                    page = min(page_size, remaining) if remaining is not None else page_size
+                    results = await self.client.execute(service.users().messages().list(
+                        userId='me',
+                        labelIds=[label],
+                        q=query,
+                        maxResults=page,
+                        pageToken=page_token
+                    ))
+                    ids = [msg['id'] for msg in results.get('messages', [])]
+                    if remaining is not None:
+                        ids = ids[:remaining]
+                        remaining -= len(ids)
+                    
+                    for start in range(0, len(ids), self.BATCH_SIZE):
+                        chunk = ids[start:start + self.BATCH_SIZE]
+                        for message in await self.get_messages(chunk, projection=projection):
+                            await queue.put(self._parse_message(message))
+                    
+                    page_token = results.get('nextPageToken')
+                    if not page_token:
+                        break
+                await queue.put(done)
+            except Exception as error:
+                await queue.put(error)
+        
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    return
+                if isinstance(item, HttpError):
+                    raise Exception(f"Gmail API error: {item}")
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+    
+    async def get_history(self, start_history_id: str) -> Dict:
+        """List mailbox changes since a historyId checkpoint
+        
+        Returns {"history": [records...], "history_id": latest checkpoint}.
+        Raises HistoryExpiredError when Gmail no longer has history that old
+        and the caller must fall back to a full sync.
+        """
+        service = self._get_service()
+        records = []
+        page_token = None
+        try:
+            while True:
+                results = await self.client.execute(service.users().history().list(
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+                    pageToken=page_token
+                ))
+                records.extend(results.get('history', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as error:
+            if error.resp.status == 404:
+                raise HistoryExpiredError(start_history_id)
+            raise
+        
+        return {"history": records, "history_id": results.get('historyId', start_history_id)}
+    
+    async def load_bodies(self, emails: List[Dict]) -> List[Dict]:
+        """Fill in body for emails fetched with the metadata projection
+        
+        Only emails whose body is still None are fetched, in one batch.
+        """
+        missing = [e for e in emails if e.get('body') is None]
+        if missing:
+            try:
+                messages = await self.get_messages([e['id'] for e in missing], projection="body")
+            except HttpError as error:
+                raise Exception(f"Gmail API error: {error}")
+            for email_dict, message in zip(missing, messages):
+                email_dict['body'] = self._get_email_body(message['payload'])
+        return emails
+    
+    def _parse_message(self, message: Dict) -> Dict:
+        """Convert a Gmail API message resource into our email dict
+        
+        Metadata-only resources carry no MIME body, so body is left as None.
+        """
+        # Extract headers
+        headers = message['payload']['headers']
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
+        date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+        
+        # Extract body
+        payload = message['payload']
+        body = self._get_email_body(payload) if ('body' in payload or 'parts' in payload) else None
+        
+        return {
+            'id': message['id'],
+            'thread_id': message['threadId'],
+            'sender': sender,
+            'subject': subject,
+            'date': date,
+            'body': body,
+            'snippet': message.get('snippet', '')
+        }
+    
     def _strip_html(self, html_content: str) -> str:
         """Strip HTML tags and return clean text"""
         if not html_content:
@@ -141,18 +330,17 @@ class GmailService:
         
         return body or "No content available"
     
-    @async_wrap
-    def send_reply(self, email_id: str, reply_content: str) -> Dict:
+    async def send_reply(self, email_id: str, reply_content: str) -> Dict:
         """Send a reply to an email"""
         try:
             service = self._get_service()
             
             # Get original message
-            original_message = service.users().messages().get(
+            original_message = await self.client.execute(service.users().messages().get(
                 userId='me',
                 id=email_id,
                 format='full'
-            ).execute()
+            ))
             
             # Extract headers from original
             headers = original_message['payload']['headers']
@@ -175,46 +363,44 @@ class GmailService:
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
             
             # Send message
-            sent_message = service.users().messages().send(
+            sent_message = await self.client.execute(service.users().messages().send(
                 userId='me',
                 body={
                     'raw': raw_message,
                     'threadId': original_message['threadId']
                 }
-            ).execute()
+            ))
             
             return {'message_id': sent_message['id']}
         except HttpError as error:
             raise Exception(f"Failed to send reply: {error}")
     
-    @async_wrap
-    def delete_email_by_id(self, email_id: str) -> Dict:
+    async def delete_email_by_id(self, email_id: str) -> Dict:
         """Delete email by ID"""
         try:
             service = self._get_service()
             
-            service.users().messages().trash(
+            await self.client.execute(service.users().messages().trash(
                 userId='me',
                 id=email_id
-            ).execute()
+            ))
             
             return {'deleted_id': email_id}
         except HttpError as error:
             raise Exception(f"Failed to delete email: {error}")
     
-    @async_wrap
-    def delete_email_by_sender(self, sender: str) -> Dict:
+    async def delete_email_by_sender(self, sender: str) -> Dict:
         """Delete latest email from specific sender"""
         try:
             service = self._get_service()
             
             # Search for emails from sender
             query = f"from:{sender}"
-            results = service.users().messages().list(
+            results = await self.client.execute(service.users().messages().list(
                 userId='me',
                 q=query,
                 maxResults=1
-            ).execute()
+            ))
             
             messages = results.get('messages', [])
             if not messages:
@@ -222,28 +408,27 @@ class GmailService:
             
             # Delete the first (most recent) email
             email_id = messages[0]['id']
-            service.users().messages().trash(
+            await self.client.execute(service.users().messages().trash(
                 userId='me',
                 id=email_id
-            ).execute()
+            ))
             
             return {'deleted_id': email_id, 'sender': sender}
         except HttpError as error:
             raise Exception(f"Failed to delete email by sender: {error}")
     
-    @async_wrap
-    def delete_email_by_subject(self, subject_keyword: str) -> Dict:
+    async def delete_email_by_subject(self, subject_keyword: str) -> Dict:
         """Delete email by subject keyword"""
         try:
             service = self._get_service()
             
             # Search for emails with subject keyword
             query = f"subject:{subject_keyword}"
-            results = service.users().messages().list(
+            results = await self.client.execute(service.users().messages().list(
                 userId='me',
                 q=query,
                 maxResults=1
-            ).execute()
+            ))
             
             messages = results.get('messages', [])
             if not messages:
@@ -251,10 +436,10 @@ class GmailService:
             
             # Delete the first email found
             email_id = messages[0]['id']
-            service.users().messages().trash(
+            await self.client.execute(service.users().messages().trash(
                 userId='me',
                 id=email_id
-            ).execute()
+            ))
             
             return {'deleted_id': email_id, 'subject_keyword': subject_keyword}
         except HttpError as error:
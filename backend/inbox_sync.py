@@ -0,0 +1,149 @@
+"""
+Incremental Inbox Sync
+Keeps a per-user local copy of recent INBOX messages up to date through the
+Gmail history API, so routes stop re-downloading the same messages
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+from cache_utils import TTLCache
+from gmail_service import GmailService, HistoryExpiredError
+
+logger = logging.getLogger(__name__)
+
+
+class Mailbox:
+    """One user's locally stored INBOX messages and sync checkpoint"""
+
+    def __init__(self):
+        self.history_id: Optional[str] = None
+        self.messages: Dict[str, Dict] = {}  # message id -> parsed email dict
+        self.internal_dates: Dict[str, int] = {}
+        self.depth = 0  # how many messages the last full sync asked for
+        self.exhausted = False  # the last full sync returned the whole inbox
+        self.lock = asyncio.Lock()
+
+    def put(self, message: Dict, parsed: Dict):
+        self.messages[message['id']] = parsed
+        self.internal_dates[message['id']] = int(message.get('internalDate', 0))
+
+    def remove(self, message_id: str):
+        self.messages.pop(message_id, None)
+        self.internal_dates.pop(message_id, None)
+
+    def recent(self, count: int) -> List[Dict]:
+        """Newest `count` messages, copied so callers can annotate them freely"""
+        newest = sorted(self.messages, key=lambda mid: self.internal_dates[mid], reverse=True)
+        return [dict(self.messages[mid]) for mid in newest[:count]]
+
+    def trim(self, limit: int):
+        """Drop the oldest messages beyond `limit`"""
+        if len(self.messages) <= limit:
+            return
+        newest = sorted(self.messages, key=lambda mid: self.internal_dates[mid], reverse=True)
+        for message_id in newest[limit:]:
+            self.remove(message_id)
+        self.exhausted = False
+
+
+class InboxSync:
+    """Sync engine serving recent emails from a local, per-user message store
+
+    The first request for a user does a full sync (list + batched get) and
+    records the mailbox historyId read just before listing. Later requests call
+    users.history.list once and only fetch messages that were added to the
+    INBOX since the checkpoint.
+    """
+
+    MAX_MESSAGES_PER_USER = 100
+
+    def __init__(self, max_users: int = 1000):
+        self.store = TTLCache(maxsize=max_users)
+
+    def _mailbox(self, user_id: str) -> Mailbox:
+        return self.store.get_or_create(user_id, Mailbox)
+
+    async def get_recent_emails(self, user_id: str, gmail_service: GmailService, count: int = 5,
+                                with_bodies: bool = True) -> List[Dict]:
+        """Return the newest `count` INBOX emails, syncing the local store first
+
+        Messages are synced as metadata only. Bodies are fetched lazily for the
+        returned emails when with_bodies is set, and kept in the store since
+        message bodies never change; otherwise body is None.
+        """
+        count = min(count, self.MAX_MESSAGES_PER_USER)
+        mailbox = self._mailbox(user_id)
+
+        async with mailbox.lock:
+            if mailbox.history_id is not None:
+                try:
+                    await self._incremental_sync(mailbox, gmail_service)
+                except HistoryExpiredError:
+                    logger.info(f"History checkpoint expired for {user_id}, running full sync")
+                    mailbox.history_id = None
+
+            if mailbox.history_id is None or (len(mailbox.messages) < count and not mailbox.exhausted):
+                await self._full_sync(mailbox, gmail_service, max(count, mailbox.depth))
+
+            emails = mailbox.recent(count)
+            if with_bodies:
+                await gmail_service.load_bodies(emails)
+                for email in emails:
+                    mailbox.messages[email['id']]['body'] = email['body']
+            return emails
+
+    def invalidate(self, user_id: str):
+        """Forget a user's local store (e.g. on logout)"""
+        self.store.pop(user_id)
+
+    async def _full_sync(self, mailbox: Mailbox, gmail_service: GmailService, count: int):
+        # Checkpoint before listing: changes made while we list are replayed
+        # by the next incremental sync instead of being skipped
+        history_id = await gmail_service.get_history_id()
+        ids = await gmail_service.list_message_ids(max_results=count)
+        messages = await gmail_service.get_messages(ids, projection="metadata")
+
+        mailbox.messages.clear()
+        mailbox.internal_dates.clear()
+        for message in messages:
+            mailbox.put(message, gmail_service._parse_message(message))
+        mailbox.depth = count
+        mailbox.exhausted = len(ids) < count
+        mailbox.history_id = history_id
+
+    async def _incremental_sync(self, mailbox: Mailbox, gmail_service: GmailService):
+        changes = await gmail_service.get_history(mailbox.history_id)
+
+        to_fetch: Set[str] = set()
+        for record in changes['history']:
+            for added in record.get('messagesAdded', []):
+                if 'INBOX' in added['message'].get('labelIds', []):
+                    to_fetch.add(added['message']['id'])
+            for deleted in record.get('messagesDeleted', []):
+                to_fetch.discard(deleted['message']['id'])
+                mailbox.remove(deleted['message']['id'])
+            for labelled in record.get('labelsAdded', []):
+                message_id = labelled['message']['id']
+                if 'INBOX' in labelled['labelIds']:
+                    to_fetch.add(message_id)
+                if {'TRASH', 'SPAM'} & set(labelled['labelIds']):
+                    to_fetch.discard(message_id)
+                    mailbox.remove(message_id)
+            for unlabelled in record.get('labelsRemoved', []):
+                if 'INBOX' in unlabelled['labelIds']:
+                    to_fetch.discard(unlabelled['message']['id'])
+                    mailbox.remove(unlabelled['message']['id'])
+
+        to_fetch -= set(mailbox.messages)
+        if to_fetch:
+            for message in await gmail_service.get_messages(sorted(to_fetch), projection="metadata"):
+                if 'INBOX' in message.get('labelIds', []):
+                    mailbox.put(message, gmail_service._parse_message(message))
+            mailbox.trim(self.MAX_MESSAGES_PER_USER)
+
+        mailbox.history_id = changes['history_id']
+
+
+# Singleton instance
+inbox_sync = InboxSync()
@@ -0,0 +1,343 @@
+"""
+Local Intent Classifier
+Fast-path command parsing that answers obvious chatbot commands in
+microseconds, so only ambiguous input is sent to the LLM
+"""
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ACTIONS = [
+    "read_emails",
+    "generate_replies",
+    "send_reply",
+    "delete_email",
+    "categorize_inbox",
+    "daily_digest",
+    "unknown"
+]
+
+# Labeled commands the classifier is trained on at first use
+TRAINING_COMMANDS = [
+    ("read emails", "read_emails"),
+    ("read my emails", "read_emails"),
+    ("show me my emails", "read_emails"),
+    ("show latest emails", "read_emails"),
+    ("show recent emails", "read_emails"),
+    ("fetch my inbox", "read_emails"),
+    ("display recent messages", "read_emails"),
+    ("what's in my inbox", "read_emails"),
+    ("any new mail", "read_emails"),
+    ("do i have new emails", "read_emails"),
+    ("check my mail", "read_emails"),
+    ("list the last 10 emails", "read_emails"),
+    ("emails from alice", "read_emails"),
+    ("find emails about invoices", "read_emails"),
+    ("show me the last few important emails about invoices", "read_emails"),
+    ("open my latest messages", "read_emails"),
+    ("what did i get today", "read_emails"),
+    ("anything new in my mailbox", "read_emails"),
+    ("let me see my recent mail", "read_emails"),
+    ("pull up my inbox", "read_emails"),
+    ("generate replies", "generate_replies"),
+    ("generate replies for these emails", "generate_replies"),
+    ("draft responses to my emails", "generate_replies"),
+    ("write replies for me", "generate_replies"),
+    ("create reply drafts", "generate_replies"),
+    ("suggest some replies", "generate_replies"),
+    ("help me respond to these", "generate_replies"),
+    ("compose answers to my emails", "generate_replies"),
+    ("can you draft replies", "generate_replies"),
+    ("ai replies please", "generate_replies"),
+    ("how should i respond to these emails", "generate_replies"),
+    ("prepare responses", "generate_replies"),
+    ("reply to john that i will get back tomorrow", "send_reply"),
+    ("send reply to email 1", "send_reply"),
+    ("send the reply to email 2", "send_reply"),
+    ("respond to sarah saying the meeting is confirmed", "send_reply"),
+    ("tell bob i will be late", "send_reply"),
+    ("answer email 3 with thanks", "send_reply"),
+    ("send it", "send_reply"),
+    ("send that reply", "send_reply"),
+    ("reply to the first email saying yes", "send_reply"),
+    ("let mike know i approve", "send_reply"),
+    ("write back to anna that it works", "send_reply"),
+    ("send a reply to email 4", "send_reply"),
+    ("delete email 2", "delete_email"),
+    ("delete the email from john", "delete_email"),
+    ("remove this message", "delete_email"),
+    ("trash the email from amazon", "delete_email"),
+    ("delete all promotional emails", "delete_email"),
+    ("get rid of the newsletter", "delete_email"),
+    ("remove the email about the sale", "delete_email"),
+    ("bin email 1", "delete_email"),
+    ("throw away the spam from linkedin", "delete_email"),
+    ("delete the last message", "delete_email"),
+    ("erase email 5", "delete_email"),
+    ("discard the email with subject invoice", "delete_email"),
+    ("categorize my inbox", "categorize_inbox"),
+    ("categorize emails", "categorize_inbox"),
+    ("group my emails", "categorize_inbox"),
+    ("sort my inbox into categories", "categorize_inbox"),
+    ("organize my mail", "categorize_inbox"),
+    ("classify my emails", "categorize_inbox"),
+    ("which emails are work and which are personal", "categorize_inbox"),
+    ("split my inbox by type", "categorize_inbox"),
+    ("bucket my messages", "categorize_inbox"),
+    ("put my emails into folders", "categorize_inbox"),
+    ("what kinds of emails do i have", "categorize_inbox"),
+    ("break down my inbox", "categorize_inbox"),
+    ("give me today's digest", "daily_digest"),
+    ("give me today's email digest", "daily_digest"),
+    ("daily digest", "daily_digest"),
+    ("summarize my day", "daily_digest"),
+    ("summarize my inbox", "daily_digest"),
+    ("what happened in my inbox today", "daily_digest"),
+    ("give me a summary of today's emails", "daily_digest"),
+    ("brief me on my emails", "daily_digest"),
+    ("morning briefing", "daily_digest"),
+    ("catch me up on email", "daily_digest"),
+    ("overview of my inbox today", "daily_digest"),
+    ("what's important today", "daily_digest"),
+    ("hello", "unknown"),
+    ("what's the weather like", "unknown"),
+    ("tell me a joke", "unknown"),
+    ("who are you", "unknown"),
+    ("thanks", "unknown"),
+    ("what can you do", "unknown"),
+    ("book a flight to paris", "unknown"),
+    ("set an alarm for 7am", "unknown"),
+    ("how old are you", "unknown"),
+    ("play some music", "unknown"),
+    ("what time is it", "unknown"),
+    ("good morning", "unknown")
+]
+
+_POLITE_PREFIX = re.compile(
+    r"^(?:(?:please|pls|hey|hi|ok|okay|can you|could you|would you|i want to|i'd like to|i need to|help me)[,!\s]+)+",
+    re.IGNORECASE
+)
+_POLITE_SUFFIX = re.compile(r"[,\s]+(?:please|pls)$", re.IGNORECASE)
+
+# A sender is an address or a single name, never a determiner or time word
+# ("from last week", "from my boss")
+_NOT_A_NAME = (
+    "last|latest|this|that|these|those|my|me|the|a|an|any|all|every|today|yesterday|tomorrow|"
+    "week|month|year|work|home|everyone|anyone|someone|him|her|them|us|you|it|your|our"
+)
+_SENDER_VALUE = rf"(?:[\w.+-]+@[\w-]+(?:\.[\w-]+)+|(?!(?:{_NOT_A_NAME})\b)[A-Za-z][\w'-]*)"
+_CLAUSE_END = r"(?=\s*$|\s+(?:about|regarding|subject|titled|with|that|saying|today|yesterday)\b)"
+_SENDER = re.compile(rf"\bfrom\s+({_SENDER_VALUE}){_CLAUSE_END}", re.IGNORECASE)
+_COUNT = re.compile(r"\b(?:last|latest|recent|top|first)\s+(\d{1,3})\b|\b(\d{1,3})\s+(?:emails|messages|mails)\b", re.IGNORECASE)
+_SUBJECT = re.compile(r"\b(?:about|regarding|subject|titled)\s+(?:the\s+)?([\w\s-]+?)\s*$", re.IGNORECASE)
+_EMAIL_NUMBER = re.compile(r"\b(?:email|message|mail)\s*#?\s*(\d{1,3})\b", re.IGNORECASE)
+_REPLY = re.compile(
+    rf"(?:reply|respond|write back|answer)\s+to\s+({_SENDER_VALUE})\s+(?:that|saying|with)\s+(.+)",
+    re.IGNORECASE
+)
+_REPLY_TO_EMAIL = re.compile(
+    r"(?:(?:send|write)\s+(?:a\s+|the\s+)?reply|reply|respond|answer)\s+(?:to\s+)?"
+    r"(?:email|message|mail)\s*#?\s*(\d{1,3})(?:\s+(?:that|saying|with)\s+(.+))?",
+    re.IGNORECASE
+)
+
+_EMAILS = r"(?:e?mails?|inbox|messages?)"
+_FROM = rf"(?:\s+from\s+{_SENDER_VALUE})?"
+_ABOUT = r"(?:\s+(?:about|regarding)\s+(?:the\s+)?[\w-]+(?:\s+[\w-]+){0,3})?"
+
+# (action, compiled rule, confidence) in priority order. Each rule must match
+# the whole normalized command, so input with words no rule accounts for
+# ("sort by date", "from last week") goes to the classifier or the LLM.
+_RULES = [
+    ("daily_digest", re.compile(
+        r"(?:(?:give|show|send|get)\s+me\s+)?(?:(?:a|the|my|today's|todays|daily|email|inbox)\s+){0,3}digest"
+        r"(?:\s+for\s+today)?|(?:morning|daily)\s+briefing",
+        re.IGNORECASE), 0.95),
+    ("send_reply", _REPLY, 0.9),
+    ("send_reply", _REPLY_TO_EMAIL, 0.9),
+    ("send_reply", re.compile(r"send\s+(?:the\s+|that\s+)?(?:reply|it)", re.IGNORECASE), 0.9),
+    ("delete_email", re.compile(
+        r"(?:delete|remove|trash|erase|bin|discard|get rid of)\s+(?:"
+        r"(?:email|message|mail)\s*#?\s*\d{1,3}"
+        rf"|(?:the|this|that)\s+(?:(?:last|latest|first)\s+)?(?:e?mail|message|newsletter){_FROM}{_ABOUT}"
+        rf"|(?:all\s+)?(?:the\s+)?(?:e?mails|messages)\s+from\s+{_SENDER_VALUE})",
+        re.IGNORECASE), 0.9),
+    ("categorize_inbox", re.compile(
+        rf"(?:categori[sz]e|group|sort|organi[sz]e|classify)(?:\s+(?:my|the|all))?\s+{_EMAILS}"
+        r"(?:\s+(?:by|into)\s+(?:categor(?:y|ies)|type|folders))?",
+        re.IGNORECASE), 0.9),
+    ("generate_replies", re.compile(
+        r"(?:generate|draft|write|create|suggest|compose|prepare)\s+(?:some\s+)?(?:ai\s+)?(?:repl(?:y|ies)|responses)"
+        rf"(?:\s+(?:to|for)\s+(?:my|these|the|all)(?:\s+(?:last|latest|recent|new))?(?:\s+{_EMAILS})?)?",
+        re.IGNORECASE), 0.9),
+    ("read_emails", re.compile(
+        r"(?:read|show|fetch|display|list|check|open|get)(?:\s+me)?(?:\s+(?:my|the))?"
+        rf"(?:\s+(?:last|latest|recent|newest|top|first|new))?(?:\s+\d{{1,3}})?(?:\s+(?:new|recent|latest))?"
+        rf"\s+{_EMAILS}{_FROM}{_ABOUT}",
+        re.IGNORECASE), 0.9)
+]
+
+_WORD = re.compile(r"[a-z0-9']+")
+# Words the classifier has seen; anything else in a command is left to the LLM
+_VOCABULARY = {word for text, _ in TRAINING_COMMANDS for word in _WORD.findall(text)}
+
+
+def _normalize(text: str) -> str:
+    """Collapse whitespace and drop trailing punctuation and polite prefixes/suffixes
+
+    Case is kept so extracted names and reply text read as the user typed
+    them; matching is case-insensitive.
+    """
+    text = re.sub(r"\s+", " ", text.strip()).rstrip("?.! ")
+    return _POLITE_SUFFIX.sub("", _POLITE_PREFIX.sub("", text))
+
+
+def extract_parameters(action: str, text: str) -> Dict:
+    """Pull the parameters the frontend understands out of a normalized command"""
+    params: Dict = {}
+    if action == "categorize_inbox":
+        return {"count": 20}
+    if action == "read_emails":
+        count = _COUNT.search(text)
+        params["count"] = int(count.group(1) or count.group(2)) if count else 5
+
+    number = _EMAIL_NUMBER.search(text)
+    if number and action in ("send_reply", "delete_email"):
+        params["email_id"] = number.group(1)
+
+    if action == "send_reply":
+        reply = _REPLY.fullmatch(text)
+        if reply:
+            params["sender"] = reply.group(1)
+            params["reply_content"] = reply.group(2)
+            return params
+        reply = _REPLY_TO_EMAIL.fullmatch(text)
+        if reply and reply.group(2):
+            params["reply_content"] = reply.group(2)
+            return params
+
+    sender = _SENDER.search(text)
+    if sender:
+        params["sender"] = sender.group(1)
+    subject = _SUBJECT.search(text)
+    if subject and action in ("read_emails", "delete_email"):
+        params["subject"] = subject.group(1).strip()
+    elif action == "read_emails" and "invoice" in text.lower():
+        params["subject"] = "invoice"
+    return params
+
+
+def _unparsed_words(text: str, params: Dict) -> set:
+    """Words of the command that are neither known to the classifier nor extracted as parameters"""
+    words = set(_WORD.findall(text.lower())) - _VOCABULARY
+    for value in params.values():
+        words -= set(_WORD.findall(str(value).lower()))
+    return words
+
+
+class HashedLogisticRegression:
+    """Multinomial logistic regression over hashed word unigrams and bigrams"""
+
+    def __init__(self, n_features: int = 2 ** 12, labels: List[str] = ACTIONS):
+        self.n_features = n_features
+        self.labels = labels
+        self.weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+        self.bias = np.zeros(len(labels), dtype=np.float32)
+
+    def _features(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"[a-z0-9']+", text.lower())
+            grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for gram in grams:
+                matrix[row, zlib.crc32(gram.encode()) % self.n_features] += 1.0
+            norm = np.linalg.norm(matrix[row])
+            if norm:
+                matrix[row] /= norm
+        return matrix
+
+    def fit(self, texts: List[str], labels: List[str], epochs: int = 300, lr: float = 2.0, l2: float = 1e-4):
+        X = self._features(texts)
+        y = np.zeros((len(labels), len(self.labels)), dtype=np.float32)
+        y[np.arange(len(labels)), [self.labels.index(label) for label in labels]] = 1.0
+        for _ in range(epochs):
+            probs = self._softmax(X @ self.weights + self.bias)
+            grad = (probs - y) / len(texts)
+            self.weights -= lr * (X.T @ grad + l2 * self.weights)
+            self.bias -= lr * grad.sum(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, text: str):
+        """Return (label, probability) for one text"""
+        probs = self._softmax(self._features([text]) @ self.weights + self.bias)[0]
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+
+class IntentClassifier:
+    """Tiered local parser: compiled rules first, then the hashed classifier
+
+    classify() returns a parse in the same shape as the LLM parser, or None
+    when neither tier is confident and the LLM should decide. Rules match
+    whole commands only; the classifier also defers when the command has
+    words it was never trained on that are not extracted parameters.
+    """
+
+    CONFIDENCE_THRESHOLD = 0.6
+
+    def __init__(self):
+        self._model: Optional[HashedLogisticRegression] = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> HashedLogisticRegression:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    texts, labels = zip(*TRAINING_COMMANDS)
+                    self._model = HashedLogisticRegression().fit(
+                        [_normalize(t) for t in texts], list(labels)
+                    )
+        return self._model
+
+    def warm_up(self):
+        """Train the classifier ahead of the first request"""
+        self.model
+
+    def classify(self, user_input: str) -> Optional[Dict]:
+        text = _normalize(user_input)
+        if not text:
+            return None
+
+        for action, rule, confidence in _RULES:
+            if rule.fullmatch(text):
+                return {
+                    "action": action,
+                    "parameters": extract_parameters(action, text),
+                    "confidence": confidence
+                }
+
+        action, probability = self.model.predict(text)
+        if action == "unknown" or probability < self.CONFIDENCE_THRESHOLD:
+            return None
+        parameters = extract_parameters(action, text)
+        if _unparsed_words(text, parameters):
+            return None
+        return {
+            "action": action,
+            "parameters": parameters,
+            "confidence": round(probability, 2)
+        }
+
+
+# Singleton instance
+intent_classifier = IntentClassifier()
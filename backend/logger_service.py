@@ -2,20 +2,197 @@
 Logging and Observability Service
 Tracks key events, errors, and metrics
 """
+import atexit
+import copy
 import logging
+import os
+import queue
+import threading
 from datetime import datetime
-from typing import Dict, Optional
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Dict, List, Optional
 import json
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
+from config import settings
+from event_sink import EventSink, EventSinkHandler
+from tracing import current_trace_id
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s%(trace)s'
+
+
+def worker_log_file(log_file: str) -> str:
+    """Per-process log path: app.log -> app.<pid>.log
+
+    RotatingFileHandler rotates on its own byte counter, so workers sharing one
+    file would rename it out from under each other. Like EventSink, each
+    process gets its own file and rotates only that.
+    """
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+class BatchFileHandler(RotatingFileHandler):
+    """Size-rotated file handler that leaves flushing to the listener, once per batch"""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """StreamHandler that leaves flushing to the listener, once per batch"""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hand records to a bounded queue without blocking the caller
+
+    When the queue is full, INFO and below are dropped at once; WARNING and
+    above wait up to `block_timeout` seconds for space (backpressure)
+    before being dropped. Dropped records are counted and reported by the
+    listener.
+    """
+
+    def __init__(self, log_queue: queue.Queue, block_timeout: float = 0.05):
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Enqueue a copy: other handlers on the logger still see the
+        # caller's record untouched
+        record = copy.copy(record)
+        # Merge args now, as QueueHandler.prepare does, so mutable args
+        # are captured as they were at the call
+        record.msg = record.getMessage()
+        record.args = None
+        # The request's trace ID is read here, on the caller's context
+        record.trace_id = current_trace_id()
+        record.trace = f" [trace {record.trace_id}]" if record.trace_id else ""
+        # The rest of the formatting happens on the listener thread; only
+        # tracebacks are rendered here, while the frames still exist
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if record.levelno >= logging.WARNING and self.block_timeout > 0:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener:
+    """Background thread that writes queued records in batches
+
+    Each wake-up drains up to `batch_size` records, passes them to the
+    handlers and flushes every handler once.
+    """
+
+    _STOP = object()
+
+    def __init__(self, log_queue: queue.Queue, handlers: List[logging.Handler],
+                 queue_handler: Optional[DroppingQueueHandler] = None, batch_size: int = 256):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.queue_handler = queue_handler
+        self.batch_size = batch_size
+        self.reported_drops = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write everything still queued, then stop the thread"""
+        if self._thread is None:
+            return
+        self.queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = any(record is self._STOP for record in batch)
+            self._write([record for record in batch if record is not self._STOP])
+            if stopping:
+                return
+
+    def _write(self, records: List[logging.LogRecord]):
+        dropped = self.queue_handler.dropped if self.queue_handler else 0
+        if dropped > self.reported_drops:
+            records.append(logging.makeLogRecord({
+                "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "Log queue full: dropped %d records", "args": (dropped - self.reported_drops,),
+                "trace_id": None, "trace": ""
+            }))
+            self.reported_drops = dropped
+        if not records:
+            return
+        for record in records:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        for handler in self.handlers:
+            try:
+                getattr(handler, "flush_batch", handler.flush)()
+            except (OSError, ValueError):
+                # Stream already closed (interpreter shutdown); logging must never raise
+                pass
+
+
+def configure_logging(log_file: str = 'app.log') -> BatchingQueueListener:
+    """Route root logging through a bounded queue to file, console and event handlers
+
+    Each process writes `<log_file stem>.<pid><ext>` (see worker_log_file).
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        BatchFileHandler(worker_log_file(log_file), maxBytes=settings.LOG_MAX_BYTES, backupCount=settings.LOG_BACKUP_COUNT),
+        BatchStreamHandler()
     ]
-)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if settings.EVENT_LOG_DIR:
+        handlers.append(EventSinkHandler(EventSink(
+            settings.EVENT_LOG_DIR,
+            max_bytes=settings.EVENT_LOG_MAX_BYTES,
+            max_age=settings.EVENT_LOG_MAX_AGE,
+            max_segments=settings.EVENT_LOG_MAX_SEGMENTS
+        )))
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue, block_timeout=settings.LOG_BLOCK_TIMEOUT)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+
+    listener = BatchingQueueListener(log_queue, handlers, queue_handler, batch_size=settings.LOG_BATCH_SIZE)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+# Configure logging
+log_listener = configure_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -34,9 +211,9 @@ class EventLogger:
             "timestamp": datetime.utcnow().isoformat()
         }
         if success:
-            logger.info(f"Auth Success: {user_email}")
+            logger.info("Auth Success: %s", user_email, extra={"event": event})
         else:
-            logger.error(f"Auth Failed: {user_email} - {error}")
+            logger.error("Auth Failed: %s - %s", user_email, error, extra={"event": event})
         return event
     
     @staticmethod
@@ -53,9 +230,9 @@ class EventLogger:
             "timestamp": datetime.utcnow().isoformat()
         }
         if success:
-            logger.info(f"Gmail API - {operation}: Success for {user_email}")
+            logger.info("Gmail API - %s: Success for %s", operation, user_email, extra={"event": event})
         else:
-            logger.error(f"Gmail API - {operation}: Failed for {user_email} - {error}")
+            logger.error("Gmail API - %s: Failed for %s - %s", operation, user_email, error, extra={"event": event})
         return event
     
     @staticmethod
@@ -71,9 +248,9 @@ class EventLogger:
             "timestamp": datetime.utcnow().isoformat()
         }
         if success:
-            logger.info(f"AI Service - {operation}: Success")
+            logger.info("AI Service - %s: Success", operation, extra={"event": event})
         else:
-            logger.error(f"AI Service - {operation}: Failed - {error}")
+            logger.error("AI Service - %s: Failed - %s", operation, error, extra={"event": event})
         return event
     
     @staticmethod
@@ -90,9 +267,9 @@ class EventLogger:
             "timestamp": datetime.utcnow().isoformat()
         }
         if success:
-            logger.info(f"Command - {command}: Success for {user_email}")
+            logger.info("Command - %s: Success for %s", command, user_email, extra={"event": event})
         else:
-            logger.error(f"Command - {command}: Failed for {user_email} - {error}")
+            logger.error("Command - %s: Failed for %s - %s", command, user_email, error, extra={"event": event})
         return event
     
     @staticmethod
@@ -109,9 +286,9 @@ class EventLogger:
             "timestamp": datetime.utcnow().isoformat()
         }
         if success:
-            logger.info(f"Email Action - {action}: Success for {user_email}")
+            logger.info("Email Action - %s: Success for %s", action, user_email, extra={"event": event})
         else:
-            logger.error(f"Email Action - {action}: Failed for {user_email} - {error}")
+            logger.error("Email Action - %s: Failed for %s - %s", action, user_email, error, extra={"event": event})
         return event
 
 
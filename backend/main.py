@@ -1,8 +1,24 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from config import settings
 from auth_routes import router as auth_router
 from email_routes import router as email_router
+from debug_routes import router as debug_router
+from gmail_client import close_http_client
+from gmail_service import warm_up as warm_up_gmail
+from model_registry import warm_up as warm_up_models
+from intent_classifier import intent_classifier
+from email_classifier import email_classifier
+from database import db
+from session_store import session_store, migrate_legacy_sessions
+from metrics import metrics, MetricsMiddleware
+from tracing import TracingMiddleware
+from profiling import ProfilingMiddleware
+from auth_utils import token_cache_stats
+from summary_cache import summary_cache
+from parse_cache import parse_cache
+from logger_service import log_listener
 
 # Create FastAPI app
 app = FastAPI(
@@ -32,11 +48,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+# Sample stacks of opted-in requests (PROFILE_SAMPLE_RATE or X-Profile header); see /debug/profiles
+app.add_middleware(ProfilingMiddleware)
+
+# Time every request by route template (CORS included)
+app.add_middleware(MetricsMiddleware)
+
+# Trace each request; spans from Gmail/Gemini calls attach to it (X-Trace-Id header)
+app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(email_router)
+app.include_router(debug_router)
+
+@app.on_event("startup")
+async def startup():
+    """Move legacy sessions and build shared API clients before the first request arrives"""
+    migrate_legacy_sessions(session_store, db)
+    warm_up_gmail()
+    warm_up_models()
+    intent_classifier.warm_up()
+    email_classifier.warm_up()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled Gmail connections and write pending user-store changes"""
+    await close_http_client()
+    db.flush()
 
 @app.get("/")
 async def root():
@@ -52,6 +94,32 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+def _component_metrics():
+    """Cache and logging counters other modules already keep, read at scrape time"""
+    caches = {"jwt": token_cache_stats(), "parse": parse_cache.stats()}
+    summaries = summary_cache.stats()
+    yield ("cache_hits_total", "counter", "Cache lookups answered from the cache",
+           [({"cache": name}, stats["hits"]) for name, stats in caches.items()]
+           + [({"cache": "summary"}, summaries["memory_hits"] + summaries["disk_hits"])])
+    yield ("cache_misses_total", "counter", "Cache lookups that fell through",
+           [({"cache": name}, stats["misses"]) for name, stats in caches.items()]
+           + [({"cache": "summary"}, summaries["misses"])])
+    yield ("cache_entries", "gauge", "Entries held in memory",
+           [({"cache": name}, stats["size"]) for name, stats in caches.items()]
+           + [({"cache": "summary"}, summaries["memory_size"])])
+    yield ("log_queue_depth", "gauge", "Log records waiting for the listener thread",
+           [({}, log_listener.queue.qsize())])
+    yield ("log_records_dropped_total", "counter", "Log records dropped because the queue was full",
+           [({}, log_listener.queue_handler.dropped)])
+
+
+metrics.register_collector(_component_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request, Gmail, Gemini and cache metrics in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -0,0 +1,90 @@
+"""
+Gemini Model Registry
+Configures the Gemini SDK once per process and keeps model handles warm
+"""
+import logging
+import threading
+import time
+from typing import Dict
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_configured = False
+_models: Dict[str, "genai.GenerativeModel"] = {}
+_services: Dict[str, object] = {}
+
+# Construction cost paid once here instead of on every request (milliseconds)
+construction_ms: Dict[str, float] = {}
+
+
+def _configure():
+    global _configured
+    if not _configured:
+        start = time.perf_counter()
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        construction_ms["configure"] = (time.perf_counter() - start) * 1000
+
+        # genai.configure() drops the SDK's API client; creating it up front
+        # keeps the channel out of the first request
+        start = time.perf_counter()
+        try:
+            genai_client.get_default_generative_client()
+            construction_ms["client"] = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            # No usable API key yet; the SDK retries lazily on the first call
+            logger.warning(f"Gemini client not initialised: {str(e)}")
+        _configured = True
+
+
+def get_model(name: str) -> "genai.GenerativeModel":
+    """Return the shared GenerativeModel for `name`, creating it on first use"""
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                _configure()
+                start = time.perf_counter()
+                model = genai.GenerativeModel(name)
+                construction_ms[f"model:{name}"] = (time.perf_counter() - start) * 1000
+                _models[name] = model
+                logger.info(f"Gemini model {name} ready in {construction_ms[f'model:{name}']:.2f}ms")
+    return model
+
+
+def get_ai_service():
+    """FastAPI dependency returning the process-wide AIService"""
+    from ai_service import AIService
+    service = _services.get("ai")
+    if service is None:
+        service = _services.setdefault("ai", AIService())
+    return service
+
+
+def get_nlp_service():
+    """FastAPI dependency returning the process-wide NLPService"""
+    from nlp_service import NLPService
+    service = _services.get("nlp")
+    if service is None:
+        service = _services.setdefault("nlp", NLPService())
+    return service
+
+
+def warm_up():
+    """Create the shared services (and their models) before the first request"""
+    get_ai_service()
+    get_nlp_service()
+
+
+def registry_stats() -> Dict:
+    """Models held and one-time construction costs, for instrumentation"""
+    return {
+        "models": sorted(_models),
+        "construction_ms": dict(construction_ms)
+    }
@@ -2,11 +2,15 @@
 Natural Language Processing Service
 Parses user commands and maps them to actions
 """
-import google.generativeai as genai
-from config import settings
+from model_registry import get_model
+from intent_classifier import intent_classifier
+from parse_cache import parse_cache
+from metrics import GEMINI_LATENCY, track
+from tracing import span
 import json
 from typing import Dict, Optional
 import asyncio
+import contextvars
 from functools import wraps
 
 def async_wrap(func):
@@ -14,20 +18,33 @@ def async_wrap(func):
     @wraps(func)
     async def run(*args, **kwargs):
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+        # Carry contextvars (the current trace span) into the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, lambda: context.run(func, *args, **kwargs))
     return run
 
 
 class NLPService:
-    def __init__(self):
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+    def __init__(self, model=None):
+        # The SDK is configured and the model built once per process
+        self.model = model or get_model('gemini-1.5-pro')
     
-    @async_wrap
-    def parse_command(self, user_input: str) -> Dict:
+    async def parse_command(self, user_input: str) -> Dict:
         """
         Parse natural language command and extract intent and parameters
+        
+        Obvious commands are answered by the local intent classifier, and
+        phrasings Gemini has already parsed come from the shared parse cache;
+        only new ambiguous input is sent to the LLM.
         """
+        parsed = intent_classifier.classify(user_input) or parse_cache.get(user_input)
+        if parsed is not None:
+            return parsed
+        return await self._parse_with_llm(user_input)
+    
+    @async_wrap
+    def _parse_with_llm(self, user_input: str) -> Dict:
+        """Parse a command with Gemini, falling back to keyword matching"""
         prompt = f"""
 You are a command parser for an email management chatbot. Parse the user's natural language input and return a JSON object.
 
@@ -75,7 +92,8 @@ Now parse: "{user_input}"
 """
         
         try:
-            response = self.model.generate_content(prompt)
+            with span("gemini.parse_command"), track(GEMINI_LATENCY, service="nlp", operation="parse_command"):
+                response = self.model.generate_content(prompt)
             result = response.text.strip()
             
             # Remove markdown code blocks if present
@@ -87,6 +105,7 @@ Now parse: "{user_input}"
                 result = result[:-3]
             
             parsed = json.loads(result.strip())
+            parse_cache.set(user_input, parsed)
             return parsed
         except Exception as e:
             print(f"Error parsing command: {str(e)}")
@@ -0,0 +1,193 @@
+"""
+OAuth State Store
+One-time CSRF `state` values for the Google login round trip, with
+per-entry expiry, a capacity bound and backends that can be shared by
+every worker
+"""
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable
+
+from config import settings
+
+
+class OAuthStateStore(ABC):
+    """issue() a state at login; consume() it exactly once at the callback
+
+    Every issue() keeps the store at or below `capacity` pending states by
+    dropping the oldest ones.
+    """
+
+    def __init__(self, ttl: float, capacity: int, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+
+    @abstractmethod
+    def issue(self, state: str):
+        """Record a new state, evicting the oldest ones beyond capacity"""
+
+    @abstractmethod
+    def consume(self, state: str) -> bool:
+        """True if state was issued, has not expired and was not used before"""
+
+    def sweep(self) -> int:
+        """Drop expired states, returning how many were removed"""
+        return 0
+
+
+class MemoryStateStore(OAuthStateStore):
+    """States in insertion order, which is also expiry order (one TTL for all)
+
+    Expired states are popped off the front as new ones are issued, so each
+    state is evicted once and issue/consume stay O(1) amortized. When full,
+    the oldest pending login is dropped.
+    """
+
+    def __init__(self, ttl: float, capacity: int, clock: Callable[[], float] = time.time):
+        super().__init__(ttl, capacity, clock)
+        self._states: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def issue(self, state: str):
+        with self._lock:
+            self._sweep_locked()
+            while len(self._states) >= self.capacity:
+                self._states.popitem(last=False)
+            self._states[state] = self.clock() + self.ttl
+
+    def consume(self, state: str) -> bool:
+        with self._lock:
+            expires_at = self._states.pop(state, None)
+            return expires_at is not None and expires_at > self.clock()
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._sweep_locked()
+
+    def _sweep_locked(self) -> int:
+        now = self.clock()
+        removed = 0
+        while self._states and next(iter(self._states.values())) <= now:
+            self._states.popitem(last=False)
+            removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class SQLiteStateStore(OAuthStateStore):
+    """States in a SQLite table shared by every worker on the machine
+
+    consume() is a single conditional DELETE, so a state is accepted once
+    even if two workers race on it. Each issue() deletes expired rows (a
+    range of the expires_at index) and the rows beyond capacity in the
+    same transaction as its insert, so concurrent workers never leave the
+    table over capacity.
+    """
+
+    def __init__(self, db_path: str, ttl: float, capacity: int, clock: Callable[[], float] = time.time):
+        super().__init__(ttl, capacity, clock)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS oauth_states (state TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS oauth_states_expires ON oauth_states (expires_at)")
+
+    def issue(self, state: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO oauth_states (state, expires_at) VALUES (?, ?)",
+                (state, self.clock() + self.ttl)
+            )
+            self._sweep_locked()
+
+    def consume(self, state: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM oauth_states WHERE state = ? AND expires_at > ?",
+                (state, self.clock())
+            )
+            return cursor.rowcount == 1
+
+    def sweep(self) -> int:
+        with self._lock, self._conn:
+            return self._sweep_locked()
+
+    def _sweep_locked(self) -> int:
+        removed = self._conn.execute("DELETE FROM oauth_states WHERE expires_at <= ?", (self.clock(),)).rowcount
+        # Newest first along the index; everything past the first `capacity` rows goes
+        removed += self._conn.execute(
+            "DELETE FROM oauth_states WHERE state IN "
+            "(SELECT state FROM oauth_states ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.capacity,)
+        ).rowcount
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM oauth_states").fetchone()[0]
+
+
+class RedisStateStore(OAuthStateStore):
+    """States as Redis keys with server-side expiry, indexed by a sorted set
+
+    consume() relies on DEL returning 1 only for a live key, which makes it
+    atomic across workers. The `<prefix>index` ZSET scores each state by its
+    expiry; issue() drops expired members with ZREMRANGEBYSCORE and trims
+    the oldest beyond capacity with ZREMRANGEBYRANK, deleting their keys.
+
+    `client` is anything with redis-py's get/set/delete and z* signatures,
+    so tests can pass an in-memory fake.
+    """
+
+    def __init__(self, client, ttl: float, capacity: int, prefix: str = "oauth_state:",
+                 clock: Callable[[], float] = time.time):
+        super().__init__(ttl, capacity, clock)
+        self.client = client
+        self.prefix = prefix
+        self.index = prefix + "index"
+
+    def issue(self, state: str):
+        now = self.clock()
+        self.client.set(self.prefix + state, "1", ex=max(1, int(self.ttl)))
+        self.client.zadd(self.index, {state: now + self.ttl})
+        self.client.zremrangebyscore(self.index, "-inf", now)
+        overflow = self.client.zrange(self.index, 0, -self.capacity - 1)
+        if overflow:
+            self.client.delete(*(self.prefix + (m.decode() if isinstance(m, bytes) else m) for m in overflow))
+            self.client.zremrangebyrank(self.index, 0, -self.capacity - 1)
+
+    def consume(self, state: str) -> bool:
+        self.client.zrem(self.index, state)
+        return self.client.delete(self.prefix + state) == 1
+
+    def __len__(self) -> int:
+        return self.client.zcard(self.index)
+
+
+def create_state_store() -> OAuthStateStore:
+    """Build the store selected by OAUTH_STATE_BACKEND ("sqlite", "memory" or "redis")"""
+    ttl, capacity = settings.OAUTH_STATE_TTL, settings.OAUTH_STATE_CAPACITY
+    if settings.OAUTH_STATE_BACKEND == "memory":
+        return MemoryStateStore(ttl, capacity)
+    if settings.OAUTH_STATE_BACKEND == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("OAUTH_STATE_BACKEND=redis requires the redis package (pip install redis)")
+        return RedisStateStore(redis.Redis.from_url(settings.REDIS_URL), ttl, capacity)
+    return SQLiteStateStore(settings.SESSION_DB_PATH, ttl, capacity)
+
+
+# Singleton instance
+oauth_states = create_state_store()
@@ -0,0 +1,73 @@
+"""
+Command Parse Cache
+Shares structured parses of natural-language commands across requests,
+keyed on a normalized template of the command
+"""
+import copy
+import re
+from typing import Dict, List, Optional, Tuple
+
+from cache_utils import TTLCache
+from config import settings
+
+_NUMBER = re.compile(r"\d+")
+# Punctuation at either end of a whitespace-separated token; inner
+# punctuation is kept so "j.smith@acme.com" and "j-smith@acme.com" differ
+_EDGE_PUNCTUATION = re.compile(r"(?<!\S)[^\w\s]+|[^\w\s]+(?!\S)")
+
+
+def normalize_command(command: str) -> Tuple[str, List[str]]:
+    """Return (template key, numbers) for a command
+
+    Case, whitespace and punctuation at word edges are dropped and every
+    number becomes a <n> slot, so "Show the last 10 emails!" and "show the last 3 emails"
+    share the key "show the last <n> emails".
+    """
+    text = _EDGE_PUNCTUATION.sub(" ", command.lower())
+    numbers = _NUMBER.findall(text)
+    template = _NUMBER.sub("<n>", text)
+    return " ".join(template.split()), numbers
+
+
+class ParseCache:
+    """TTL/LRU cache of parsed commands with number-slot templating
+
+    Parameters whose value equals one of the command's numbers are stored
+    as slots and refilled from the numbers of the command being looked up.
+    A parse with a command number embedded in any other parameter (e.g.
+    query "invoice 123") is not cached, since the key no longer tells
+    such commands apart.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, command: str) -> Optional[Dict]:
+        key, numbers = normalize_command(command)
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+
+        parsed, slots = entry
+        parsed = copy.deepcopy(parsed)
+        for name, (index, as_int) in slots.items():
+            value = numbers[index]
+            parsed["parameters"][name] = int(value) if as_int else value
+        return parsed
+
+    def set(self, command: str, parsed: Dict):
+        key, numbers = normalize_command(command)
+        slots = {}
+        for name, value in parsed.get("parameters", {}).items():
+            if not isinstance(value, bool) and str(value) in numbers:
+                slots[name] = (numbers.index(str(value)), isinstance(value, int))
+            elif set(_NUMBER.findall(str(value))) & set(numbers):
+                return
+        self.cache.set(key, (copy.deepcopy(parsed), slots))
+
+    def stats(self) -> Dict:
+        return self.cache.stats()
+
+
+# Singleton instance
+parse_cache = ParseCache(maxsize=settings.PARSE_CACHE_SIZE, ttl=settings.PARSE_CACHE_TTL)
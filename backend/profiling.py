@@ -0,0 +1,156 @@
+"""
+Request Profiling
+Opt-in statistical profiler for sampled requests, aggregated per route
+into flamegraph-compatible collapsed stacks
+"""
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from config import settings
+
+
+def _label(code) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of profiled requests every `interval` seconds
+
+    Each profiled request registers the frame of the middleware call that
+    wraps it. A background thread reads sys._current_frames() and walks each
+    stack towards its root; a stack that passes through a registered frame
+    is CPU time of that request, and the frames below it are counted as one
+    collapsed stack. Suspended requests are not on any stack, so waiting
+    on Gmail or Gemini costs nothing and is not counted (traces cover
+    wall time). Blocking calls handed to executor threads are not
+    attributed.
+    """
+
+    def __init__(self, interval: float = 0.005, max_stacks: int = 5000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.profiles: Dict[str, Counter] = {}
+        self.requests: Counter = Counter()
+        self._active: Dict[object, Counter] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, frame):
+        """Begin sampling the request whose middleware frame is `frame`"""
+        with self._lock:
+            self._active[frame] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+            self._wake.set()
+
+    def stop(self, frame, route: str) -> Counter:
+        """Stop sampling a request and add its stacks to the route's profile"""
+        with self._lock:
+            samples = self._active.pop(frame, Counter())
+            profile = self.profiles.setdefault(route, Counter())
+            for stack, count in samples.items():
+                if stack in profile or len(profile) < self.max_stacks:
+                    profile[stack] += count
+                else:
+                    profile["[other stacks]"] += count
+            self.requests[route] += 1
+        return samples
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                active = dict(self._active)
+            self.sample(active)
+            time.sleep(self.interval)
+
+    def sample(self, active: Dict[object, Counter]):
+        """Attribute every thread's current stack to the profiled request it runs in, if any"""
+        for thread_id, frame in sys._current_frames().items():
+            stack = []
+            while frame is not None and frame not in active:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if frame is not None and stack:
+                active[frame][";".join(_label(code) for code in reversed(stack))] += 1
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """Collapsed stacks ("frame;frame;leaf count" per line) for flamegraph.pl or speedscope
+
+        Without a route, every route's stacks are returned under a root
+        frame named after the route.
+        """
+        with self._lock:
+            if route is not None:
+                lines = [f"{stack} {count}" for stack, count in self.profiles.get(route, Counter()).most_common()]
+            else:
+                lines = [
+                    f"{name};{stack} {count}"
+                    for name, profile in sorted(self.profiles.items())
+                    for stack, count in profile.most_common()
+                ]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                route: {"requests": self.requests[route], "samples": sum(profile.values()), "stacks": len(profile)}
+                for route, profile in self.profiles.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.profiles.clear()
+            self.requests.clear()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling a random `sample_rate` share of requests
+
+    A request is also profiled when it sends X-Profile: 1 together with a
+    valid X-Admin-Token, so a single slow call can be profiled on demand.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler = None, sample_rate: Optional[float] = None):
+        self.app = app
+        self.profiler = profiler or request_profiler
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    def _selected(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        headers = dict(scope.get("headers") or ())
+        return (
+            headers.get(b"x-profile") == b"1"
+            and bool(settings.ADMIN_TOKEN)
+            and secrets.compare_digest(headers.get(b"x-admin-token", b""), settings.ADMIN_TOKEN.encode())
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+
+        frame = sys._getframe()
+        self.profiler.start(frame)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            self.profiler.stop(frame, f"{scope['method']} {getattr(route, 'path', 'unmatched')}")
+
+
+# Singleton instance
+request_profiler = SamplingProfiler(interval=settings.PROFILE_INTERVAL)
@@ -0,0 +1,212 @@
+"""
+Session Store
+Login sessions with per-entry TTL behind one small interface, backed by
+process memory, SQLite or a Redis-compatible server
+"""
+import heapq
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import settings
+
+
+class SessionStore(ABC):
+    """save/get/delete sessions by user id; entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.clock = clock
+
+    def _expires_at(self, ttl: Optional[float]) -> float:
+        return self.clock() + (self.ttl if ttl is None else ttl)
+
+    @abstractmethod
+    def save(self, user_id: str, session_data: dict, ttl: Optional[float] = None):
+        """Store a session, replacing any earlier one for the user"""
+
+    @abstractmethod
+    def get(self, user_id: str) -> Optional[Dict]:
+        """The live session for a user, or None when missing or expired"""
+
+    @abstractmethod
+    def delete(self, user_id: str):
+        """Remove a user's session (logout)"""
+
+    def sweep(self) -> int:
+        """Drop expired sessions, returning how many were removed"""
+        return 0
+
+
+class MemorySessionStore(SessionStore):
+    """Dict of sessions plus a min-heap of expiry times
+
+    Lookups are O(1). Expired entries are popped off the heap in O(log n)
+    each, during writes, so sweeping never scans live sessions. Heap entries
+    left behind by re-saves or deletes are skipped and compacted away.
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.time):
+        super().__init__(ttl, clock)
+        self._sessions: Dict[str, Tuple[float, dict]] = {}
+        self._expiry: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def save(self, user_id: str, session_data: dict, ttl: Optional[float] = None):
+        expires_at = self._expires_at(ttl)
+        with self._lock:
+            self._sessions[user_id] = (expires_at, dict(session_data))
+            heapq.heappush(self._expiry, (expires_at, user_id))
+            self._sweep_locked()
+            if len(self._expiry) > 2 * len(self._sessions) + 64:
+                self._expiry = [(expires, uid) for uid, (expires, _) in self._sessions.items()]
+                heapq.heapify(self._expiry)
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._sessions[user_id]
+                return None
+            return dict(entry[1])
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._sweep_locked()
+
+    def _sweep_locked(self) -> int:
+        now = self.clock()
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, user_id = heapq.heappop(self._expiry)
+            entry = self._sessions.get(user_id)
+            if entry is not None and entry[0] == expires_at:
+                del self._sessions[user_id]
+                removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite table with an index on expiry
+
+    The expires_at index acts as the sorted expiry set: a sweep deletes a
+    range of it, at most once per `sweep_interval` seconds of writes.
+    """
+
+    def __init__(self, db_path: str, ttl: float, clock: Callable[[], float] = time.time,
+                 sweep_interval: float = 60.0):
+        super().__init__(ttl, clock)
+        self.db_path = db_path
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "user_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires_at)")
+
+    def save(self, user_id: str, session_data: dict, ttl: Optional[float] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, data, expires_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(session_data, default=str), self._expires_at(ttl))
+            )
+            if self.clock() - self._last_sweep >= self.sweep_interval:
+                self._sweep_locked()
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE user_id = ? AND expires_at > ?",
+                (user_id, self.clock())
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def delete(self, user_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def sweep(self) -> int:
+        with self._lock, self._conn:
+            return self._sweep_locked()
+
+    def _sweep_locked(self) -> int:
+        self._last_sweep = self.clock()
+        return self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (self._last_sweep,)).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions as JSON strings in Redis, expired by the server (SET ... EX)
+
+    `client` is anything with redis-py's get/set/delete signatures, so
+    tests can pass an in-memory fake.
+    """
+
+    def __init__(self, client, ttl: float, prefix: str = "session:"):
+        super().__init__(ttl)
+        self.client = client
+        self.prefix = prefix
+
+    def save(self, user_id: str, session_data: dict, ttl: Optional[float] = None):
+        seconds = max(1, int(self.ttl if ttl is None else ttl))
+        self.client.set(self.prefix + user_id, json.dumps(session_data, default=str), ex=seconds)
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        value = self.client.get(self.prefix + user_id)
+        return json.loads(value) if value is not None else None
+
+    def delete(self, user_id: str):
+        self.client.delete(self.prefix + user_id)
+
+
+def create_session_store() -> SessionStore:
+    """Build the store selected by SESSION_BACKEND ("sqlite", "memory" or "redis")"""
+    ttl = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    if settings.SESSION_BACKEND == "memory":
+        return MemorySessionStore(ttl)
+    if settings.SESSION_BACKEND == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the redis package (pip install redis)")
+        return RedisSessionStore(redis.Redis.from_url(settings.REDIS_URL), ttl)
+    return SQLiteSessionStore(settings.SESSION_DB_PATH, ttl)
+
+
+def migrate_legacy_sessions(store: SessionStore, database) -> int:
+    """Move sessions older versions kept in the user database into `store`
+
+    The database drops them as they are handed over, so this is a no-op
+    after the first run. Migrated sessions get the store's default TTL.
+    """
+    sessions = database.pop_legacy_sessions()
+    for user_id, session_data in sessions.items():
+        store.save(user_id, session_data)
+    if sessions:
+        print(f"Migrated {len(sessions)} sessions to the {settings.SESSION_BACKEND} session store")
+    return len(sessions)
+
+
+# Singleton instance
+session_store = create_session_store()
@@ -0,0 +1,135 @@
+"""
+Summary Cache
+Content-addressed cache of AI email summaries with an in-memory LRU tier
+and an optional on-disk SQLite tier
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from cache_utils import TTLCache
+from config import settings
+
+
+def summary_key(email_body: str, model_name: str, prompt_version: int) -> str:
+    """Hash of everything that determines a summary: prompt, model and input text"""
+    material = f"{prompt_version}\0{model_name}\0{email_body}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """Two-tier summary cache
+
+    Lookups hit the in-memory LRU first, then the SQLite file (when
+    configured), promoting disk hits into memory. The disk tier is bounded
+    by total summary size, tracked as a running total; once it passes
+    max_bytes, the least recently used rows are evicted down to
+    LOW_WATER * max_bytes, so eviction runs once per batch of writes.
+    """
+
+    LOW_WATER = 0.9
+    EVICT_BATCH = 256
+
+    def __init__(self, maxsize: int = 2048, db_path: Optional[str] = None, max_bytes: int = 50 * 1024 * 1024):
+        self.memory = TTLCache(maxsize=maxsize)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total_bytes = 0
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, summary TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_accessed ON summaries (accessed_at)")
+            self._conn.commit()
+            self._total_bytes = self._stored_bytes()
+
+    def get(self, key: str) -> Optional[str]:
+        summary = self.memory.get(key)
+        if summary is not None:
+            self.memory_hits += 1
+            return summary
+
+        if self._conn is not None:
+            with self._lock:
+                row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                    self._conn.commit()
+            if row is not None:
+                self.disk_hits += 1
+                self.memory.set(key, row[0])
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, summary: str):
+        self.memory.set(key, summary)
+        if self._conn is None:
+            return
+        size = len(summary.encode("utf-8"))
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM summaries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, summary, size, time.time())
+            )
+            self._total_bytes += size - (replaced[0] if replaced else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+
+    def _evict(self):
+        """Drop least recently used rows until the disk tier is under the low-water mark
+
+        The total is re-read first since other workers may write the same
+        file; rows are then taken oldest first from the accessed_at index,
+        EVICT_BATCH at a time.
+        """
+        self._total_bytes = self._stored_bytes()
+        target = self.max_bytes * self.LOW_WATER
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM summaries ORDER BY accessed_at LIMIT ?", (self.EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            stale = []
+            for key, size in rows:
+                if self._total_bytes <= target:
+                    break
+                stale.append((key,))
+                self._total_bytes -= size
+            self._conn.executemany("DELETE FROM summaries WHERE key = ?", stale)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for observability"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_size": len(self.memory)
+        }
+
+
+# Singleton instance
+summary_cache = SummaryCache(
+    maxsize=settings.SUMMARY_CACHE_SIZE,
+    db_path=settings.SUMMARY_CACHE_DB or None,
+    max_bytes=settings.SUMMARY_CACHE_MAX_BYTES
+)
@@ -0,0 +1,82 @@
+"""
+Summarization Pipeline
+Fans AI summaries out across emails with bounded concurrency
+"""
+import asyncio
+from typing import AsyncIterable, Dict, Iterable, List, Optional, Union
+
+from ai_service import AIService
+from config import settings
+
+
+async def _aiter(emails: Union[Iterable[Dict], AsyncIterable[Dict]]):
+    if hasattr(emails, "__aiter__"):
+        async for email in emails:
+            yield email
+    else:
+        for email in emails:
+            yield email
+
+
+async def summarize_emails(
+    ai_service: AIService,
+    emails: Union[Iterable[Dict], AsyncIterable[Dict]],
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    batch_size: int = 1
+) -> List[Dict]:
+    """
+    Set email["summary"] on every email and return them in arrival order
+
+    `emails` may be a list or an async iterable (e.g.
+    GmailService.iter_messages), in which case each email starts summarizing
+    as soon as it arrives instead of after the whole fetch. At most
+    `concurrency` model calls run at once; one that exceeds `timeout` seconds
+    or raises falls back to a truncated body for its emails only.
+
+    With batch_size > 1, arriving emails are grouped and summarized through
+    AIService.generate_summaries, several emails per model call.
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.SUMMARY_CONCURRENCY)
+    timeout = timeout or settings.SUMMARY_TIMEOUT
+
+    async def summarize(group: List[Dict]):
+        async with semaphore:
+            try:
+                if batch_size > 1:
+                    summaries = await asyncio.wait_for(
+                        ai_service.generate_summaries([email["body"] for email in group]),
+                        timeout=timeout
+                    )
+                else:
+                    summaries = [await asyncio.wait_for(
+                        ai_service.generate_summary(group[0]["body"]),
+                        timeout=timeout
+                    )]
+            except asyncio.TimeoutError:
+                summaries = [AIService.fallback_summary(email["body"]) for email in group]
+            except Exception as e:
+                # One failing group (e.g. a locked summary cache) must not sink the others
+                print(f"Error summarizing {len(group)} email(s): {e}")
+                summaries = [AIService.fallback_summary(email["body"]) for email in group]
+            for email, summary in zip(group, summaries):
+                email["summary"] = summary
+
+    ordered = []
+    tasks = []
+    group = []
+    try:
+        async for email in _aiter(emails):
+            ordered.append(email)
+            group.append(email)
+            if len(group) >= batch_size:
+                tasks.append(asyncio.create_task(summarize(group)))
+                group = []
+        if group:
+            tasks.append(asyncio.create_task(summarize(group)))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return ordered
@@ -70,6 +70,133 @@ class TestNLPService:
         assert result["confidence"] == 0.7
 
 
+class TestIntentClassifier:
+    """Test the local fast-path intent classifier"""
+    
+    def test_rules_extract_parameters(self):
+        """Test rule tier resolves obvious commands with their parameters"""
+        from intent_classifier import intent_classifier
+        
+        parsed = intent_classifier.classify("Please show the last 10 emails from Alice")
+        assert parsed["action"] == "read_emails"
+        assert parsed["parameters"] == {"count": 10, "sender": "Alice"}
+        
+        parsed = intent_classifier.classify("Reply to John that I will get back tomorrow")
+        assert parsed["parameters"] == {"sender": "John", "reply_content": "I will get back tomorrow"}
+        
+        assert intent_classifier.classify("delete email 2")["parameters"] == {"email_id": "2"}
+    
+    def test_classifier_handles_paraphrases(self):
+        """Test the trained tier covers phrasings no rule matches"""
+        from intent_classifier import intent_classifier
+        
+        assert intent_classifier.classify("catch me up on my inbox")["action"] == "daily_digest"
+        assert intent_classifier.classify("what's new in my inbox")["action"] == "read_emails"
+    
+    def test_ambiguous_input_defers_to_llm(self):
+        """Test off-topic input is left for the LLM"""
+        from intent_classifier import intent_classifier
+        
+        assert intent_classifier.classify("what's the capital of France") is None
+        assert intent_classifier.classify("   ") is None
+    
+    def test_partial_matches_are_not_answered_locally(self):
+        """Test commands with words no rule or parameter accounts for go to the LLM"""
+        from intent_classifier import intent_classifier
+        
+        assert intent_classifier.classify("Can you show me unread emails from last week?") is None
+        assert intent_classifier.classify("remove me from mailing list of acme") is None
+        assert intent_classifier.classify("sort by date please") is None
+        
+        parsed = intent_classifier.classify("write a reply to email 2 saying thanks")
+        assert parsed["action"] == "send_reply"
+        assert parsed["parameters"] == {"email_id": "2", "reply_content": "thanks"}
+    
+    def test_sender_must_look_like_a_name_or_address(self):
+        """Test determiners and time words after "from" are never taken as senders"""
+        from intent_classifier import extract_parameters
+        
+        assert "sender" not in extract_parameters("read_emails", "show emails from last week")
+        assert "sender" not in extract_parameters("read_emails", "show emails from my boss")
+        assert extract_parameters("read_emails", "list messages from support@acme.com")["sender"] == "support@acme.com"
+        assert extract_parameters("delete_email", "delete the email from john")["sender"] == "john"
+    
+    @pytest.mark.asyncio
+    async def test_parse_command_skips_llm_for_obvious_commands(self):
+        """Test NLPService only calls Gemini when the local tiers are unsure"""
+        nlp_service = NLPService()
+        with patch.object(NLPService, "_parse_with_llm", new=AsyncMock(return_value={"action": "unknown"})) as llm:
+            assert (await nlp_service.parse_command("categorize my inbox"))["action"] == "categorize_inbox"
+            llm.assert_not_called()
+            
+            await nlp_service.parse_command("what's the capital of France")
+            llm.assert_called_once()
+
+
+class TestParseCache:
+    """Test the normalized command parse cache"""
+    
+    def test_normalization_templates_numbers(self):
+        """Test case, punctuation, whitespace and numbers collapse to one key"""
+        from parse_cache import normalize_command
+        
+        assert normalize_command("Show  the LAST 10 emails!") == ("show the last <n> emails", ["10"])
+        assert normalize_command("show the last 3 emails")[0] == "show the last <n> emails"
+    
+    def test_inner_punctuation_is_kept(self):
+        """Test addresses that differ only by inner punctuation get separate keys"""
+        from parse_cache import ParseCache, normalize_command
+        
+        assert normalize_command("Reply to j.smith@acme.com, thanks!")[0] == "reply to j.smith@acme.com thanks"
+        cache = ParseCache(maxsize=10, ttl=60)
+        cache.set("show emails from j.smith@acme.com",
+                  {"action": "search", "parameters": {"sender": "j.smith@acme.com"}, "confidence": 0.9})
+        
+        assert cache.get("show emails from j-smith@acme.com") is None
+        assert cache.get("Show emails from J.Smith@acme.com.")["parameters"] == {"sender": "j.smith@acme.com"}
+    
+    def test_number_slots_are_refilled(self):
+        """Test a cached parse is reused with the new command's numbers"""
+        from parse_cache import ParseCache
+        
+        cache = ParseCache(maxsize=10, ttl=60)
+        cache.set("Pull up 10 of my mails, newest first",
+                  {"action": "read_emails", "parameters": {"count": 10}, "confidence": 0.9})
+        
+        hit = cache.get("pull up 3 of my mails newest first")
+        assert hit == {"action": "read_emails", "parameters": {"count": 3}, "confidence": 0.9}
+        assert cache.get("pull up my mails") is None
+    
+    def test_numbers_inside_strings_are_not_cached(self):
+        """Test a number embedded in a string parameter never leaks into another command"""
+        from parse_cache import ParseCache
+        
+        cache = ParseCache(maxsize=10, ttl=60)
+        cache.set("search emails about invoice 123",
+                  {"action": "search", "parameters": {"query": "invoice 123"}, "confidence": 0.9})
+        cache.set("show 5 emails about invoices",
+                  {"action": "read_emails", "parameters": {"count": 5, "query": "invoices"}, "confidence": 0.9})
+        
+        assert cache.get("search emails about invoice 456") is None
+        assert cache.get("search emails about invoice 123") is None
+        assert cache.get("show 8 emails about invoices")["parameters"] == {"count": 8, "query": "invoices"}
+    
+    @pytest.mark.asyncio
+    async def test_repeat_command_skips_llm(self):
+        """Test a phrasing Gemini parsed once is served from the cache"""
+        nlp_service = NLPService()
+        nlp_service.model = Mock()
+        nlp_service.model.generate_content.return_value = Mock(
+            text='{"action": "read_emails", "parameters": {"count": 7}, "confidence": 0.8}'
+        )
+        
+        first = await nlp_service.parse_command("hmm, anything from the last 7 days worth my time?")
+        second = await nlp_service.parse_command("Hmm anything from the last 7 days worth my time")
+        
+        assert first == second
+        assert nlp_service.model.generate_content.call_count == 1
+
+
 class TestAIService:
     """Test AI service functions"""
     
@@ -114,6 +241,362 @@ class TestAIService:
         assert all(k in result["categories"] for k in ["Work", "Personal", "Promotions", "Urgent"])
 
 
+class TestKeywordMatcher:
+    """Test single-pass keyword categorization"""
+    
+    def test_scan_reports_every_category(self):
+        """One scan reports all categories with a keyword in the text"""
+        from keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({"Urgent": ["deadline", "asap"], "Work": ["deadline", "meeting"], "Promotions": ["sale"]})
+        
+        assert matcher.scan("Meeting moved, DEADLINE friday") == {"Urgent", "Work"}
+        assert matcher.scan("Weekend sale!") == {"Promotions"}
+        assert matcher.scan("lunch?") == frozenset()
+    
+    def test_keywords_match_at_word_start(self):
+        """Keywords match as word prefixes, not inside other words"""
+        from keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({"Promotions": ["sale", "deal", "promo"], "Work": ["team"]})
+        
+        assert matcher.scan("Deals and promotional sales") == {"Promotions"}
+        assert matcher.scan("An ideal wholesale steamer") == frozenset()
+    
+    def test_overlapping_and_prefix_keywords(self):
+        """Prefix keywords and keywords inside matched phrases are not lost"""
+        from keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({"A": ["action required"], "B": ["action"], "C": ["required"], "D": ["sub"], "E": ["subscribe"]})
+        
+        assert matcher.scan("Action required today") == {"A", "B", "C"}
+        assert matcher.scan("please subscribe") == {"D", "E"}
+    
+    def test_first_follows_priority_order(self):
+        """first() returns the earliest declared matching category"""
+        from keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({"Urgent": ["urgent"], "Promotions": ["sale"], "Work": ["project"]})
+        
+        assert matcher.first("project sale urgent") == "Urgent"
+        assert matcher.first("project sale") == "Promotions"
+        assert matcher.first("hello", default="Personal") == "Personal"
+    
+    def test_route_categorization_priority(self):
+        """Inbox categorization keeps Urgent > Promotions > Work > Personal"""
+        from email_routes import _categorize_emails_by_keywords
+        emails = [
+            {"subject": "Project deadline", "sender": "boss@company.com", "snippet": ""},
+            {"subject": "Big sale for your team", "sender": "deals@store.com", "snippet": ""},
+            {"subject": "Client meeting", "sender": "pm@company.com", "snippet": ""},
+            {"subject": "Dinner?", "sender": "mom@home.com", "snippet": "ideal wholesale steam"}
+        ]
+        
+        categories = _categorize_emails_by_keywords(emails)
+        
+        assert [e["subject"] for e in categories["Urgent"]["emails"]] == ["Project deadline"]
+        assert [e["subject"] for e in categories["Promotions"]["emails"]] == ["Big sale for your team"]
+        assert [e["subject"] for e in categories["Work"]["emails"]] == ["Client meeting"]
+        assert categories["Personal"]["count"] == 1
+
+
+class TestEmailClassifier:
+    """Test the vectorized categorization engine"""
+    
+    SAMPLES = [
+        {"subject": "Client meeting moved", "sender": "pm@company.com", "snippet": "Project review with the team"},
+        {"subject": "Huge discount inside", "sender": "deals@store.com", "snippet": "Sale ends soon, unsubscribe anytime"},
+        {"subject": "Server outage", "sender": "ops@company.com", "snippet": "Critical, respond immediately"},
+        {"subject": "Photos from the party", "sender": "mom@family.com", "snippet": "The kids loved it"}
+    ]
+    
+    def test_hash_tokens_tracks_owning_text(self):
+        """Batch tokenization hashes equal tokens equally and keeps text boundaries"""
+        from email_classifier import hash_tokens
+        hashes, docs = hash_tokens(["Deal deal, DEAL!", "", "x deal"])
+        
+        assert len(set(hashes[[0, 1, 2, 4]].tolist())) == 1
+        assert hashes[3] != hashes[0]
+        assert docs.tolist() == [0, 0, 0, 2, 2]
+    
+    def test_seed_model_categorizes_batch(self):
+        """The seed-trained model labels each email, in input order"""
+        from email_classifier import EmailClassifier
+        classifier = EmailClassifier(model_path="")
+        
+        assert classifier.categorize(self.SAMPLES) == ["Work", "Promotions", "Urgent", "Personal"]
+        assert classifier.categorize([]) == []
+    
+    def test_batch_scoring_matches_single_scoring(self):
+        """Scoring a batch gives the same probabilities as one email at a time"""
+        from email_classifier import EmailClassifier, email_text
+        import numpy as np
+        model = EmailClassifier(model_path="").model
+        texts = [email_text(e) for e in self.SAMPLES]
+        
+        batch = model.predict_proba(texts)
+        single = np.vstack([model.predict_proba([t]) for t in texts])
+        
+        assert np.allclose(batch, single, atol=1e-5)
+    
+    def test_model_round_trips_through_npz(self, tmp_path):
+        """A model trained offline loads from .npz and predicts the same"""
+        from email_classifier import EmailClassifier, TfidfLinearModel, SEED_EMAILS, train_from_examples
+        path = str(tmp_path / "model.npz")
+        train_from_examples(SEED_EMAILS).save(path)
+        
+        assert isinstance(EmailClassifier(model_path=path).model, TfidfLinearModel)
+        assert EmailClassifier(model_path=path).categorize(self.SAMPLES) == EmailClassifier(model_path="").categorize(self.SAMPLES)
+    
+    def test_engine_is_selected_per_request(self):
+        """Categorize requests accept keywords, vector or ai and reject others"""
+        from email_routes import ReadEmailsRequest, _categorize_emails_by_classifier
+        from pydantic import ValidationError
+        
+        assert ReadEmailsRequest().engine == "keywords"
+        assert ReadEmailsRequest(engine="vector").engine == "vector"
+        with pytest.raises(ValidationError):
+            ReadEmailsRequest(engine="magic")
+        
+        categories = _categorize_emails_by_classifier(self.SAMPLES)
+        assert sum(c["count"] for c in categories.values()) == len(self.SAMPLES)
+
+
+class TestSummaryPipeline:
+    """Test bounded-concurrency summarization"""
+    
+    class StubAI:
+        def __init__(self, delays):
+            self.delays = delays
+            self.in_flight = 0
+            self.peak = 0
+        
+        async def generate_summary(self, email_body):
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            await asyncio.sleep(self.delays.get(email_body, 0.01))
+            self.in_flight -= 1
+            return f"summary: {email_body}"
+    
+    @pytest.mark.asyncio
+    async def test_results_keep_order_and_respect_limit(self):
+        """Test summaries are collected in input order with bounded fan-out"""
+        from summary_pipeline import summarize_emails
+        
+        ai = self.StubAI({"a": 0.05, "b": 0.01, "c": 0.03, "d": 0.02})
+        emails = [{"body": body} for body in "abcd"]
+        result = await summarize_emails(ai, emails, concurrency=2, timeout=1)
+        
+        assert [e["summary"] for e in result] == [f"summary: {b}" for b in "abcd"]
+        assert ai.peak == 2
+    
+    @pytest.mark.asyncio
+    async def test_timeout_falls_back_to_body(self):
+        """Test a slow summary is replaced by the truncated body"""
+        from summary_pipeline import summarize_emails
+        
+        ai = self.StubAI({"slow": 1.0})
+        result = await summarize_emails(ai, [{"body": "slow"}, {"body": "fast"}], timeout=0.1)
+        
+        assert [e["summary"] for e in result] == ["slow", "summary: fast"]
+    
+    @pytest.mark.asyncio
+    async def test_errors_fall_back_per_group(self):
+        """Test a summary that raises falls back without failing the other emails"""
+        import sqlite3
+        from summary_pipeline import summarize_emails
+        
+        ai = self.StubAI({})
+        generate_summary = ai.generate_summary
+        
+        async def flaky(email_body):
+            if email_body == "locked":
+                raise sqlite3.OperationalError("database is locked")
+            return await generate_summary(email_body)
+        
+        ai.generate_summary = flaky
+        result = await summarize_emails(ai, [{"body": "locked"}, {"body": "fine"}], timeout=1)
+        
+        assert [e["summary"] for e in result] == ["locked", "summary: fine"]
+    
+    @pytest.mark.asyncio
+    async def test_consumes_async_iterables(self):
+        """Test emails from an async stream are summarized as they arrive"""
+        from summary_pipeline import summarize_emails
+        
+        async def stream():
+            for body in ["x", "y"]:
+                await asyncio.sleep(0.01)
+                yield {"body": body}
+        
+        result = await summarize_emails(self.StubAI({}), stream())
+        assert [e["summary"] for e in result] == ["summary: x", "summary: y"]
+
+
+class TestSummaryCache:
+    """Test the content-addressed summary cache"""
+    
+    @pytest.mark.asyncio
+    async def test_repeat_summary_skips_model(self):
+        """Test the same email body is only sent to the model once"""
+        from summary_cache import summary_cache
+        
+        ai_service = AIService()
+        ai_service.model = Mock()
+        ai_service.model.generate_content.return_value = Mock(text=" Cached summary. ")
+        body = "Quarterly numbers attached, please review by Friday. (cache test)"
+        
+        first = await ai_service.generate_summary(body)
+        hits_before = summary_cache.stats()["memory_hits"]
+        second = await ai_service.generate_summary(body)
+        
+        assert first == second == "Cached summary."
+        assert ai_service.model.generate_content.call_count == 1
+        assert summary_cache.stats()["memory_hits"] == hits_before + 1
+    
+    def test_key_changes_with_prompt_version(self):
+        """Test keys depend on body, model and prompt version"""
+        from summary_cache import summary_key
+        
+        assert summary_key("body", "gemini-pro", 1) == summary_key("body", "gemini-pro", 1)
+        assert summary_key("body", "gemini-pro", 1) != summary_key("body", "gemini-pro", 2)
+        assert summary_key("body", "gemini-pro", 1) != summary_key("body", "other-model", 1)
+    
+    def test_disk_tier_persists_and_evicts(self, tmp_path):
+        """Test the SQLite tier survives restarts and stays under its size bound"""
+        from summary_cache import SummaryCache
+        
+        path = str(tmp_path / "summaries.db")
+        cache = SummaryCache(maxsize=10, db_path=path, max_bytes=25)
+        cache.set("old", "x" * 10)
+        cache.set("mid", "y" * 10)
+        cache.set("new", "z" * 10)
+        
+        reopened = SummaryCache(maxsize=10, db_path=path, max_bytes=25)
+        assert reopened.get("old") is None
+        assert reopened.get("new") == "z" * 10
+        assert reopened.stats()["disk_hits"] == 1
+        assert reopened.stats()["misses"] == 1
+    
+    def test_disk_tier_sums_sizes_only_when_evicting(self, tmp_path):
+        """Test writes keep a running size total and evict in bounded batches"""
+        from summary_cache import SummaryCache
+        
+        cache = SummaryCache(maxsize=10, db_path=str(tmp_path / "summaries.db"), max_bytes=1000)
+        cache.EVICT_BATCH = 8
+        statements = []
+        cache._conn.set_trace_callback(statements.append)
+        for i in range(99):
+            cache.set(f"k{i}", "x" * 10)
+        assert not [sql for sql in statements if "SUM(" in sql]
+        
+        cache.set("k99", "x" * 20)
+        assert len([sql for sql in statements if "SUM(" in sql]) == 1
+        assert all("LIMIT" in sql for sql in statements if "ORDER BY accessed_at" in sql)
+        assert cache._total_bytes == cache._stored_bytes() <= 900
+        assert cache.get("k0") is None and cache.get("k99") == "x" * 20
+
+
+class TestBatchedPrompts:
+    """Test multi-email batched prompts in AIService"""
+    
+    @pytest.mark.asyncio
+    async def test_batch_splits_results_and_falls_back(self):
+        """Test one batched call covers most emails and misses fall back per email"""
+        import json
+        
+        ai_service = AIService()
+        ai_service.model = Mock()
+        ai_service.model.generate_content.side_effect = [
+            # Batched call: email 1 is missing from the response
+            Mock(text="```json\n" + json.dumps([
+                {"id": 0, "summary": "First summary."},
+                {"id": 2, "summary": "Third summary."}
+            ]) + "\n```"),
+            # Per-email fallback for email 1
+            Mock(text="Second summary.")
+        ]
+        bodies = [f"Batched prompt test email {i} (unique body)" for i in range(3)]
+        
+        summaries = await ai_service.generate_summaries(bodies)
+        
+        assert summaries == ["First summary.", "Second summary.", "Third summary."]
+        assert ai_service.model.generate_content.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_unparseable_batch_falls_back(self):
+        """Test a non-JSON batch response degrades to per-email replies"""
+        ai_service = AIService()
+        ai_service.model = Mock()
+        ai_service.model.generate_content.side_effect = [
+            Mock(text="Sorry, here are your replies: ..."),
+            Mock(text="Reply A"),
+            Mock(text="Reply B")
+        ]
+        emails = [{"sender": "a@x.com", "subject": "A", "body": "a"},
+                  {"sender": "b@x.com", "subject": "B", "body": "b"}]
+        
+        assert await ai_service.generate_replies(emails) == ["Reply A", "Reply B"]
+    
+    @pytest.mark.asyncio
+    async def test_metadata_only_emails_build_prompts(self):
+        """Test emails synced without bodies (body=None) still get replies and digests"""
+        ai_service = AIService()
+        ai_service.model = Mock()
+        ai_service.model.generate_content.return_value = Mock(text='[{"id": 0, "reply": "Reply A"}]')
+        emails = [{"sender": "a@x.com", "subject": None, "body": None, "summary": None, "snippet": None}]
+        
+        assert await ai_service.generate_replies(emails) == ["Reply A"]
+        
+        ai_service.model.generate_content.return_value = Mock(text="Digest")
+        assert await ai_service.generate_daily_digest(emails) == "Digest"
+        assert "Unknown" not in ai_service.model.generate_content.call_args[0][0]
+        assert ai_service.fallback_summary(None) == ""
+    
+    def test_pack_batches_respects_size_and_token_budget(self):
+        """Test batches are bounded by item count and estimated tokens"""
+        from ai_service import _pack_batches
+        
+        assert _pack_batches(["x"] * 5, batch_size=2, token_budget=1000) == [[0, 1], [2, 3], [4]]
+        assert _pack_batches(["x" * 400] * 3, batch_size=10, token_budget=250) == [[0, 1], [2]]
+    
+    @pytest.mark.asyncio
+    async def test_pipeline_groups_emails_per_call(self):
+        """Test the summarization pipeline sends groups of emails per call"""
+        from summary_pipeline import summarize_emails
+        
+        class StubAI:
+            calls = []
+            
+            async def generate_summaries(self, bodies):
+                self.calls.append(len(bodies))
+                return [f"summary: {b}" for b in bodies]
+        
+        ai = StubAI()
+        emails = [{"body": str(i)} for i in range(20)]
+        await summarize_emails(ai, emails, batch_size=8)
+        
+        assert ai.calls == [8, 8, 4]
+        assert [e["summary"] for e in emails] == [f"summary: {i}" for i in range(20)]
+
+
+class TestModelRegistry:
+    """Test the process-wide Gemini model registry"""
+    
+    def test_services_share_models(self):
+        """Test models are built once and reused by every service instance"""
+        import model_registry
+        
+        assert AIService().model is AIService().model
+        assert NLPService().model is model_registry.get_model('gemini-1.5-pro')
+        assert model_registry.get_ai_service() is model_registry.get_ai_service()
+        assert "gemini-pro" in model_registry.registry_stats()["models"]
+    
+    def test_sdk_configured_once(self):
+        """Test building services no longer reconfigures the SDK"""
+        with patch("model_registry.genai.configure") as configure:
+            AIService()
+            NLPService()
+        
+        configure.assert_not_called()
+
+
 class TestRetryLogic:
     """Test retry mechanisms"""
     
@@ -197,6 +680,1328 @@ class TestGmailParsing:
         assert subject == "No Subject"
 
 
+class TestGmailBatchFetch:
+    """Test Gmail fetching over the async transport against the local fake Gmail server"""
+    
+    @pytest.fixture
+    def fake_gmail(self):
+        from benchmarks.fake_gmail_server import FakeGmailServer
+        from config import settings
+        
+        with FakeGmailServer(message_count=60) as server:
+            original = settings.GMAIL_API_ENDPOINT
+            settings.GMAIL_API_ENDPOINT = server.url
+            yield server
+            settings.GMAIL_API_ENDPOINT = original
+    
+    @pytest.mark.asyncio
+    async def test_batched_fetch_matches_per_message(self, fake_gmail):
+        """Test batched and per-message fetches return identical emails"""
+        from gmail_service import GmailService
+        
+        sequential = await GmailService("fake-token").get_recent_emails(max_results=10, batch=False)
+        batched = await GmailService("fake-token").get_recent_emails(max_results=10, batch=True)
+        
+        assert batched == sequential
+        assert [e["id"] for e in batched] == [f"msg{i:06d}" for i in range(10)]
+        assert set(batched[0]) == {"id", "thread_id", "sender", "subject", "date", "body", "snippet"}
+    
+    @pytest.mark.asyncio
+    async def test_batched_fetch_round_trips(self, fake_gmail):
+        """Test a page of N messages costs one list plus ceil(N / BATCH_SIZE) batches"""
+        from gmail_service import GmailService
+        
+        emails = await GmailService("fake-token").get_recent_emails(max_results=60)
+        
+        assert len(emails) == 60
+        assert fake_gmail.state.request_count == 1 + 2
+    
+    @pytest.mark.asyncio
+    async def test_metadata_projection_loads_bodies_lazily(self, fake_gmail):
+        """Test metadata fetches skip bodies until load_bodies is called"""
+        from gmail_service import GmailService
+        
+        service = GmailService("fake-token")
+        full = await service.get_recent_emails(max_results=3)
+        metadata = await service.get_recent_emails(max_results=3, projection="metadata")
+        
+        assert all(e["body"] is None for e in metadata)
+        assert [e["subject"] for e in metadata] == [e["subject"] for e in full]
+        
+        await service.load_bodies(metadata)
+        assert metadata == full
+    
+    @pytest.mark.asyncio
+    async def test_requests_are_timed(self, fake_gmail):
+        """Test every Gmail round trip lands in the latency histogram"""
+        from gmail_service import GmailService
+        from metrics import GMAIL_LATENCY
+        lists = GMAIL_LATENCY.count(method="gmail.users.messages.list", outcome="ok")
+        batches = GMAIL_LATENCY.count(method="batch", outcome="ok")
+        
+        await GmailService("fake-token").get_recent_emails(max_results=60)
+        
+        assert GMAIL_LATENCY.count(method="gmail.users.messages.list", outcome="ok") == lists + 1
+        assert GMAIL_LATENCY.count(method="batch", outcome="ok") == batches + 2
+    
+    @pytest.mark.asyncio
+    async def test_iter_messages_follows_page_tokens(self, fake_gmail):
+        """Test the streaming iterator walks every page in order"""
+        from gmail_service import GmailService
+        
+        service = GmailService("fake-token")
+        ids = [email["id"] async for email in service.iter_messages(page_size=25, read_ahead=10)]
+        
+        assert ids == [f"msg{i:06d}" for i in range(60)]
+    
+    @pytest.mark.asyncio
+    async def test_iter_messages_early_termination(self, fake_gmail):
+        """Test breaking out of the iterator stops fetching further pages"""
+        from gmail_service import GmailService
+        
+        service = GmailService("fake-token")
+        seen = []
+        async for email in service.iter_messages(page_size=10, read_ahead=5):
+            seen.append(email["id"])
+            if len(seen) == 3:
+                break
+        await asyncio.sleep(0.05)
+        
+        assert seen == ["msg000000", "msg000001", "msg000002"]
+        assert fake_gmail.state.request_count <= 4
+        
+        limited = [e async for e in service.iter_messages(page_size=10, limit=15)]
+        assert len(limited) == 15
+    
+    @pytest.mark.asyncio
+    async def test_trash_and_send_over_async_transport(self, fake_gmail):
+        """Test delete and reply go through the pooled async client"""
+        from gmail_service import GmailService
+        
+        service = GmailService("fake-token")
+        deleted = await service.delete_email_by_id("msg000003")
+        sent = await service.send_reply("msg000004", "Thanks, will do.")
+        
+        assert deleted == {"deleted_id": "msg000003"}
+        assert fake_gmail.state.find("msg000003")["labelIds"] == ["TRASH"]
+        assert sent["message_id"].startswith("sent")
+    
+    @pytest.mark.asyncio
+    async def test_missing_message_raises(self, fake_gmail):
+        """Test Gmail HTTP errors surface as exceptions"""
+        from gmail_service import GmailService
+        
+        with pytest.raises(Exception, match="Failed to delete email"):
+            await GmailService("fake-token").delete_email_by_id("does-not-exist")
+    
+    def test_transports_are_closed_with_their_loops(self, fake_gmail):
+        """Test a new event loop closes the pool left by a finished one, and shutdown closes the rest"""
+        import gmail_client
+        from gmail_service import GmailService
+        
+        async def fetch():
+            await GmailService("fake-token").list_message_ids(max_results=2)
+            return gmail_client._transports[asyncio.get_running_loop()]
+        
+        first = asyncio.run(fetch())
+        assert not first.client.is_closed
+        second = asyncio.run(fetch())
+        
+        assert first.client.is_closed
+        assert list(gmail_client._transports.values()) == [second]
+        
+        async def shutdown():
+            await gmail_client.close_http_client()
+        
+        asyncio.run(shutdown())
+        assert second.client.is_closed and not gmail_client._transports
+
+
+class TestInboxSync:
+    """Test history-based incremental sync against the local fake Gmail server"""
+    
+    @pytest.fixture
+    def fake_gmail(self):
+        from benchmarks.fake_gmail_server import FakeGmailServer
+        from config import settings
+        
+        with FakeGmailServer(message_count=30) as server:
+            original = settings.GMAIL_API_ENDPOINT
+            settings.GMAIL_API_ENDPOINT = server.url
+            yield server
+            settings.GMAIL_API_ENDPOINT = original
+    
+    @pytest.mark.asyncio
+    async def test_steady_state_costs_one_call(self, fake_gmail):
+        """Test a refresh with no mailbox changes makes a single history call"""
+        from gmail_service import GmailService
+        from inbox_sync import InboxSync
+        
+        sync = InboxSync()
+        service = GmailService("fake-token")
+        first = await sync.get_recent_emails("user-1", service, count=20)
+        
+        before = fake_gmail.state.request_count
+        second = await sync.get_recent_emails("user-1", service, count=20)
+        
+        assert second == first
+        assert fake_gmail.state.request_count - before == 1
+    
+    @pytest.mark.asyncio
+    async def test_applies_added_and_trashed_messages(self, fake_gmail):
+        """Test new messages appear first and trashed ones disappear"""
+        from gmail_service import GmailService
+        from inbox_sync import InboxSync
+        
+        sync = InboxSync()
+        service = GmailService("fake-token")
+        await sync.get_recent_emails("user-1", service, count=5)
+        
+        fake_gmail.state.add_message(999)
+        fake_gmail.state.trash_message("msg000001")
+        emails = await sync.get_recent_emails("user-1", service, count=5)
+        
+        assert [e["id"] for e in emails] == ["msg000999", "msg000000", "msg000002", "msg000003", "msg000004"]
+        assert set(emails[0]) == {"id", "thread_id", "sender", "subject", "date", "body", "snippet"}
+    
+    @pytest.mark.asyncio
+    async def test_expired_checkpoint_falls_back_to_full_sync(self, fake_gmail):
+        """Test an expired historyId triggers a full resync"""
+        from gmail_service import GmailService
+        from inbox_sync import InboxSync
+        
+        sync = InboxSync()
+        service = GmailService("fake-token")
+        await sync.get_recent_emails("user-1", service, count=5)
+        sync._mailbox("user-1").history_id = "0"
+        
+        emails = await sync.get_recent_emails("user-1", service, count=5)
+        
+        assert [e["id"] for e in emails] == [f"msg{i:06d}" for i in range(5)]
+    
+    @pytest.mark.asyncio
+    async def test_checkpoint_is_mailbox_history_id(self, fake_gmail):
+        """Test a full sync checkpoints at getProfile's historyId, not the listed messages'"""
+        from gmail_service import GmailService
+        from inbox_sync import InboxSync
+        
+        fake_gmail.state.trash_message("msg000001")
+        fake_gmail.state.trash_message("msg000002")
+        sync = InboxSync()
+        service = GmailService("fake-token")
+        await sync.get_recent_emails("user-1", service, count=5)
+        
+        assert sync._mailbox("user-1").history_id == str(fake_gmail.state.history_id)
+        history = await service.get_history(sync._mailbox("user-1").history_id)
+        assert history["history"] == []
+    
+    def test_logout_forgets_local_mailbox(self):
+        """Test logout drops the user's synced messages"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        import auth_utils
+        from auth_routes import router
+        from inbox_sync import InboxSync
+        from session_store import MemorySessionStore
+        app = FastAPI()
+        app.include_router(router)
+        sync = InboxSync()
+        sync._mailbox("u1").history_id = "5"
+        token = auth_utils.create_access_token({"sub": "u1", "email": "a@example.com"})
+        store = MemorySessionStore(ttl=60)
+        store.save("u1", {"access_token": token})
+        
+        with patch("auth_routes.inbox_sync", sync), patch("auth_routes.session_store", store):
+            response = TestClient(app).post("/auth/logout", headers={"Authorization": f"Bearer {token}"})
+        
+        assert response.status_code == 200
+        assert "u1" not in sync.store
+
+
+class TestCaching:
+    """Test the shared LRU/TTL cache and per-process Gmail resources"""
+    
+    def test_lru_eviction(self):
+        """Test least recently used entries are evicted first"""
+        from cache_utils import TTLCache
+        
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        
+        assert "a" in cache and "c" in cache
+        assert "b" not in cache
+    
+    def test_ttl_expiry(self):
+        """Test expired entries are treated as misses"""
+        from cache_utils import TTLCache
+        
+        cache = TTLCache(maxsize=10, ttl=0.01)
+        cache.set("token", "value")
+        assert cache.get("token") == "value"
+        
+        import time
+        time.sleep(0.02)
+        assert cache.get("token") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+    
+    def test_gmail_resource_shared_across_requests(self):
+        """Test per-request GmailService objects reuse the built resource and token binding"""
+        from gmail_service import GmailService
+        
+        first = GmailService("token-a")
+        second = GmailService("token-a")
+        other = GmailService("token-b")
+        
+        assert first._get_service() is second._get_service() is other._get_service()
+        assert first.client is second.client
+        assert other.client is not first.client
+
+
+class TestTokenCache:
+    """Test the verified-JWT cache behind the shared auth dependency"""
+    
+    def test_repeat_verification_skips_decode(self):
+        """A token is decoded once and then served from the cache"""
+        import auth_utils
+        token = auth_utils.create_access_token({"sub": "u1", "email": "a@example.com", "access_token": "g"})
+        
+        with patch("auth_utils.jwt.decode", wraps=auth_utils.jwt.decode) as decode:
+            first = auth_utils.verify_token(token)
+            second = auth_utils.verify_token(token)
+        
+        assert decode.call_count == 1
+        assert first.email == second.email == "a@example.com"
+    
+    def test_cached_token_expires_with_exp(self):
+        """Cache entries do not outlive the token's exp claim"""
+        import auth_utils
+        from datetime import timedelta
+        import time
+        token = auth_utils.create_access_token({"sub": "u1", "email": "a@example.com"}, timedelta(seconds=30))
+        assert auth_utils.verify_token(token) is not None
+        
+        _, expires_at = auth_utils._verified_tokens._data[token]
+        assert expires_at <= time.monotonic() + 30
+        
+        with patch("cache_utils.time.monotonic", return_value=time.monotonic() + 31):
+            with patch("auth_utils.jwt.decode", side_effect=auth_utils.JWTError("expired")):
+                assert auth_utils.verify_token(token) is None
+    
+    def test_invalid_tokens_are_not_cached(self):
+        """Bad tokens are rejected every time and never stored"""
+        import auth_utils
+        size = auth_utils.token_cache_stats()["size"]
+        
+        assert auth_utils.verify_token("not-a-jwt") is None
+        assert auth_utils.verify_token("not-a-jwt") is None
+        assert auth_utils.token_cache_stats()["size"] == size
+    
+    def test_auth_routes_share_dependency(self):
+        """/auth/me and /auth/check-permissions reject bad tokens with 401"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from auth_routes import router
+        app = FastAPI()
+        app.include_router(router)
+        client = TestClient(app)
+        
+        for path in ("/auth/me", "/auth/check-permissions"):
+            assert client.get(path).status_code == 401
+            assert client.get(path, headers={"Authorization": "Bearer bad"}).status_code == 401
+        assert client.post("/auth/logout").json()["message"] == "Already logged out"
+
+
+def _save_users_worker(path, worker, count):
+    """Process body for the multi-process user write stress test"""
+    from database import Database
+    store = Database(path)
+    for i in range(count):
+        store.create_or_update_user(f"w{worker}-{i}", f"w{worker}-{i}@example.com", f"Worker {worker}")
+        store.get_user(f"w{worker}-{i}")
+
+
+class TestDatabase:
+    """Test the JSON and SQLite user stores"""
+    
+    @pytest.fixture(params=["json", "sqlite"])
+    def store(self, request, tmp_path):
+        from database import Database, SQLiteDatabase
+        if request.param == "json":
+            return Database(str(tmp_path / "users.json"))
+        return SQLiteDatabase(str(tmp_path / "users.db"), json_file=None)
+    
+    def test_user_round_trip(self, store):
+        """Both backends expose the same user behaviour"""
+        created = store.create_or_update_user("u1", "a@example.com", "Ann", "pic.png", "creds-1")
+        assert created["email"] == "a@example.com" and created["created_at"] == created["last_login"]
+        
+        updated = store.create_or_update_user("u1", "a@example.com", "Ann B", None, None)
+        assert updated["name"] == "Ann B"
+        assert updated["google_credentials"] == "creds-1"
+        assert store.get_user("u1") == updated
+        assert store.get_user_by_email("a@example.com")["id"] == "u1"
+        assert store.get_user("missing") is None and store.get_user_by_email("x@example.com") is None
+        assert store.get_google_credentials("u1") == "creds-1"
+        assert store.pop_legacy_sessions() == {}
+    
+    def test_json_reads_served_from_memory(self, tmp_path):
+        """Repeat reads do not re-parse the file; the email index finds users"""
+        from database import Database
+        store = Database(str(tmp_path / "users.json"))
+        store.create_or_update_user("u1", "a@example.com", "Ann")
+        
+        with patch("database.json.load") as load:
+            for _ in range(5):
+                assert store.get_user("u1")["name"] == "Ann"
+                assert store.get_user_by_email("a@example.com")["id"] == "u1"
+            load.assert_not_called()
+    
+    def test_json_reloads_after_external_write(self, tmp_path):
+        """A write by another process is picked up; unflushed changes survive it"""
+        import json
+        from database import Database
+        path = str(tmp_path / "users.json")
+        store = Database(path, write_delay=60)
+        other = Database(path)
+        store.create_or_update_user("u1", "a@example.com", "Mine")
+        
+        other.create_or_update_user("u2", "b@example.com", "Bob")
+        assert store.get_user_by_email("b@example.com")["id"] == "u2"
+        assert store.get_user("u1")["name"] == "Mine"
+        
+        store.flush()
+        with open(path) as f:
+            on_disk = json.load(f)
+        assert "u2" in on_disk["users"] and on_disk["users"]["u1"]["name"] == "Mine"
+    
+    def test_json_write_behind_coalesces(self, tmp_path):
+        """With a write delay, many changes become one file write"""
+        import time
+        from database import Database
+        store = Database(str(tmp_path / "users.json"), write_delay=0.05)
+        
+        with patch.object(Database, "_write_db", autospec=True, side_effect=Database._write_db) as write:
+            for i in range(20):
+                store.create_or_update_user(f"u{i}", f"u{i}@example.com", f"User {i}")
+            assert write.call_count == 0
+            time.sleep(0.2)
+            assert write.call_count == 1
+        
+        assert Database(store.db_file).get_user("u19")["name"] == "User 19"
+    
+    @pytest.mark.skipif(sys.platform == "win32", reason="needs fcntl and fork")
+    def test_json_concurrent_processes_lose_nothing(self, tmp_path):
+        """Many processes saving users at once keep every user and a valid file"""
+        import json
+        import multiprocessing
+        from database import Database
+        path = str(tmp_path / "users.json")
+        Database(path)
+        
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=_save_users_worker, args=(path, w, 25)) for w in range(6)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join(timeout=60)
+            assert process.exitcode == 0
+        
+        with open(path) as f:
+            data = json.load(f)
+        assert len(data["users"]) == 6 * 25
+        assert data["version"] == 1 + 6 * 25
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    
+    def test_json_failed_write_keeps_previous_file(self, tmp_path):
+        """A crash mid-write leaves the old file intact and no temp file behind"""
+        from database import Database
+        path = str(tmp_path / "users.json")
+        store = Database(path)
+        store.create_or_update_user("u1", "a@example.com", "Old")
+        
+        with patch("database.json.dump", side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                store.create_or_update_user("u1", "a@example.com", "New")
+        
+        assert Database(path).get_user("u1")["name"] == "Old"
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    
+    def test_sqlite_migrates_json_once(self, tmp_path):
+        """Existing users.json data is imported on first open only"""
+        import json
+        from database import SQLiteDatabase
+        json_file = tmp_path / "users.json"
+        json_file.write_text(json.dumps({
+            "users": {"u1": {"id": "u1", "email": "a@example.com", "name": "Ann", "picture": None,
+                             "google_credentials": "c", "created_at": "2025-01-01", "last_login": "2025-01-02"}},
+            "sessions": {"u1": {"email": "a@example.com"}}
+        }))
+        
+        store = SQLiteDatabase(str(tmp_path / "users.db"), json_file=str(json_file))
+        assert store.get_user_by_email("a@example.com")["created_at"] == "2025-01-01"
+        store.create_or_update_user("u1", "a@example.com", "Ann B")
+        store.close()
+        
+        reopened = SQLiteDatabase(str(tmp_path / "users.db"), json_file=str(json_file))
+        assert reopened.get_user("u1")["name"] == "Ann B"
+    
+    def test_sqlite_lookups_use_indexes(self, tmp_path):
+        """User id and email lookups are index searches, not table scans"""
+        from database import SQLiteDatabase
+        store = SQLiteDatabase(str(tmp_path / "users.db"), json_file=None)
+        
+        for sql in ("SELECT * FROM users WHERE id = ?", "SELECT * FROM users WHERE email = ? LIMIT 1"):
+            plan = " ".join(row[-1] for row in store._conn.execute(f"EXPLAIN QUERY PLAN {sql}", ("x",)))
+            assert "USING" in plan and "SCAN" not in plan
+        assert store._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+class TestSessionStore:
+    """Test session TTL expiry across store backends"""
+    
+    class FakeRedis:
+        """In-memory stand-in for redis-py's get/set/delete and sorted sets"""
+        
+        def __init__(self, clock):
+            self.clock = clock
+            self.data = {}
+            self.zsets = {}
+        
+        def set(self, name, value, ex=None):
+            self.data[name] = (value, self.clock() + ex if ex else None)
+        
+        def get(self, name):
+            value, expires_at = self.data.get(name, (None, None))
+            if expires_at is not None and expires_at <= self.clock():
+                del self.data[name]
+                return None
+            return value
+        
+        def delete(self, *names):
+            removed = 0
+            for name in names:
+                if self.get(name) is not None:
+                    del self.data[name]
+                    removed += 1
+            return removed
+        
+        def zadd(self, name, mapping):
+            self.zsets.setdefault(name, {}).update(mapping)
+        
+        def zrange(self, name, start, end):
+            members = sorted(self.zsets.get(name, {}), key=lambda m: (self.zsets[name][m], m))
+            return members[start:end + 1 if end >= 0 else max(0, len(members) + end + 1)]
+        
+        def zremrangebyrank(self, name, start, end):
+            for member in self.zrange(name, start, end):
+                del self.zsets[name][member]
+        
+        def zremrangebyscore(self, name, low, high):
+            zset = self.zsets.get(name, {})
+            for member in [m for m, score in zset.items() if float(low) <= score <= float(high)]:
+                del zset[member]
+        
+        def zrem(self, name, *members):
+            for member in members:
+                self.zsets.get(name, {}).pop(member, None)
+        
+        def zcard(self, name):
+            return len(self.zsets.get(name, {}))
+    
+    @pytest.fixture(params=["memory", "sqlite", "redis"])
+    def store_and_clock(self, request, tmp_path):
+        from session_store import MemorySessionStore, SQLiteSessionStore, RedisSessionStore
+        now = [1000.0]
+        clock = lambda: now[0]
+        if request.param == "memory":
+            store = MemorySessionStore(ttl=60, clock=clock)
+        elif request.param == "sqlite":
+            store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60, clock=clock)
+        else:
+            store = RedisSessionStore(self.FakeRedis(clock), ttl=60)
+        return store, now
+    
+    def test_sessions_expire_after_ttl(self, store_and_clock):
+        """Sessions are readable until their TTL passes, then gone"""
+        store, now = store_and_clock
+        store.save("u1", {"access_token": "t1"})
+        store.save("u2", {"access_token": "t2"}, ttl=300)
+        
+        now[0] += 59
+        assert store.get("u1") == {"access_token": "t1"}
+        now[0] += 2
+        assert store.get("u1") is None
+        assert store.get("u2") == {"access_token": "t2"}
+        
+        store.delete("u2")
+        assert store.get("u2") is None
+    
+    def test_resave_extends_expiry(self, store_and_clock):
+        """Saving again restarts the TTL"""
+        store, now = store_and_clock
+        store.save("u1", {"n": 1})
+        now[0] += 50
+        store.save("u1", {"n": 2})
+        now[0] += 50
+        
+        assert store.get("u1") == {"n": 2}
+    
+    def test_memory_sweep_pops_only_expired(self):
+        """The expiry heap drops expired sessions and skips stale entries"""
+        from session_store import MemorySessionStore
+        now = [0.0]
+        store = MemorySessionStore(ttl=10, clock=lambda: now[0])
+        for i in range(100):
+            store.save(f"u{i}", {"i": i}, ttl=i + 1)
+        store.save("u0", {"i": 0}, ttl=1000)
+        
+        now[0] = 50.5
+        assert store.sweep() == 49
+        assert len(store) == 51
+        assert store.get("u0") == {"i": 0}
+    
+    def test_redis_store_sets_server_side_expiry(self):
+        """Redis sessions are written with EX so the server expires them"""
+        from session_store import RedisSessionStore
+        client = Mock()
+        store = RedisSessionStore(client, ttl=86400)
+        
+        store.save("u1", {"access_token": "t"})
+        
+        client.set.assert_called_once_with("session:u1", '{"access_token": "t"}', ex=86400)
+    
+    def test_base_store_is_abstract(self):
+        """A backend missing save/get/delete cannot be instantiated"""
+        from session_store import SessionStore
+        
+        class Partial(SessionStore):
+            def save(self, user_id, session_data, ttl=None):
+                pass
+        
+        with pytest.raises(TypeError):
+            Partial(ttl=60)
+    
+    @pytest.mark.parametrize("backend", ["json", "sqlite"])
+    def test_legacy_sessions_migrate_once(self, backend, tmp_path):
+        """Sessions in users.json (or the old SQLite table) move to the store and are removed"""
+        import json
+        import sqlite3
+        from database import Database, SQLiteDatabase
+        from session_store import MemorySessionStore, migrate_legacy_sessions
+        json_file = tmp_path / "users.json"
+        json_file.write_text(json.dumps({"users": {}, "sessions": {"u1": {"token": "t1"}}}))
+        if backend == "json":
+            database = Database(str(json_file))
+        else:
+            conn = sqlite3.connect(str(tmp_path / "users.db"))
+            conn.execute("CREATE TABLE sessions (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            conn.execute("INSERT INTO sessions VALUES ('u2', '{\"token\": \"t2\"}')")
+            conn.commit()
+            conn.close()
+            database = SQLiteDatabase(str(tmp_path / "users.db"), json_file=str(json_file))
+        store = MemorySessionStore(ttl=60)
+        
+        assert migrate_legacy_sessions(store, database) == (1 if backend == "json" else 2)
+        assert store.get("u1") == {"token": "t1"}
+        assert "sessions" not in json.loads(json_file.read_text())
+        if backend == "sqlite":
+            assert store.get("u2") == {"token": "t2"}
+        assert migrate_legacy_sessions(store, database) == 0
+    
+    def test_logout_revokes_token(self):
+        """Routes accept only the JWT of the user's current session"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        import auth_utils
+        from auth_routes import router
+        from session_store import MemorySessionStore
+        app = FastAPI()
+        app.include_router(router)
+        client = TestClient(app)
+        store = MemorySessionStore(ttl=60)
+        token = auth_utils.create_access_token({"sub": "u1", "email": "a@example.com"})
+        headers = {"Authorization": f"Bearer {token}"}
+        
+        with patch("auth_routes.session_store", store), \
+             patch("auth_routes.db.get_google_credentials", return_value=None):
+            assert client.get("/auth/check-permissions", headers=headers).status_code == 401
+            store.save("u1", {"access_token": token})
+            assert client.get("/auth/check-permissions", headers=headers).status_code == 200
+            assert client.post("/auth/logout", headers=headers).status_code == 200
+            assert client.get("/auth/check-permissions", headers=headers).status_code == 401
+            
+            # Logging in again must not bring the old token back
+            new_token = auth_utils.create_access_token({"sub": "u1", "email": "a@example.com", "access_token": "g2"})
+            store.save("u1", {"access_token": new_token})
+            assert client.get("/auth/check-permissions", headers=headers).status_code == 401
+            assert client.post("/auth/logout", headers=headers).status_code == 200
+            assert store.get("u1") is not None
+            assert client.get("/auth/check-permissions",
+                              headers={"Authorization": f"Bearer {new_token}"}).status_code == 200
+
+
+class TestOAuthState:
+    """Test the one-time, expiring OAuth CSRF state store"""
+    
+    @pytest.fixture(params=["memory", "sqlite", "redis"])
+    def store_and_clock(self, request, tmp_path):
+        from oauth_state import MemoryStateStore, SQLiteStateStore, RedisStateStore
+        now = [1000.0]
+        clock = lambda: now[0]
+        if request.param == "memory":
+            store = MemoryStateStore(ttl=600, capacity=100, clock=clock)
+        elif request.param == "sqlite":
+            store = SQLiteStateStore(str(tmp_path / "sessions.db"), ttl=600, capacity=100, clock=clock)
+        else:
+            store = RedisStateStore(TestSessionStore.FakeRedis(clock), ttl=600, capacity=100, clock=clock)
+        return store, now
+    
+    def test_state_is_consumed_once(self, store_and_clock):
+        """A state validates exactly once; unknown states never do"""
+        store, now = store_and_clock
+        store.issue("abc")
+        
+        assert store.consume("abc") is True
+        assert store.consume("abc") is False
+        assert store.consume("never-issued") is False
+    
+    def test_state_expires(self, store_and_clock):
+        """States older than the TTL are rejected"""
+        store, now = store_and_clock
+        store.issue("late")
+        store.issue("on-time")
+        
+        now[0] += 599
+        assert store.consume("on-time") is True
+        now[0] += 2
+        assert store.consume("late") is False
+    
+    def test_capacity_bound_drops_oldest(self, store_and_clock):
+        """Abandoned logins never grow the store past its capacity"""
+        store, now = store_and_clock
+        for i in range(250):
+            now[0] += 0.001
+            store.issue(f"s{i}")
+            assert len(store) <= 100
+        
+        assert store.consume("s249") is True
+        assert store.consume("s150") is True
+        assert store.consume("s149") is False
+        assert store.consume("s0") is False
+        if hasattr(store, "client"):
+            assert len(store.client.data) == 98  # Trimmed states' keys were deleted too
+    
+    def test_callback_rejects_unknown_state(self):
+        """The Google callback redirects with invalid_state for a bad state"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from auth_routes import router
+        app = FastAPI()
+        app.include_router(router)
+        
+        response = TestClient(app).get("/auth/google/callback?code=x&state=forged", follow_redirects=False)
+        
+        assert response.status_code in (302, 307)
+        assert "error=invalid_state" in response.headers["location"]
+
+
+def _rotating_log_worker(log_file):
+    """Process body for the per-process log file test"""
+    import logging
+    import os
+    from logger_service import BatchFileHandler, worker_log_file
+    handler = BatchFileHandler(worker_log_file(log_file), maxBytes=1000, backupCount=5)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    for _ in range(200):
+        handler.emit(logging.makeLogRecord({"msg": f"worker {os.getpid()}"}))
+    handler.close()
+
+
+class TestLogging:
+    """Test the queued, batching logging pipeline"""
+    
+    def _record(self, level, msg, *args):
+        import logging
+        return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    
+    def test_full_queue_drops_info_records(self):
+        """INFO records are dropped, not blocked on, when the queue is full"""
+        import logging
+        import queue
+        import time
+        from logger_service import DroppingQueueHandler
+        handler = DroppingQueueHandler(queue.Queue(maxsize=2), block_timeout=0.05)
+        
+        start = time.perf_counter()
+        for i in range(5):
+            handler.handle(self._record(logging.INFO, "event %d", i))
+        
+        assert time.perf_counter() - start < 0.05
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+    
+    def test_warnings_wait_for_space(self):
+        """WARNING+ records get a short backpressure window before dropping"""
+        import logging
+        import queue
+        import threading
+        from logger_service import DroppingQueueHandler
+        handler = DroppingQueueHandler(queue.Queue(maxsize=1), block_timeout=1.0)
+        handler.handle(self._record(logging.INFO, "filler"))
+        
+        threading.Timer(0.05, handler.queue.get).start()
+        handler.handle(self._record(logging.ERROR, "must not be lost"))
+        
+        assert handler.dropped == 0
+        assert handler.queue.get().getMessage() == "must not be lost"
+    
+    def test_listener_writes_in_batches(self, tmp_path):
+        """The listener formats records, flushes once per batch and reports drops"""
+        import logging
+        import queue
+        from logger_service import BatchFileHandler, BatchingQueueListener, DroppingQueueHandler, LOG_FORMAT
+        log_queue = queue.Queue(maxsize=100)
+        queue_handler = DroppingQueueHandler(log_queue)
+        file_handler = BatchFileHandler(str(tmp_path / "app.log"))
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        flushes = []
+        file_handler.flush_batch = lambda: (flushes.append(1), BatchFileHandler.flush_batch(file_handler))
+        
+        for i in range(50):
+            queue_handler.handle(self._record(logging.INFO, "Gmail API - %s: Success for %s", "list", f"user{i}"))
+        queue_handler.dropped = 7
+        listener = BatchingQueueListener(log_queue, [file_handler], queue_handler, batch_size=256)
+        listener.start()
+        listener.stop()
+        
+        lines = (tmp_path / "app.log").read_text().splitlines()
+        assert len(lines) == 51
+        assert lines[0].endswith("test - INFO - Gmail API - list: Success for user0")
+        assert "dropped 7 records" in lines[-1]
+        assert len(flushes) == 1
+    
+    def test_each_process_writes_its_own_log_file(self, tmp_path):
+        """Workers rotate their own app.<pid>.log instead of a shared app.log"""
+        import multiprocessing
+        ctx = multiprocessing.get_context("fork")
+        log_file = str(tmp_path / "app.log")
+        workers = [ctx.Process(target=_rotating_log_worker, args=(log_file,)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=30)
+        
+        for worker in workers:
+            active = tmp_path / f"app.{worker.pid}.log"
+            backups = sorted(tmp_path.glob(f"app.{worker.pid}.log.*"))
+            lines = active.read_text().splitlines()
+            for backup in backups:
+                lines += backup.read_text().splitlines()
+            assert backups
+            assert len(lines) == 200
+            assert all(line.endswith(f"worker {worker.pid}") for line in lines)
+        assert not (tmp_path / "app.log").exists()
+    
+    def test_exception_text_survives_queue(self, tmp_path):
+        """Tracebacks are rendered before the record crosses threads"""
+        import logging
+        import queue
+        from logger_service import DroppingQueueHandler
+        handler = DroppingQueueHandler(queue.Queue())
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            import sys as _sys
+            record = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed", (), _sys.exc_info())
+        handler.handle(record)
+        
+        queued = handler.queue.get()
+        assert queued.exc_info is None
+        assert "ValueError: boom" in queued.exc_text
+        assert record.exc_info is not None
+    
+    def test_queued_record_is_a_merged_copy(self):
+        """Args are merged at call time and the caller's record is left untouched"""
+        import logging
+        import queue
+        from logger_service import DroppingQueueHandler
+        handler = DroppingQueueHandler(queue.Queue())
+        recipients = ["a@example.com"]
+        record = self._record(logging.INFO, "sending to %s", recipients)
+        
+        handler.handle(record)
+        recipients.append("b@example.com")
+        
+        queued = handler.queue.get()
+        assert queued is not record
+        assert queued.msg == "sending to ['a@example.com']" and queued.args is None
+        assert queued.trace == ""
+        assert record.args == (recipients,) and not hasattr(record, "trace")
+
+
+def _write_events_worker(directory, worker, count):
+    """Process body for the multi-process event sink test"""
+    from event_sink import EventSink
+    sink = EventSink(directory, max_bytes=2000, max_segments=1000)
+    for i in range(count):
+        sink.write({"event": "gmail_api_call", "user": f"w{worker}", "i": i})
+    sink.flush()
+    sink.close()
+
+
+class TestEventSink:
+    """Test the structured NDJSON event log and its query helpers"""
+    
+    def _event(self, i, **fields):
+        event = {"event": "gmail_api_call", "operation": "list", "user": f"user{i % 3}",
+                 "success": i % 4 != 0, "timestamp": f"2025-01-01T00:00:{i:02d}"}
+        event.update(fields)
+        return event
+    
+    def test_size_rotation_compresses_segments(self, tmp_path):
+        """Full segments are gzipped, and only the newest max_segments are kept"""
+        from event_sink import EventSink, iter_events, list_segments
+        now = [1000.0]
+        sink = EventSink(str(tmp_path), max_bytes=500, max_segments=3, clock=lambda: now[0])
+        for i in range(60):
+            now[0] += 1
+            sink.write(self._event(i))
+        sink.flush()
+        
+        segments = list_segments(str(tmp_path))
+        assert len(segments) == 3
+        assert all(path.endswith(".ndjson.gz") for path in segments)
+        kept = [event["timestamp"] for event in iter_events(str(tmp_path))]
+        assert kept == sorted(kept)
+        assert kept[-1] == "2025-01-01T00:00:59"
+    
+    def test_age_rotation(self, tmp_path):
+        """The active file rotates once it is older than max_age"""
+        from event_sink import EventSink, list_segments
+        now = [1000.0]
+        sink = EventSink(str(tmp_path), max_age=60, clock=lambda: now[0])
+        sink.write(self._event(1))
+        now[0] += 59
+        sink.write(self._event(2))
+        assert list_segments(str(tmp_path)) == []
+        
+        now[0] += 2
+        sink.write(self._event(3))
+        sink.flush()
+        assert len(list_segments(str(tmp_path))) == 1
+    
+    def test_workers_rotate_independently(self, tmp_path):
+        """Concurrent worker processes each rotate their own file without losing events"""
+        import multiprocessing
+        from event_sink import iter_events, list_segments
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=_write_events_worker, args=(str(tmp_path), w, 200)) for w in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join(timeout=60)
+            assert process.exitcode == 0
+        
+        events = list(iter_events(str(tmp_path)))
+        assert len(events) == 800
+        for w in range(4):
+            assert [e["i"] for e in events if e["user"] == f"w{w}"] == list(range(200))
+        assert len(list_segments(str(tmp_path))) > 4
+    
+    def test_orphaned_active_file_is_rotated(self, tmp_path):
+        """A new sink seals the active file of a worker that has exited"""
+        import multiprocessing
+        from event_sink import EventSink, iter_events, list_active, list_segments
+        exited = multiprocessing.get_context("fork").Process(target=int)
+        exited.start()
+        exited.join()
+        (tmp_path / f"events.{exited.pid}.ndjson").write_bytes(b'{"event":"left_behind"}\n')
+        
+        EventSink(str(tmp_path))
+        
+        assert len(list_segments(str(tmp_path))) == 1
+        assert all(str(exited.pid) not in path for path in list_active(str(tmp_path)))
+        assert [e["event"] for e in iter_events(str(tmp_path))] == ["left_behind"]
+    
+    def test_query_filters_and_groups(self, tmp_path):
+        """Queries stream across segments with field, since and failure filters"""
+        from event_sink import EventSink, iter_events, summarize
+        sink = EventSink(str(tmp_path), max_bytes=300)
+        for i in range(40):
+            sink.write(self._event(i))
+        sink.write(self._event(40, event="ai_call", user=None))
+        sink.flush()
+        
+        user1 = list(iter_events(str(tmp_path), user="user1"))
+        assert len(user1) == 13
+        assert all(event["user"] == "user1" for event in user1)
+        assert len(list(iter_events(str(tmp_path), since="2025-01-01T00:00:30"))) == 11
+        
+        groups = summarize(iter_events(str(tmp_path), event="gmail_api_call"), "user")
+        assert groups["user0"] == {"count": 14, "failures": 4}
+        assert sum(group["failures"] for group in groups.values()) == 10
+    
+    def test_event_logger_writes_events(self, tmp_path):
+        """EventLogger events reach the sink through the logging handler"""
+        import logging
+        from event_sink import EventSink, EventSinkHandler, iter_events
+        from logger_service import EventLogger, logger
+        handler = EventSinkHandler(EventSink(str(tmp_path)))
+        logger.addHandler(handler)
+        try:
+            EventLogger.log_gmail_call("delete_email", "a@example.com", False, error="404")
+            logger.info("plain text line")
+        finally:
+            logger.removeHandler(handler)
+        handler.flush_batch()
+        
+        events = list(iter_events(str(tmp_path)))
+        assert len(events) == 1
+        assert events[0]["operation"] == "delete_email"
+        assert events[0]["success"] is False
+
+
+class TestMetrics:
+    """Test the metrics registry, Prometheus rendering and request timing"""
+    
+    def test_histogram_buckets_and_quantiles(self):
+        """Observations land in cumulative buckets; quantiles interpolate inside them"""
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        latency = registry.histogram("op_seconds", "Op latency", ("op",), buckets=(0.1, 0.5, 1.0))
+        for value in [0.05] * 90 + [0.3] * 9 + [2.0]:
+            latency.observe(value, op="read")
+        
+        text = registry.render()
+        assert 'op_seconds_bucket{op="read",le="0.1"} 90' in text
+        assert 'op_seconds_bucket{op="read",le="0.5"} 99' in text
+        assert 'op_seconds_bucket{op="read",le="+Inf"} 100' in text
+        assert 'op_seconds_count{op="read"} 100' in text
+        assert latency.quantile(0.5, op="read") == pytest.approx(0.1 * 50 / 90)
+        assert 0.1 < latency.quantile(0.95, op="read") <= 0.5
+        assert latency.quantile(0.5, op="write") is None
+    
+    def test_counters_gauges_and_collectors(self):
+        """Counters, gauges and scrape-time collectors render with HELP/TYPE headers"""
+        from metrics import Metric, MetricsRegistry
+        registry = MetricsRegistry()
+        errors = registry.counter("errors_total", "Errors", ("kind",))
+        errors.inc(kind='quote"d')
+        errors.inc(2, kind='quote"d')
+        registry.gauge("depth", "Queue depth").set(7)
+        registry.register_collector(lambda: [("hits_total", "counter", "Hits", [({"cache": "jwt"}, 3)])])
+        
+        text = registry.render()
+        assert "# TYPE errors_total counter" in text
+        assert 'errors_total{kind="quote\\"d"} 3' in text
+        assert "depth 7" in text
+        assert 'hits_total{cache="jwt"} 3' in text
+        assert registry.counter("errors_total", "Errors", ("kind",)) is errors
+        with pytest.raises(ValueError):
+            errors.inc(wrong="label")
+        with pytest.raises(TypeError):
+            Metric("untyped", "A family without samples()")
+    
+    def test_middleware_labels_route_templates(self):
+        """Requests are labelled by route template and status, not raw path"""
+        from fastapi import FastAPI, HTTPException
+        from fastapi.testclient import TestClient
+        from metrics import MetricsRegistry, MetricsMiddleware
+        registry = MetricsRegistry()
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware, registry=registry)
+        
+        @app.get("/items/{item_id}")
+        async def item(item_id: int):
+            if item_id == 0:
+                raise HTTPException(status_code=404)
+            return {}
+        
+        client = TestClient(app)
+        for item_id in (1, 2, 0):
+            client.get(f"/items/{item_id}")
+        client.get("/missing")
+        
+        latency = registry.histogram("http_request_duration_seconds", "", ("method", "route", "status"))
+        assert latency.count(method="GET", route="/items/{item_id}", status="200") == 2
+        assert latency.count(method="GET", route="/items/{item_id}", status="404") == 1
+        assert latency.count(method="GET", route="unmatched", status="404") == 1
+    
+    def test_gemini_calls_are_timed(self):
+        """AI service model calls are timed by operation, failures included"""
+        from metrics import GEMINI_LATENCY
+        mock_model = Mock()
+        mock_model.generate_content.side_effect = RuntimeError("quota")
+        before = GEMINI_LATENCY.count(service="ai", operation="reply", outcome="error")
+        
+        AIService(model=mock_model)._reply_one("a@example.com", "Hi", "Body", "Summary")
+        
+        assert GEMINI_LATENCY.count(service="ai", operation="reply", outcome="error") == before + 1
+    
+    def test_metrics_endpoint(self):
+        """The app serves Prometheus text at /metrics"""
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+        client.get("/health")
+        
+        response = client.get("/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
+        assert 'cache_hits_total{cache="jwt"}' in response.text
+
+
+class TestTracing:
+    """Test request traces, span propagation and the debug waterfall"""
+    
+    @pytest.mark.asyncio
+    async def test_spans_follow_tasks_and_executor_hops(self):
+        """Spans opened in gathered tasks and run_in_executor calls join the request trace"""
+        from tracing import Tracer, span
+        mock_model = Mock()
+        mock_model.generate_content.return_value = Mock(text="Short summary")
+        ai_service = AIService(model=mock_model)
+        tracer = Tracer()
+        
+        async def stage(index):
+            with span("stage", index=index):
+                await ai_service.generate_summary(f"Unique body {index} for the tracing test")
+        
+        with tracer.start_trace("GET /emails/daily-digest") as trace:
+            with span("summarize_emails"):
+                await asyncio.gather(stage(0), stage(1))
+        
+        by_id = {s.span_id: s for s in trace.spans}
+        names = [s.name for s in trace.spans]
+        assert names.count("stage") == 2 and names.count("gemini.summary") == 2
+        for s in trace.spans:
+            if s.name == "gemini.summary":
+                assert by_id[s.parent_id].name == "stage"
+            if s.name == "stage":
+                assert by_id[s.parent_id].name == "summarize_emails"
+        assert all(s.end is not None for s in trace.spans)
+        assert tracer.slowest(1)[0] is trace
+    
+    def test_span_records_errors_and_is_noop_outside_trace(self):
+        """Failed stages keep their error; spans outside a request do nothing"""
+        from tracing import Tracer, span
+        with span("orphan") as orphan:
+            assert orphan is None
+        
+        tracer = Tracer()
+        with pytest.raises(ValueError):
+            with tracer.start_trace("POST /emails/send-reply") as trace:
+                with span("gmail.users.messages.send"):
+                    raise ValueError("boom")
+        
+        assert trace.spans[1].error == "ValueError: boom"
+        assert trace.root.error == "ValueError: boom"
+    
+    def test_middleware_returns_trace_id_and_tags_logs(self, tmp_path):
+        """Responses carry X-Trace-Id; logs and exported traces share it"""
+        import logging
+        import queue
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from event_sink import EventSink, iter_events
+        from logger_service import DroppingQueueHandler
+        from tracing import FileExporter, Tracer, TracingMiddleware
+        tracer = Tracer(exporter=FileExporter(EventSink(str(tmp_path), basename="traces")))
+        app = FastAPI()
+        app.add_middleware(TracingMiddleware, request_tracer=tracer)
+        log_queue = queue.Queue()
+        handler = DroppingQueueHandler(log_queue)
+        
+        @app.get("/items/{item_id}")
+        async def item(item_id: int):
+            handler.handle(logging.LogRecord("test", logging.INFO, __file__, 1, "inside", (), None))
+            return {}
+        
+        client = TestClient(app)
+        response = client.get("/items/7")
+        reused = client.get("/items/8", headers={"X-Trace-Id": "abcdef0123456789"})
+        
+        trace_id = response.headers["x-trace-id"]
+        assert reused.headers["x-trace-id"] == "abcdef0123456789"
+        assert log_queue.get().trace_id == trace_id
+        tracer.exporter.flush()
+        exported = list(iter_events(str(tmp_path), basename="traces"))
+        assert [t["trace_id"] for t in exported] == [trace_id, "abcdef0123456789"]
+        assert exported[0]["name"] == "GET /items/{item_id}"
+        assert exported[0]["spans"][0]["attributes"] == {"status": 200}
+    
+    def test_export_runs_off_the_request_thread(self, tmp_path):
+        """Finished traces are written by the exporter thread; a full queue drops instead of blocking"""
+        import threading
+        from event_sink import EventSink
+        from tracing import FileExporter, Tracer
+        sink = EventSink(str(tmp_path), basename="traces")
+        writers = []
+        original_write = sink.write
+        
+        def write(event):
+            writers.append(threading.current_thread().name)
+            original_write(event)
+        
+        sink.write = write
+        exporter = FileExporter(sink, max_queue=2)
+        tracer = Tracer(exporter=exporter)
+        with tracer.start_trace("GET /a"):
+            pass
+        exporter.flush()
+        assert writers == ["trace-exporter"]
+        
+        # One trace stuck in a slow write, two queued, the rest dropped
+        exporter.batch_size = 1
+        blocked = threading.Event()
+        sink.write = lambda event: blocked.wait(5)
+        for i in range(6):
+            with tracer.start_trace(f"GET /{i}"):
+                pass
+        assert exporter.dropped >= 3
+        blocked.set()
+        exporter.stop()
+    
+    def test_waterfall_and_debug_endpoint(self):
+        """The admin-only endpoint lists the slowest traces as waterfalls"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from config import settings
+        from debug_routes import router
+        from tracing import tracer, span, waterfall
+        app = FastAPI()
+        app.include_router(router)
+        client = TestClient(app)
+        with tracer.start_trace("GET /emails/daily-digest") as trace:
+            with span("inbox_sync.get_recent_emails"):
+                pass
+            with span("render_digest"):
+                pass
+        
+        lines = waterfall(trace.to_dict())
+        assert lines[0].startswith("GET /emails/daily-digest")
+        assert lines[1].startswith("  inbox_sync.get_recent_emails")
+        
+        original = settings.ADMIN_TOKEN
+        try:
+            settings.ADMIN_TOKEN = ""
+            assert client.get("/debug/traces/slowest").status_code == 404
+            settings.ADMIN_TOKEN = "secret"
+            assert client.get("/debug/traces/slowest", headers={"X-Admin-Token": "wrong"}).status_code == 403
+            assert client.get("/debug/traces/slowest", headers={"X-Admin-Token": "sécret".encode()}).status_code == 403
+            response = client.get("/debug/traces/slowest?route=GET /emails/daily-digest",
+                                  headers={"X-Admin-Token": "secret"})
+        finally:
+            settings.ADMIN_TOKEN = original
+        
+        assert response.status_code == 200
+        traces = response.json()["traces"]
+        assert traces[0]["name"] == "GET /emails/daily-digest"
+        assert [s["name"] for s in traces[0]["spans"]][1:] == ["inbox_sync.get_recent_emails", "render_digest"]
+        assert len(traces[0]["waterfall"]) == 3
+
+
+def _profiled_busy_work(seconds):
+    """CPU-bound stand-in for regex/base64 hot spots in the profiling tests"""
+    import time
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(200))
+
+
+class TestProfiling:
+    """Test the sampling profiler and its admin endpoints"""
+    
+    def _app(self, profiler, sample_rate):
+        from fastapi import FastAPI
+        from profiling import ProfilingMiddleware
+        app = FastAPI()
+        app.add_middleware(ProfilingMiddleware, profiler=profiler, sample_rate=sample_rate)
+        
+        @app.get("/busy/{item_id}")
+        async def busy(item_id: int):
+            _profiled_busy_work(0.1)
+            return {}
+        
+        return app
+    
+    def test_sampled_requests_produce_collapsed_stacks(self):
+        """CPU time of a profiled request is attributed to its route template"""
+        from fastapi.testclient import TestClient
+        from profiling import SamplingProfiler
+        profiler = SamplingProfiler(interval=0.001)
+        client = TestClient(self._app(profiler, sample_rate=1.0))
+        
+        client.get("/busy/1")
+        client.get("/busy/2")
+        
+        assert profiler.summary()["GET /busy/{item_id}"]["requests"] == 2
+        collapsed = profiler.collapsed("GET /busy/{item_id}")
+        hot = [line for line in collapsed.splitlines() if "test_email_system:_profiled_busy_work" in line]
+        assert hot
+        stack, count = hot[0].rsplit(" ", 1)
+        assert int(count) > 10
+        assert "test_email_system:TestProfiling._app.<locals>.busy" in stack
+        assert profiler.collapsed().startswith("GET /busy/{item_id};")
+    
+    def test_requests_are_opt_in(self):
+        """With sampling off, only X-Profile plus a valid admin token profiles a request"""
+        from fastapi.testclient import TestClient
+        from config import settings
+        from profiling import SamplingProfiler
+        profiler = SamplingProfiler(interval=0.001)
+        client = TestClient(self._app(profiler, sample_rate=0.0))
+        original = settings.ADMIN_TOKEN
+        try:
+            settings.ADMIN_TOKEN = "secret"
+            client.get("/busy/1")
+            client.get("/busy/1", headers={"X-Profile": "1", "X-Admin-Token": "wrong"})
+            assert client.get("/busy/1", headers={"X-Profile": "1", "X-Admin-Token": "sécret".encode()}).status_code == 200
+            assert profiler.summary() == {}
+            client.get("/busy/1", headers={"X-Profile": "1", "X-Admin-Token": "secret"})
+        finally:
+            settings.ADMIN_TOKEN = original
+        
+        assert profiler.summary()["GET /busy/{item_id}"]["requests"] == 1
+    
+    def test_admin_download_endpoint(self):
+        """Collapsed stacks download from the admin-only debug endpoint"""
+        from collections import Counter
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from config import settings
+        from debug_routes import router
+        from profiling import request_profiler
+        request_profiler.reset()
+        request_profiler.profiles["GET /emails/read"] = Counter(
+            {"email_routes:read_emails;gmail_service:GmailService._strip_html": 42}
+        )
+        app = FastAPI()
+        app.include_router(router)
+        client = TestClient(app)
+        original = settings.ADMIN_TOKEN
+        try:
+            settings.ADMIN_TOKEN = "secret"
+            assert client.get("/debug/profiles/collapsed").status_code == 403
+            response = client.get("/debug/profiles/collapsed?route=GET /emails/read",
+                                  headers={"X-Admin-Token": "secret"})
+            summary = client.get("/debug/profiles", headers={"X-Admin-Token": "secret"}).json()
+            client.delete("/debug/profiles", headers={"X-Admin-Token": "secret"})
+        finally:
+            settings.ADMIN_TOKEN = original
+        
+        assert response.text == "email_routes:read_emails;gmail_service:GmailService._strip_html 42\n"
+        assert "attachment" in response.headers["content-disposition"]
+        assert summary["routes"]["GET /emails/read"]["samples"] == 42
+        assert request_profiler.summary() == {}
+
+
 class TestCommandMapping:
     """Test command-to-action mapping logic"""
     
@@ -0,0 +1,293 @@
+"""
+Request Tracing
+Context-propagated spans per request, trace IDs for responses and logs,
+a local NDJSON exporter and a buffer of recent traces for the debug
+waterfall
+"""
+import atexit
+import contextvars
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from config import settings
+from event_sink import EventSink
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_TRACE_ID = re.compile(r"^[A-Za-z0-9\-]{8,64}$")
+
+
+class Span:
+    """One timed stage of a request; children point at it through parent_id"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start", "end", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class Trace:
+    """All spans of one request, root first, in start order"""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.root = self.add_span(name, None, {})
+
+    def add_span(self, name: str, parent_id: Optional[str], attributes: Dict) -> Span:
+        span = Span(self, name, parent_id, attributes)
+        self.spans.append(span)  # list.append is atomic, so executor threads can add spans too
+        return span
+
+    @property
+    def name(self) -> str:
+        return self.root.name
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    def to_dict(self) -> Dict:
+        origin = self.root.start
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": [
+                {
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "offset_ms": round((span.start - origin) * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    "attributes": span.attributes,
+                    "error": span.error
+                }
+                for span in list(self.spans)
+            ]
+        }
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a stage as a child of the current span; a no-op outside a trace
+
+    The current span lives in a ContextVar, so it follows asyncio tasks
+    and executor calls made through contextvars.copy_context().
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.trace.add_span(name, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def waterfall(trace: Dict, width: int = 40) -> List[str]:
+    """Render an exported trace as indented text bars on a shared time axis"""
+    total = trace["duration_ms"] or 1.0
+    depth = {}
+    lines = []
+    for item in trace["spans"]:
+        depth[item["span_id"]] = depth.get(item["parent_id"], -1) + 1
+        start = int(item["offset_ms"] / total * width)
+        length = max(1, int(round(item["duration_ms"] / total * width)))
+        bar = " " * start + "#" * min(length, width - start)
+        label = "  " * depth[item["span_id"]] + item["name"] + (" !" if item["error"] else "")
+        lines.append(f"{label[:48]:<48} |{bar:<{width}}| {item['duration_ms']:>9.1f} ms")
+    return lines
+
+
+class FileExporter:
+    """Appends finished traces to rotated NDJSON segments (see event_sink)
+
+    export() only queues the trace, so the request path never serializes,
+    writes or rotates. A background thread drains the queue in batches and
+    flushes the sink once per batch. When the queue is full, traces are
+    dropped and counted rather than blocking the request.
+    """
+
+    _STOP = object()
+
+    def __init__(self, sink: EventSink, max_queue: int = 1000, batch_size: int = 256):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Started lazily (and again after a fork) so each worker has its own writer thread
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def flush(self):
+        """Block until every trace queued so far has been written"""
+        if self._thread is not None:
+            self.queue.join()
+
+    def stop(self):
+        """Write everything still queued, then stop the thread"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self.queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+        self._pid = None
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            traces = [trace for trace in batch if trace is not self._STOP]
+            try:
+                for trace in traces:
+                    self.sink.write(trace.to_dict())
+                if traces:
+                    self.sink.flush()
+            except OSError as e:
+                print(f"Error exporting traces: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if len(traces) < len(batch):
+                return
+
+
+class Tracer:
+    """Starts request traces and keeps the most recent ones for inspection"""
+
+    def __init__(self, keep: int = 200, exporter: Optional[FileExporter] = None):
+        self.recent: deque = deque(maxlen=keep)
+        self.exporter = exporter
+
+    @contextmanager
+    def start_trace(self, name: str, trace_id: Optional[str] = None):
+        trace = Trace(name, trace_id)
+        token = _current_span.set(trace.root)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            trace.root.end = time.perf_counter()
+            _current_span.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace: Trace):
+        self.recent.append(trace)
+        if self.exporter is not None:
+            self.exporter.export(trace)
+
+    def slowest(self, limit: int = 10, name: Optional[str] = None) -> List[Trace]:
+        traces = [trace for trace in list(self.recent) if name is None or trace.name == name]
+        return sorted(traces, key=lambda trace: trace.duration, reverse=True)[:limit]
+
+
+class TracingMiddleware:
+    """ASGI middleware that runs each HTTP request inside a trace
+
+    The root span is named "<METHOD> <route template>" once routing has
+    happened. The trace ID is returned in the X-Trace-Id header; a
+    well-formed incoming X-Trace-Id is reused so callers can correlate.
+    """
+
+    def __init__(self, app, request_tracer: "Tracer" = None):
+        self.app = app
+        self.tracer = request_tracer or tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or ()).get(b"x-trace-id", b"").decode("latin-1")
+        with self.tracer.start_trace(f"{scope['method']} {scope['path']}",
+                                     incoming if _TRACE_ID.match(incoming) else None) as trace:
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-trace-id", trace.trace_id.encode("latin-1"))
+                    ]
+                    trace.root.set(status=message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    trace.root.name = f"{scope['method']} {route.path}"
+
+
+def create_tracer() -> Tracer:
+    """Tracer keeping TRACE_BUFFER_SIZE traces, exporting to TRACE_LOG_DIR unless it is empty"""
+    exporter = None
+    if settings.TRACE_LOG_DIR:
+        exporter = FileExporter(EventSink(
+            settings.TRACE_LOG_DIR,
+            basename="traces",
+            max_bytes=settings.EVENT_LOG_MAX_BYTES,
+            max_age=settings.EVENT_LOG_MAX_AGE,
+            max_segments=settings.EVENT_LOG_MAX_SEGMENTS
+        ), max_queue=settings.TRACE_QUEUE_SIZE)
+    return Tracer(keep=settings.TRACE_BUFFER_SIZE, exporter=exporter)
+
+
+# Singleton instance
+tracer = create_tracer()
@@ -327,7 +327,7 @@ function ChatbotDashboard() {
           Authorization: `Bearer ${token}`,
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ count }),
+        body: JSON.stringify({ count, include_summaries: false }),
       });
 
       if (!response.ok) throw new Error('Failed to categorize inbox');